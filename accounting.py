@@ -0,0 +1,123 @@
+# Script responsible for calculating the memory footprint of sparse matrices
+# Array-backed formats (COO, CSR, CSC, DIA, BSR, ELL, SELL-C-σ and all PyTorch layouts) are measured exactly from the nbytes of their
+# buffers. LIL and DOK store every entry as Python objects, so their size is estimated from a random sample of rows
+# (LIL) or entries (DOK), instead of walking millions of objects
+import sys
+import numpy as np
+
+from ellpack import ELLPACK_FORMATS
+
+DEFAULT_SAMPLES = 10000  # Number of rows (LIL) or entries (DOK) sampled by the estimator
+CONFIDENCE_Z = 1.96  # z-value of the 95% confidence interval of the estimate
+SCIPY_BUFFERS = ['data', 'indices', 'indptr', 'row', 'col', 'offsets']
+SCIPY_INDEX_BUFFERS = ['indices', 'row', 'offsets', 'permutation']  # 'permutation' holds the index type of ELLPACK
+
+
+# Returns the tensors holding the data of a PyTorch tensor, the first one being its index tensor (None for dense tensors)
+def torch_buffers(tensor):
+    import torch
+    if tensor.layout == torch.strided:
+        return [None, tensor]
+    elif tensor.layout == torch.sparse_coo:
+        return [tensor._indices(), tensor._values()]
+    elif tensor.layout == torch.sparse_csr or tensor.layout == torch.sparse_bsr:
+        return [tensor.col_indices(), tensor.crow_indices(), tensor.values()]
+    return [tensor.row_indices(), tensor.ccol_indices(), tensor.values()]
+
+
+# Calculates the exact number of bytes in the buffers of an array-backed matrix, tensor or array. Returns None for
+# objects that are not backed by arrays (LIL, DOK, scalars)
+def buffer_nbytes(mtx):
+    if mtx is None:
+        return None
+    if type(mtx).__module__.startswith('torch'):
+        return sum(tensor.element_size() * tensor.numel() for tensor in torch_buffers(mtx) if tensor is not None)
+    if isinstance(mtx, np.ndarray):
+        return mtx.nbytes
+    if getattr(mtx, 'format', None) in ['coo', 'csr', 'csc', 'dia', 'bsr']:
+        return sum(getattr(mtx, name).nbytes for name in SCIPY_BUFFERS
+                   if isinstance(getattr(mtx, name, None), np.ndarray))
+    if getattr(mtx, 'format', None) in ELLPACK_FORMATS:
+        return mtx.nbytes
+    return None
+
+
+# Returns the size of a Python object referenced by a LIL or DOK matrix. Small Python integers are cached by the
+# interpreter and shared by all references, so they are counted as 0 bytes
+def object_size(obj):
+    if type(obj) is int and -5 <= obj <= 256:
+        return 0
+    return sys.getsizeof(obj)
+
+
+# Estimates the total of 'count' values from the values of a uniform random sample of them, returning the estimate and
+# the half-width of its 95% confidence interval (using the finite population correction)
+def estimate_total(sample, count):
+    sample = np.asarray(sample, dtype=np.float64)
+    if sample.size == 0:
+        return 0, 0
+    total = count * sample.mean()
+    if sample.size >= count or sample.size < 2:
+        return int(round(total)), 0
+    error = CONFIDENCE_Z * count * sample.std(ddof=1) / np.sqrt(sample.size) * np.sqrt(1 - sample.size / count)
+    return int(round(total)), int(np.ceil(error))
+
+
+# Estimates the size of a LIL matrix: the two object arrays holding a list of column indices and a list of values per
+# row are measured exactly, the lists and their elements from a sample of rows
+def lil_footprint(mtx, samples, rng):
+    num_rows = mtx.shape[0]
+    fixed = sys.getsizeof(mtx.rows) + sys.getsizeof(mtx.data)
+    rows = np.arange(num_rows) if samples >= num_rows else rng.choice(num_rows, samples, replace=False)
+    sample = []
+    for i in rows:
+        indices, values = mtx.rows[i], mtx.data[i]
+        sample.append(sys.getsizeof(indices) + sys.getsizeof(values) + sum(object_size(x) for x in indices)
+                      + sum(object_size(x) for x in values))
+    total, error = estimate_total(sample, num_rows)
+    index_dtype = type(mtx.rows[rows[0]][0]).__name__ if len(rows) and len(mtx.rows[rows[0]]) else "int"
+    return fixed + total, error, samples >= num_rows, index_dtype
+
+
+# Estimates the size of a DOK matrix: the hash table of the dictionary is measured exactly, the key tuples and values
+# it references from a sample of entries
+def dok_footprint(mtx, samples, rng):
+    entries = mtx._dict if hasattr(mtx, '_dict') else mtx
+    fixed = sys.getsizeof(entries)
+    count = len(entries)
+    if samples >= count:
+        items = list(dict.items(entries))
+    else:
+        keys = list(dict.keys(entries))
+        items = [(keys[i], dict.__getitem__(entries, keys[i])) for i in rng.choice(count, samples, replace=False)]
+    sample = [sys.getsizeof(key) + sum(object_size(x) for x in key) + object_size(value) for key, value in items]
+    total, error = estimate_total(sample, count)
+    index_dtype = type(items[0][0][0]).__name__ if items else "int"
+    return fixed + total, error, samples >= count, index_dtype
+
+
+# Calculates the memory footprint of a SciPy matrix or PyTorch tensor. Returns a dictionary with the size in bytes,
+# whether it is exact, the half-width of the 95% confidence interval of estimated sizes (LIL/DOK), and the dtypes of
+# the indices and values
+def footprint(mtx, samples=DEFAULT_SAMPLES, seed=0):
+    if type(mtx).__module__.startswith('torch'):
+        buffers = torch_buffers(mtx)
+        return {'bytes': buffer_nbytes(mtx), 'exact': True, 'error_bytes': 0,
+                'index_dtype': None if buffers[0] is None else str(buffers[0].dtype).replace("torch.", ""),
+                'value_dtype': str(buffers[-1].dtype).replace("torch.", "")}
+
+    size = buffer_nbytes(mtx)
+    if size is not None:
+        index_dtypes = [str(getattr(mtx, name).dtype) for name in SCIPY_INDEX_BUFFERS if hasattr(mtx, name)]
+        return {'bytes': size, 'exact': True, 'error_bytes': 0, 'index_dtype': index_dtypes[0],
+                'value_dtype': str(mtx.dtype)}
+
+    rng = np.random.default_rng(seed)
+    if mtx.format == "lil":
+        size, error, exact, index_dtype = lil_footprint(mtx, samples, rng)
+    elif mtx.format == "dok":
+        size, error, exact, index_dtype = dok_footprint(mtx, samples, rng)
+    else:
+        raise ValueError(f"unsupported format '{mtx.format}'")
+    return {'bytes': size, 'exact': exact, 'error_bytes': error, 'index_dtype': index_dtype,
+            'value_dtype': str(mtx.dtype)}
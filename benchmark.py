@@ -1,17 +1,562 @@
 # The script containing benchmarking functions and workflows
+import os
+import gc
 import time
+import tracemalloc
+import numpy as np
+import torch
 
+from scipy.sparse import csr_matrix, csc_matrix, bsr_matrix, issparse
+from scipy.sparse.linalg import norm as sparse_norm
 
-def benchmark(func, *args, reps=0):
+from functions import *
+from loader import torch_row
+from accounting import buffer_nbytes
+from ellpack import ELLPACK_FORMATS, ELLPACK_MODES
+from plans import PLAN_FORMATS, PLAN_MODES, mtx_plan, mtx_plan_execute
+from roofline import traffic, throughput, shares_values
+
+AUTORANGE_STEPS = [1, 2, 5]  # Loop counts tried by autorange are these values times powers of 10 (like timeit)
+BOOTSTRAP_RESAMPLES = 1000
+CI_CHECK_GROWTH = 1.25  # With a target CI, the CI is recalculated every time the number of samples grew by this factor
+CONVERSION_SOURCES = ['coo', 'csr']  # Formats from which the conversion to every other format is benchmarked
+VERIFY_PROBES = 2  # Number of random vectors multiplied with both sides of a result to fingerprint it
+
+
+# Forces evaluation of the lazy results of a benchmarked function, so they can't report near-zero times: PyTorch's COO
+# results may leave their duplicate entries to be summed later, so they are coalesced, and strided views (e.g.
+# transposes) are made contiguous. SciPy and NumPy results, and all other PyTorch results, are computed eagerly, so
+# they are returned as they are, without reading their values inside the timed region
+def materialize(result):
+    if result is None or not type(result).__module__.startswith('torch'):
+        return result
+    if result.layout == torch.sparse_coo:
+        return result.coalesce()._values()
+    if result.layout == torch.strided:
+        return result.contiguous()
+    return result.values()
+
+
+# Executes the function 'loops' times, timing all calls together with the nanosecond performance counter
+def time_loops(func, args, loops, force):
+    t1 = time.perf_counter_ns()
+    for _ in range(loops):
+        result = func(*args)
+        if force:
+            materialize(result)
+    t2 = time.perf_counter_ns()
+    return t2 - t1
+
+
+# Finds the number of loops needed for a single sample to last at least min_time seconds, like timeit's autorange
+def autorange(func, args, min_time, force):
+    multiplier = 1
+    while True:
+        for step in AUTORANGE_STEPS:
+            loops = step * multiplier
+            if time_loops(func, args, loops, force) >= min_time * 1e9:
+                return loops
+        multiplier *= 10
+
+
+# Calculates the bootstrap confidence interval of the median of the samples
+def bootstrap_median_ci(times, confidence=0.95, resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    samples = np.asarray(times)
+    rng = np.random.default_rng(seed)
+    medians = np.median(samples[rng.integers(0, samples.size, (resamples, samples.size))], axis=1)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(medians, [alpha, 1 - alpha])
+    return float(low), float(high)
+
+
+# Calculates the largest distance from the median to the bounds of its 95% CI, relative to the median
+def relative_ci(times):
+    median = float(np.median(times))
+    low, high = bootstrap_median_ci(times)
+    if median == 0:
+        return low, high, float("inf")
+    return low, high, max(median - low, high - median) / median
+
+
+# Benchmarks the function, returning a dictionary with the time per call of every sample (in seconds) and the number of
+# loops every sample consisted of. Before sampling, the function is executed 'warmup' times without being timed. With
+# min_time, every sample repeats the function until it lasts at least that many seconds, and with force, the result of
+# every call is materialized inside the timed region. The garbage collector is disabled while sampling, and the process
+# can optionally be pinned to a single CPU.
+# With target_ci, 'reps' is the minimum number of samples: sampling continues until the bootstrap 95% CI of the median
+# is within target_ci (a fraction, e.g. 0.05) of the median, or until 'budget' seconds have been spent on sampling
+def benchmark_samples(func, *args, reps=0, warmup=0, min_time=0.0, force=False, gc_disable=True, cpu=None,
+                      target_ci=None, budget=60.0):
     if reps <= 0:
         print("error: wrong benchmark reps value")
         return None
 
-    result = []
-    # Repeat benchmark 'reps' times
-    for _ in range(reps):
-        t1 = time.time()
-        func(*args)
-        t2 = time.time()
-        result.append(t2 - t1)
-    return result
+    affinity = None
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        affinity = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, {cpu})
+
+    gc_enabled = gc.isenabled()
+    gc.collect()
+    if gc_disable:
+        gc.disable()
+
+    try:
+        for _ in range(warmup):
+            result = func(*args)
+            if force:
+                materialize(result)
+            del result
+
+        loops = autorange(func, args, min_time, force) if min_time > 0 else 1
+
+        times = []
+        loop_counts = []
+        ci = None
+        budget_exhausted = False
+        next_check = reps
+        start = time.perf_counter()
+        # Repeat benchmark 'reps' times, or until the target CI is reached
+        while True:
+            times.append(time_loops(func, args, loops, force) / loops / 1e9)
+            loop_counts.append(loops)
+            if len(times) < next_check:
+                continue
+            if target_ci is None:
+                break
+
+            ci = relative_ci(times)
+            if ci[2] <= target_ci:
+                break
+            if time.perf_counter() - start >= budget:
+                budget_exhausted = True
+                break
+            next_check = max(len(times) + 1, int(len(times) * CI_CHECK_GROWTH))
+    finally:
+        if gc_enabled:
+            gc.enable()
+        if affinity is not None:
+            os.sched_setaffinity(0, affinity)
+
+    samples = {'time': times, 'loops': loop_counts, 'warmup': warmup, 'materialized': force, 'samples': len(times)}
+    if target_ci is not None:
+        samples.update({'ci_target': target_ci, 'ci_low': ci[0], 'ci_high': ci[1], 'ci_relative': ci[2],
+                        'budget_exhausted': budget_exhausted})
+    return samples
+
+
+# Benchmarks the function 'reps' times, returning only the time per call of every sample (in seconds)
+def benchmark(func, *args, reps=0, **timing):
+    samples = benchmark_samples(func, *args, reps=reps, **timing)
+    if samples is None:
+        return None
+    return samples['time']
+
+
+# Get row of the matrix as a dense vector, used as the vector for mvm
+def get_row_vector(mtx, idx):
+    if mtx.__module__.startswith('torch'):
+        return torch_row(mtx, idx)
+    return mtx.getrow(idx).toarray().ravel().astype(mtx.dtype, copy=False)
+
+
+# Prepare the allocation-free variant of the operation (see the *_inplace functions) outside the timed region: the
+# output vector or block of mvm and spmm, the transpose buffer of tps, and a copy of the matrix scaled in place by sm
+# (so the scaling does not change the matrix used by the other modes). The copy is scaled by the scalar and its inverse
+# on alternate calls, so its values stay the same across the warmup and the timed calls. Returns the function and its
+# arguments
+def get_inplace_operation(mode, args):
+    if mode == "sm":
+        scalar, mtx = args
+        copy = mtx.clone() if mtx.__module__.startswith('torch') else mtx.copy()
+        return mtx_scalar_multiplication_alternating, ({'undo': False}, scalar, copy)
+    elif mode == "tps":
+        return mtx_transposition_inplace, (args[0], transpose_buffer(args[0]))
+
+    mtx, operand = args
+    shape = mtx.shape[:1] + tuple(operand.shape[1:])
+    if mtx.__module__.startswith('torch'):
+        out = torch.empty(shape, dtype=torch.promote_types(mtx.dtype, operand.dtype))
+    else:
+        out = np.empty(shape, dtype=np.result_type(mtx.dtype, operand.dtype))
+    if mode == "mvm":
+        return mtx_matrix_vector_multiplication_inplace, (mtx, operand, out)
+    return mtx_dense_matrix_multiplication_inplace, (mtx, operand, out)
+
+
+# Get the type of the random operands of the matrix: the real type of its values (float64, or the lower precision they
+# were downcast to), so downcast matrices are not multiplied in float64
+def operand_dtype(mtx):
+    if mtx.__module__.startswith('torch'):
+        return np.float32 if mtx.dtype == torch.float32 else np.float64
+    if mtx.dtype.kind in "fc":
+        return np.finfo(mtx.dtype).dtype
+    return np.float64
+
+
+# Get dense vector of random values with the length of the columns of the matrix, used as the vector for tmvm
+def get_column_vector(mtx):
+    vec = np.random.rand(mtx.shape[0]).astype(operand_dtype(mtx))
+    if mtx.__module__.startswith('torch'):
+        return torch.from_numpy(vec)
+    return vec
+
+
+# Prepare the matrix for tmvm outside the timed region. PyTorch has no SpMV kernel for the transpose of a BSR matrix
+# (BSC), so it is transposed into BSR beforehand, and the transpose is multiplied with the vector instead
+def get_tmvm_operand(mtx):
+    if mtx.__module__.startswith('torch') and mtx.layout == torch.sparse_bsr:
+        blocksize = tuple(mtx.values().shape[1:])
+        return mtx.t().to_sparse_bsr(blocksize[::-1]), True
+    return mtx, False
+
+
+# Prepare the right-hand side matrix for mmm outside the timed region. If the shapes don't allow A @ B, B is transposed
+# (in the same format). PyTorch has no sparse-sparse kernel for BSR, so B is then multiplied as a dense matrix instead
+def get_mmm_operand(mtx_a, mtx_b):
+    transposed = mtx_a.shape[1] != mtx_b.shape[0]
+    if mtx_a.__module__.startswith('torch'):
+        operand = mtx_b
+        if transposed:
+            if mtx_b.layout == torch.sparse_coo:
+                operand = mtx_b.t().coalesce()
+            elif mtx_b.layout == torch.sparse_csr:
+                operand = mtx_b.t().to_sparse_csr()
+            elif mtx_b.layout == torch.sparse_csc:
+                operand = mtx_b.t().to_sparse_csc()
+            else:
+                operand = mtx_b.t()
+        if operand.layout == torch.sparse_bsr or operand.layout == torch.sparse_bsc:
+            return operand.to_dense(), transposed, True
+        return operand, transposed, False
+
+    if transposed:
+        return mtx_b.transpose().asformat(mtx_b.format), transposed, False
+    return mtx_b, transposed, False
+
+
+# Get dense block of k random right-hand side vectors for spmm
+def get_dense_block(mtx, k):
+    block = np.random.rand(mtx.shape[1], k).astype(operand_dtype(mtx))
+    if mtx.__module__.startswith('torch'):
+        return torch.from_numpy(block)
+    return block
+
+
+# Returns the operand (matrix, tensor or array) with its values upcast to float64 (complex128 for complex values).
+# Other arguments (scalars, formats, layouts) are returned unchanged
+def to_float64(operand):
+    if type(operand).__module__.startswith('torch'):
+        return operand.to(torch.complex128 if operand.is_complex() else torch.float64)
+    if isinstance(operand, dict) and 'chunks' in operand:
+        return dict(operand, chunks=[(start, end, to_float64(chunk)) for start, end, chunk in operand['chunks']])
+    if not hasattr(operand, 'dtype') or operand.dtype.kind not in "fc":
+        return operand
+    dtype = np.result_type(operand.dtype, np.float64)
+    if getattr(operand, 'format', None) in ELLPACK_FORMATS:
+        return operand.with_data(lambda data: data.astype(dtype))
+    return operand.astype(dtype)
+
+
+# Converts the result of an operation to a NumPy array or a SciPy CSR matrix, so the results of all formats and backends
+# can be compared
+def comparable(result):
+    if type(result).__module__.startswith('torch'):
+        shape = tuple(result.shape)
+        if result.layout == torch.strided:
+            return result.numpy()
+        elif result.layout == torch.sparse_coo:
+            result = result.coalesce()
+            indices = result.indices().numpy()
+            return csr_matrix((result.values().numpy(), (indices[0], indices[1])), shape=shape)
+        # The values of blocked layouts are blocks, unless the blocks were lost (PyTorch's BSR addition returns 1x1
+        # blocks as plain values), so the arrays are read directly instead of converted by PyTorch
+        values = result.values().numpy()
+        if result.layout in [torch.sparse_csr, torch.sparse_bsr]:
+            indptr, indices = result.crow_indices().numpy(), result.col_indices().numpy()
+            if values.ndim == 3:
+                return bsr_matrix((values, indices, indptr), shape=shape).tocsr()
+            return csr_matrix((values, indices, indptr), shape=shape)
+        indptr, indices = result.ccol_indices().numpy(), result.row_indices().numpy()
+        if values.ndim == 3:
+            return bsr_matrix((values.transpose(0, 2, 1), indices, indptr), shape=shape[::-1]).transpose().tocsr()
+        return csc_matrix((values, indices, indptr), shape=shape).tocsr()
+    if getattr(result, 'format', None) in ELLPACK_FORMATS:
+        # SciPy has no float16 matrices
+        return to_float64(result).tocsr()
+    if issparse(result):
+        return result.tocsr()
+    return np.asarray(result)
+
+
+# Calculates the error of the result relative to the reference result: the norm of their difference divided by the
+# norm of the reference (the Frobenius norm for matrices)
+def relative_error(result, reference):
+    result, reference = comparable(result), comparable(reference)
+    norm = sparse_norm if issparse(reference) else np.linalg.norm
+    difference = norm(result - reference) if issparse(result) == issparse(reference) \
+        else np.linalg.norm(np.asarray(result - reference))
+    reference_norm = norm(reference)
+    return float(difference / reference_norm) if reference_norm else float(difference)
+
+
+# Returns the matrix or tensor operand as a SciPy CSR matrix, or the dense tensor as a NumPy array, to run the operation
+# on in the verification. NumPy arrays and other arguments (scalars, formats, layouts) are returned unchanged
+def to_reference(operand):
+    if type(operand).__module__.startswith('torch') or issparse(operand) \
+            or getattr(operand, 'format', None) in ELLPACK_FORMATS:
+        return comparable(operand)
+    return operand
+
+
+# Prepares the operation on reference versions of matrices A and B. The other operands are converted with the function,
+# and the partition of the multithreaded kernel is replaced by the reference of matrix A
+def reference_operation(func, args, mtx_a, mtx_b, references, partition, convert):
+    if partition is not None:
+        return mtx_dense_matrix_multiplication, (references[0],) + tuple(convert(arg) for arg in args[1:])
+    substitutes = {id(mtx): ref for mtx, ref in zip((mtx_a, mtx_b), references) if mtx is not None}
+    return func, tuple(substitutes.get(id(arg), convert(arg)) for arg in args)
+
+
+# Calculates a fingerprint of the result that is cheap for any size: its shape, its number of non-zero values, its
+# Frobenius norm and R^T M R for a block R of random vectors (seeded, so equal results have equal fingerprints). Vectors
+# are fingerprinted as a single column
+def fingerprint(result, probes=VERIFY_PROBES, seed=0):
+    result = comparable(result)
+    if not issparse(result):
+        result = np.asarray(result).reshape(np.shape(result)[:1] + (-1,) if np.ndim(result) else (1, 1))
+    rng = np.random.default_rng(seed)
+    left, right = rng.random((result.shape[0], probes)), rng.random((result.shape[1], probes))
+    values = result.data if issparse(result) else result
+    norm = sparse_norm(result) if issparse(result) else np.linalg.norm(result)
+    return {'shape': list(result.shape), 'nnz': int(np.count_nonzero(values)), 'norm': float(norm),
+            'probe': left.T @ np.asarray(result @ right)}
+
+
+# Compares the fingerprints of a result and its reference result. Norms and probes may differ by the rounding errors of
+# the value type of the operation. Returns the verification results, with the reason if the results don't match
+def compare_fingerprints(result, reference, dtype):
+    tolerance = float(np.sqrt(np.finfo(dtype).eps))
+    tiny = np.finfo(np.float64).tiny
+    verification = {'passed': True, 'nnz': result['nnz'], 'reference_nnz': reference['nnz'], 'tolerance': tolerance,
+                    'norm_error': abs(result['norm'] - reference['norm']) / max(reference['norm'], tiny)}
+    if result['shape'] != reference['shape']:
+        verification['reason'] = f"shape {tuple(result['shape'])} differs from {tuple(reference['shape'])}"
+    else:
+        scale = max(float(np.abs(reference['probe']).max(initial=0)), tiny)
+        verification['probe_error'] = float(np.abs(result['probe'] - reference['probe']).max(initial=0)) / scale
+        if result['nnz'] != reference['nnz']:
+            verification['reason'] = f"{result['nnz']} non-zero values instead of {reference['nnz']}"
+        elif max(verification['norm_error'], verification['probe_error']) > tolerance:
+            verification['reason'] = (f"values differ (norm error {verification['norm_error']:.2e}, probe error "
+                                      f"{verification['probe_error']:.2e}, tolerance {tolerance:.2e})")
+    verification['passed'] = 'reason' not in verification
+    return verification
+
+
+# Reads the current resident set size and its high-water mark (in bytes) from /proc. Returns None if unavailable
+def read_rss():
+    try:
+        with open("/proc/self/status", "r") as status_file:
+            fields = dict(line.split(":", 1) for line in status_file if ":" in line)
+        return int(fields['VmRSS'].split()[0]) * 1024, int(fields['VmHWM'].split()[0]) * 1024
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+# Resets the RSS high-water mark of the process to its current RSS (Linux only). Returns whether the reset succeeded
+def reset_rss_peak():
+    try:
+        with open("/proc/self/clear_refs", "w") as refs_file:
+            refs_file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+# Executes the function once outside of the timed region, measuring its memory use: the peak of the allocations tracked
+# by tracemalloc (NumPy/SciPy), the growth of the RSS high-water mark (which also covers native and PyTorch allocations)
+# and the size of the output. The RSS peak is only exact if the high-water mark could be reset before the call,
+# otherwise it is the amount by which the call exceeded the earlier high-water mark of the process
+def measure_memory(func, *args):
+    gc.collect()
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    base_memory = tracemalloc.get_traced_memory()[0]
+    rss_exact = reset_rss_peak()
+    rss_before = read_rss()
+    try:
+        result = func(*args)
+        rss_after = read_rss()
+        peak = tracemalloc.get_traced_memory()[1] - base_memory
+        output_bytes = buffer_nbytes(result)
+        del result
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    memory = {'peak_bytes': peak, 'rss_peak_bytes': None, 'rss_peak_exact': rss_exact, 'output_bytes': output_bytes}
+    if rss_before is not None and rss_after is not None:
+        memory['rss_peak_bytes'] = max(0, rss_after[1] - rss_before[1])
+    return memory
+
+
+# Lists the numbers of threads of the strong-scaling benchmark up to 'threads': the powers of two below it and itself
+def scaling_threads(threads):
+    counts = [1]
+    while counts[-1] * 2 < threads:
+        counts.append(counts[-1] * 2)
+    return counts + [threads] if threads > 1 else counts
+
+
+# Lists the variants a mode is benchmarked with for the format, as keyword arguments for perform_benchmark. Returns no
+# variants if the format does not support the mode. With threads, mvm and spmm of the formats with a multithreaded
+# kernel are benchmarked once for every number of threads of the strong-scaling benchmark (see scaling_threads). With
+# reuse_pattern, add, sub and mmm of the formats with a symbolic/numeric split are benchmarked both as a one-shot
+# operation and as the numeric phase of a plan (see plans.py). With inplace, the modes with an allocation-free variant
+# on the backend are benchmarked both allocating and in place
+def mode_variants(mode, fmt, spmm_k, threads=None, reuse_pattern=False, inplace=False, backend="scipy"):
+    if fmt in ELLPACK_FORMATS and mode not in ELLPACK_MODES:
+        return []
+    if mode == "spmm":
+        variants = [{'k': k} for k in spmm_k]
+    elif mode == "conv":
+        variants = [{'source': source} for source in CONVERSION_SOURCES if source != fmt]
+    else:
+        variants = [{}]
+
+    if threads is not None and mode in ["mvm", "spmm"] and fmt in PARALLEL_FORMATS:
+        return [dict(variant, threads=t) for variant in variants for t in scaling_threads(threads)]
+    if reuse_pattern and mode in PLAN_MODES and fmt in PLAN_FORMATS:
+        variants += [dict(variant, reuse_pattern=True) for variant in variants]
+    if inplace and fmt in INPLACE_FORMATS[backend].get(mode, []):
+        variants += [dict(variant, inplace=True) for variant in variants]
+    return variants
+
+
+# Call benchmark function, providing it with the function to execute and its arguments. Operands are prepared before
+# the benchmark, so their allocation is not part of the measured time. The timing dictionary holds the settings of the
+# timing engine (see benchmark_samples). With memory, the memory use of the operation is measured in one extra call
+# after the timed samples (see measure_memory); it is always measured for mode conv. With threads, mvm and spmm run on
+# that many threads: SciPy matrices use the multithreaded kernel (see mtx_partition), PyTorch its own intra-op threads.
+# With reuse_pattern, the symbolic phase of add, sub and mmm is timed separately, and the numeric phase is benchmarked.
+# With inplace, the allocation-free variant of sm, mvm, spmm or tps is benchmarked (see get_inplace_operation).
+# With reference, a pair of float64 versions of matrices A and B, the error of the result relative to the result on the
+# reference matrices is calculated outside the timed region; the other operands are upcast to float64 for the reference.
+# With verify, a pair of SciPy CSR versions of matrices A and B, the operation is run once more on them (with the other
+# operands converted to SciPy and NumPy), and the fingerprints of both results are compared (see fingerprint).
+# With work, the counts of matrix_work of roofline.py, the operations and bytes moved of the operation are calculated,
+# along with its GFLOP/s and effective bandwidth (see traffic)
+def perform_benchmark(mode, mtx_a, mtx_b=None, idx=-1, scl=-1, reps=0, k=1, timing=None, source=None, memory=False,
+                      threads=None, reuse_pattern=False, inplace=False, reference=None, verify=None, work=None):
+    # Prepare results dictionary
+    benchmark_results = {'mode': mode}
+    timing = {} if timing is None else timing
+
+    # SciPy matrices are partitioned over the threads outside the timed region, PyTorch sets its number of threads
+    partition = None
+    torch_threads = None
+    if threads is not None:
+        benchmark_results['threads'] = threads
+        if mtx_a.__module__.startswith('torch'):
+            torch_threads = torch.get_num_threads()
+        else:
+            partition = mtx_partition(mtx_a, threads)
+
+    # Depending on the mode, select a different function and its arguments, populate results dictionary
+    if mode == "add":
+        func, args = mtx_addition, (mtx_a, mtx_b)
+    elif mode == "sub":
+        func, args = mtx_subtraction, (mtx_a, mtx_b)
+    elif mode == "sm":
+        func, args = mtx_scalar_multiplication, (scl, mtx_a)
+    elif mode == "mvm":
+        vec = get_row_vector(mtx_a, idx)
+        if partition is not None:
+            func, args = mtx_parallel_multiplication, (partition, vec)
+        else:
+            func, args = mtx_matrix_vector_multiplication, (mtx_a, vec)
+    elif mode == "tmvm":
+        vec = get_column_vector(mtx_a)
+        operand, pretransposed = get_tmvm_operand(mtx_a)
+        benchmark_results['pretransposed'] = pretransposed
+        if pretransposed:
+            func, args = mtx_matrix_vector_multiplication, (operand, vec)
+        else:
+            func, args = mtx_transposed_vector_multiplication, (operand, vec)
+    elif mode == "mmm":
+        operand, transposed, dense = get_mmm_operand(mtx_a, mtx_b)
+        benchmark_results['transposed_b'] = transposed
+        benchmark_results['dense_b'] = dense
+        func, args = mtx_matrix_matrix_multiplication, (mtx_a, operand)
+    elif mode == "spmm":
+        block = get_dense_block(mtx_a, k)
+        benchmark_results['k'] = k
+        if partition is not None:
+            func, args = mtx_parallel_multiplication, (partition, block)
+        else:
+            func, args = mtx_dense_matrix_multiplication, (mtx_a, block)
+    elif mode == "tps":
+        func, args = mtx_transposition, (mtx_a,)
+    elif mode == "conv":
+        # Time the conversion from the source format to the format of matrix A
+        src = mtx_conversion(mtx_a, source)
+        benchmark_results['source'] = source
+        func, args = mtx_conversion, (src, mtx_format(mtx_a), mtx_layout(mtx_a))
+        memory = True
+    else:
+        return benchmark_results
+
+    # Transposes that are views of the matrix don't move any data. The operand B of mmm may be transposed or dense
+    if work is not None:
+        view = mode == "tps" and not inplace and shares_values(func(*args), mtx_a)
+        benchmark_results.update(traffic(dict(benchmark_results, inplace=inplace and mode in INPLACE_MODES), mtx_a,
+                                         args[1] if mode == "mmm" else mtx_b, work, src if mode == "conv" else None,
+                                         view))
+
+    # The reference results are calculated with the operation itself, also when its plan or in-place variant is timed
+    operation, operation_args = func, args
+
+    # The symbolic phase returns a plan, which can't be materialized
+    if reuse_pattern and mode in PLAN_MODES:
+        benchmark_results['reuse_pattern'] = True
+        symbolic = benchmark_samples(mtx_plan, mode, *args, reps=reps, **dict(timing, force=False))
+        benchmark_results['symbolic_time'] = symbolic['time']
+        func, args = mtx_plan_execute, (mtx_plan(mode, *args),) + args
+
+    if inplace and mode in INPLACE_MODES:
+        benchmark_results['inplace'] = True
+        func, args = get_inplace_operation(mode, args)
+
+    # The result of the timed function is compared outside the timed region. In-place variants write their result to
+    # their last argument (the output, transpose buffer or scaled copy). Conversions don't change the values, so their
+    # results are only verified, not compared to the float64 result
+    if (reference is not None and mode != "conv") or verify is not None:
+        result = func(*args)
+        if benchmark_results.get('inplace'):
+            result = args[-1]
+        if reference is not None and mode != "conv":
+            reference_func, reference_args = reference_operation(operation, operation_args, mtx_a, mtx_b, reference,
+                                                                 partition, to_float64)
+            benchmark_results['relative_error'] = relative_error(result, reference_func(*reference_args))
+        if verify is not None:
+            reference_func, reference_args = reference_operation(operation, operation_args, mtx_a, mtx_b, verify,
+                                                                 partition, to_reference)
+            benchmark_results['verification'] = compare_fingerprints(
+                fingerprint(result), fingerprint(reference_func(*reference_args)), operand_dtype(mtx_a))
+        del result
+
+    if torch_threads is not None:
+        torch.set_num_threads(threads)
+    try:
+        benchmark_results.update(benchmark_samples(func, *args, reps=reps, **timing))
+        if memory:
+            benchmark_results.update(measure_memory(func, *args))
+        if work is not None:
+            benchmark_results.update(throughput(benchmark_results))
+    finally:
+        if torch_threads is not None:
+            torch.set_num_threads(torch_threads)
+    return benchmark_results
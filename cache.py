@@ -0,0 +1,188 @@
+# Script responsible for the on-disk binary cache of parsed MatrixMarket files
+# Parsed COO triplets are stored as raw .npy arrays, so later loads can memory-map them instead of re-parsing the text
+import os
+import json
+import time
+import shutil
+import hashlib
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get("MTX_CACHE_DIR", "./.mtx_cache")
+DEFAULT_CACHE_LIMIT = int(os.environ.get("MTX_CACHE_LIMIT", 4 * 1024 ** 3))  # Size cap in bytes (default: 4 GiB)
+
+INDEX_FILE = "index.json"
+META_FILE = "meta.json"
+FEATURES_DIR = "features"  # Structural features are stored per content hash in this subfolder, next to the entries
+ARRAY_NAMES = ["row", "col", "data"]
+HASH_CHUNK_SIZE = 16 * 1024 ** 2
+
+
+# Calculates the content hash of a file, reading it in chunks so large files don't need to fit in memory
+def file_digest(file_path):
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+# Calculates the content hash of the shape and COO arrays of a matrix that has no file, like the generated matrices of
+# the scale sweep
+def matrix_digest(matrix):
+    hasher = hashlib.blake2b(digest_size=20)
+    hasher.update(repr(matrix.shape).encode())
+    for array in (matrix.row, matrix.col, matrix.data):
+        hasher.update(np.ascontiguousarray(array).view(np.uint8))
+    return hasher.hexdigest()
+
+
+# Loads the index mapping source file paths to their last known mtime, size and content hash
+def load_index(cache_dir):
+    try:
+        with open(os.path.join(cache_dir, INDEX_FILE), "r") as read_file:
+            return json.load(read_file)
+    except (OSError, ValueError):
+        return {}
+
+
+# Adds the entries to the index. Other processes (e.g. the workers of sweep.py) may have updated the index since it was
+# loaded, so it is read again and merged right before writing, through a temporary file per process. Failing to write
+# the index is not fatal, as it only means the hash of the file is calculated again next time
+def save_index(cache_dir, entries):
+    temp_path = os.path.join(cache_dir, f"{INDEX_FILE}.{os.getpid()}.tmp")
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        index = load_index(cache_dir)
+        index.update(entries)
+        with open(temp_path, "w") as write_file:
+            json.dump(index, write_file, indent=4)
+        os.replace(temp_path, os.path.join(cache_dir, INDEX_FILE))
+    except OSError:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+# Returns the content hash of the file. The hash is only recalculated if the mtime or size of the file changed
+def cache_key(file_path, cache_dir=DEFAULT_CACHE_DIR):
+    real_path = os.path.realpath(file_path)
+    stat = os.stat(real_path)
+    index = load_index(cache_dir)
+
+    entry = index.get(real_path)
+    if entry is not None and entry['mtime_ns'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+        return entry['digest']
+
+    digest = file_digest(real_path)
+    save_index(cache_dir, {real_path: {'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'digest': digest}})
+    return digest
+
+
+# Calculates the size of a cache entry on disk
+def entry_size(entry_path):
+    size = 0
+    for name in os.listdir(entry_path):
+        size += os.path.getsize(os.path.join(entry_path, name))
+    return size
+
+
+# Returns all complete cache entries, sorted from least to most recently used
+def list_entries(cache_dir=DEFAULT_CACHE_DIR):
+    entries = []
+    if not os.path.isdir(cache_dir):
+        return entries
+
+    for name in os.listdir(cache_dir):
+        entry_path = os.path.join(cache_dir, name)
+        meta_path = os.path.join(entry_path, META_FILE)
+        if not os.path.isfile(meta_path):
+            continue
+        with open(meta_path, "r") as read_file:
+            meta = json.load(read_file)
+        meta['key'] = name
+        meta['bytes'] = entry_size(entry_path)
+        meta['last_used'] = os.path.getmtime(meta_path)
+        entries.append(meta)
+
+    entries.sort(key=lambda e: e['last_used'])
+    return entries
+
+
+# Removes least recently used entries until the total size of the cache is below the limit
+def evict(cache_dir=DEFAULT_CACHE_DIR, limit=DEFAULT_CACHE_LIMIT, keep=None):
+    entries = list_entries(cache_dir)
+    total = sum(e['bytes'] for e in entries)
+    for entry in entries:
+        if total <= limit:
+            break
+        if entry['key'] == keep:
+            continue
+        shutil.rmtree(os.path.join(cache_dir, entry['key']), ignore_errors=True)
+        total -= entry['bytes']
+
+
+# Loads the COO triplets of the file from the cache as memory-mapped arrays. Returns None on a cache miss
+def load_entry(file_path, cache_dir=DEFAULT_CACHE_DIR):
+    key = cache_key(file_path, cache_dir)
+    entry_path = os.path.join(cache_dir, key)
+    meta_path = os.path.join(entry_path, META_FILE)
+    if not os.path.isfile(meta_path):
+        return None
+
+    with open(meta_path, "r") as read_file:
+        meta = json.load(read_file)
+    arrays = [np.load(os.path.join(entry_path, f"{name}.npy"), mmap_mode='r') for name in ARRAY_NAMES]
+
+    # Touch metadata file, its mtime is used as the last access time for LRU eviction
+    os.utime(meta_path)
+    return arrays[0], arrays[1], arrays[2], tuple(meta['shape'])
+
+
+# Stores the COO triplets of the file in the cache, evicting old entries if the cache grows too large
+def store_entry(file_path, row, col, data, shape, cache_dir=DEFAULT_CACHE_DIR, limit=DEFAULT_CACHE_LIMIT):
+    key = cache_key(file_path, cache_dir)
+    entry_path = os.path.join(cache_dir, key)
+
+    # Write to temporary folder first, so an interrupted write never leaves a partial entry behind
+    temp_path = f"{entry_path}.{os.getpid()}.tmp"
+    os.makedirs(temp_path, exist_ok=True)
+    for name, array in zip(ARRAY_NAMES, [row, col, data]):
+        np.save(os.path.join(temp_path, f"{name}.npy"), np.ascontiguousarray(array))
+    meta = {'source': os.path.realpath(file_path), 'shape': list(shape), 'nnz': int(len(data)),
+            'dtype': str(data.dtype), 'created': time.time()}
+    with open(os.path.join(temp_path, META_FILE), "w") as write_file:
+        json.dump(meta, write_file, indent=4)
+
+    if os.path.isdir(entry_path):
+        shutil.rmtree(temp_path, ignore_errors=True)
+    else:
+        os.replace(temp_path, entry_path)
+
+    evict(cache_dir, limit, keep=key)
+
+
+# Loads the cached structural features of the file (see features.py). Returns None if they were not cached yet, or were
+# extracted by another version of the feature extractor
+def load_features(file_path, version, cache_dir=DEFAULT_CACHE_DIR):
+    key = cache_key(file_path, cache_dir)
+    try:
+        with open(os.path.join(cache_dir, FEATURES_DIR, f"{key}.json"), "r") as read_file:
+            features = json.load(read_file)
+    except (OSError, ValueError):
+        return None
+    return features if features.get('version') == version else None
+
+
+def store_features(file_path, features, cache_dir=DEFAULT_CACHE_DIR):
+    key = cache_key(file_path, cache_dir)
+    features_dir = os.path.join(cache_dir, FEATURES_DIR)
+    os.makedirs(features_dir, exist_ok=True)
+    temp_path = os.path.join(features_dir, f"{key}.{os.getpid()}.tmp")
+    with open(temp_path, "w") as write_file:
+        json.dump(features, write_file, indent=4)
+    os.replace(temp_path, os.path.join(features_dir, f"{key}.json"))
+
+
+# Removes all entries from the cache
+def clear(cache_dir=DEFAULT_CACHE_DIR):
+    if os.path.isdir(cache_dir):
+        shutil.rmtree(cache_dir)
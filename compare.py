@@ -0,0 +1,229 @@
+# Script detecting performance regressions between benchmark runs, e.g. before and after a SciPy or PyTorch upgrade
+# The first result set is the baseline, every other result set is compared against it. Results are matched by matrix,
+# format, benchmark and backend, and the samples of every matched pair are compared with a nonparametric test, so the
+# changes that are larger than the noise of the machine stand out. Exits with status 1 if a significant slowdown is
+# larger than the threshold, so it can be used in scripts
+import os
+import glob
+import json
+import argparse
+import numpy as np
+import matplotlib
+import matplotlib.pyplot as plt
+from matplotlib.colors import TwoSlopeNorm
+from scipy.stats import mannwhitneyu
+
+import store
+
+matplotlib.use('Agg')
+
+TESTS = ['mannwhitney', 'bootstrap']
+DEFAULT_ALPHA = 0.01
+DEFAULT_THRESHOLD = 0.05  # Slowdowns of more than 5% fail the comparison
+BOOTSTRAP_RESAMPLES = 2000
+MIN_SAMPLES = 3  # Pairs with fewer samples on either side are not tested
+MAX_ANNOTATED_CELLS = 400  # The speedups are only written in the cells of heatmaps up to this size
+
+
+# Get the name of a benchmark: the mode, including the number of right-hand side vectors for spmm, the source format
+# for conv, the number of threads, whether the pattern was reused or the output preallocated, and the value and index
+# types of downcast matrices
+def benchmark_key(res, tuning):
+    label = store.variant_label(res['mode'], res)
+    if tuning.get('value_dtype'):
+        label += f" ({tuning['value_dtype']})"
+    if tuning.get('index_dtype', "auto") != "auto":
+        label += f" ({tuning['index_dtype']} indices)"
+    return label
+
+
+# Loads a result set: a JSON file of main.py, a folder of JSON files of sweep.py, or a run in the results store as
+# STORE or STORE:RUN (see store.py). Returns the samples per cell, keyed by (matrix, format, benchmark, backend)
+def load_result_set(path):
+    store_path, run = path, "latest"
+    if ":" in path and store.is_store(path.split(":")[0]):
+        store_path, run = path.split(":", 1)
+    if store.is_store(store_path):
+        result_files = [(f"{store_path}:{run}", results) for results in store.load_run(store_path, run)]
+    else:
+        paths = glob.glob(os.path.join(path, "**", "*.json"), recursive=True) if os.path.isdir(path) else [path]
+        result_files = []
+        for result_path in sorted(paths):
+            with open(result_path, "r") as read_file:
+                results = json.load(read_file)
+            if isinstance(results, dict) and 'data' in results:
+                result_files.append((result_path, results))
+    if not result_files:
+        raise ValueError(f"no results found in {path}")
+
+    cells = {}
+    for result_path, results in result_files:
+        matrix = os.path.basename(results.get('matrix') or result_path)
+        backend = results.get('backend', "pytorch" if result_path.endswith("_pt.json") else "scipy")
+        for fmt in results['data']:
+            for res in fmt['results']:
+                key = (matrix, fmt['format'], benchmark_key(res, fmt.get('tuning', {})), backend)
+                cells[key] = np.asarray(res['time'], dtype=np.float64)
+    return cells
+
+
+# Calculates the bootstrap distribution of the ratio of the medians of the baseline and the new samples (the speedup)
+# by resampling both with replacement. Returns the two-sided p-value of the speedup being 1 and the confidence interval
+# of the speedup
+def bootstrap_speedup(baseline, new, alpha, resamples=BOOTSTRAP_RESAMPLES, seed=0):
+    rng = np.random.default_rng(seed)
+    baseline_medians = np.median(baseline[rng.integers(baseline.size, size=(resamples, baseline.size))], axis=1)
+    new_medians = np.median(new[rng.integers(new.size, size=(resamples, new.size))], axis=1)
+    speedups = baseline_medians / new_medians
+    # The resamples on the other side of 1 are counted with the observed ratio included, so the p-value is never 0
+    p_value = min(1.0, 2 * (min(np.sum(speedups <= 1), np.sum(speedups >= 1)) + 1) / (resamples + 1))
+    return p_value, tuple(np.quantile(speedups, [alpha / 2, 1 - alpha / 2]))
+
+
+# Adjusts the p-values of all tested pairs for the number of tests with the Benjamini-Hochberg procedure, so the
+# fraction of falsely significant changes stays below alpha when thousands of pairs are compared
+def adjust_p_values(p_values):
+    p_values = np.asarray(p_values, dtype=np.float64)
+    order = np.argsort(p_values)
+    ranked = p_values[order] * p_values.size / np.arange(1, p_values.size + 1)
+    adjusted = np.empty_like(p_values)
+    adjusted[order] = np.minimum(1.0, np.minimum.accumulate(ranked[::-1])[::-1])
+    return adjusted
+
+
+# Compares the samples of every cell present in both result sets. The effect size is the speedup (the median time of
+# the baseline over the median time of the new result set, below 1 for slowdowns) and Cliff's delta (the probability
+# that a new sample is slower than a baseline sample, minus the probability that it is faster)
+def compare_cells(baseline, new, test="mannwhitney", alpha=DEFAULT_ALPHA, seed=0):
+    rows = []
+    for key in sorted(baseline.keys() & new.keys()):
+        baseline_times, new_times = baseline[key], new[key]
+        row = {'matrix': key[0], 'format': key[1], 'benchmark': key[2], 'backend': key[3],
+               'baseline_median': float(np.median(baseline_times)), 'median': float(np.median(new_times)),
+               'baseline_samples': baseline_times.size, 'samples': new_times.size,
+               'p_value': np.nan, 'cliffs_delta': np.nan, 'interval': None}
+        row['speedup'] = row['baseline_median'] / row['median'] if row['median'] > 0 else np.nan
+        if min(baseline_times.size, new_times.size) >= MIN_SAMPLES:
+            u_statistic, p_value = mannwhitneyu(new_times, baseline_times, alternative='two-sided')
+            row['cliffs_delta'] = float(2 * u_statistic / (new_times.size * baseline_times.size) - 1)
+            row['p_value'] = float(p_value)
+            if test == "bootstrap":
+                row['p_value'], row['interval'] = bootstrap_speedup(baseline_times, new_times, alpha, seed=seed)
+        rows.append(row)
+
+    tested = [row for row in rows if not np.isnan(row['p_value'])]
+    for row, q_value in zip(tested, adjust_p_values([row['p_value'] for row in tested])):
+        row['q_value'] = float(q_value)
+    for row in rows:
+        row['significant'] = row.get('q_value', 1.0) < alpha
+    return rows
+
+
+# Plots the speedup of every compared result set over the baseline as a heatmap per result set, with a row per matrix,
+# format and backend, and a column per benchmark. Speedups are on a log scale, so a 2x slowdown is as dark as a 2x
+# speedup. Significant changes are marked with an asterisk
+def plot_heatmap(comparisons, output, output_format):
+    fig, axes = plt.subplots(1, len(comparisons), squeeze=False,
+                             figsize=(max(8, 10 * len(comparisons)), max(4, 0.3 * max(
+                                 len({(r['matrix'], r['format'], r['backend']) for r in rows})
+                                 for _, rows in comparisons) + 2)))
+    limit = max([abs(np.log2(row['speedup'])) for _, rows in comparisons for row in rows
+                 if np.isfinite(row['speedup']) and row['speedup'] > 0] + [0.1])
+    for ax, (name, rows) in zip(axes[0], comparisons):
+        row_labels = sorted({(r['matrix'], r['format'], r['backend']) for r in rows})
+        col_labels = sorted({r['benchmark'] for r in rows})
+        grid = np.full((len(row_labels), len(col_labels)), np.nan)
+        row_index = {label: i for i, label in enumerate(row_labels)}
+        col_index = {label: j for j, label in enumerate(col_labels)}
+        for r in rows:
+            grid[row_index[(r['matrix'], r['format'], r['backend'])], col_index[r['benchmark']]] = np.log2(r['speedup'])
+
+        image = ax.imshow(np.ma.masked_invalid(grid), cmap='RdBu', aspect='auto',
+                          norm=TwoSlopeNorm(0, -limit, limit))
+        if grid.size <= MAX_ANNOTATED_CELLS:
+            for r in rows:
+                i, j = row_index[(r['matrix'], r['format'], r['backend'])], col_index[r['benchmark']]
+                ax.text(j, i, f"{r['speedup']:.2f}{'*' if r['significant'] else ''}", ha='center', va='center',
+                        fontsize=7)
+        ax.set_xticks(range(len(col_labels)), col_labels, rotation=90)
+        ax.set_yticks(range(len(row_labels)),
+                      [f"{m} {f.upper()}{' (PyTorch)' if b == 'pytorch' else ''}" for m, f, b in row_labels])
+        ax.set_title(f"Speedup of {name}")
+        fig.colorbar(image, ax=ax, label="log2(speedup over baseline)")
+
+    plt.tight_layout()
+    plt.savefig(f"{output}/compare.{output_format}")
+    plt.close()
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(description="compares benchmark runs against a baseline run, reporting the significant speedups and slowdowns")
+
+        parser.add_argument("-f", "--files", nargs='+', required=True,
+                            help="result sets to compare, the first one being the baseline: JSON files of main.py, folders of sweep.py results, or a results store as STORE or STORE:RUN (required, at least two)")
+        parser.add_argument("--test", choices=TESTS, default="mannwhitney",
+                            help="test per matched result: the Mann-Whitney U test on the samples, or a bootstrap of the ratio of the medians (default: %(default)s)")
+        parser.add_argument("--alpha", type=float, default=DEFAULT_ALPHA,
+                            help="significance level, after adjusting for the number of compared results (default: %(default)s)")
+        parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                            help="exit with status 1 if a significant slowdown is larger than this fraction of the baseline median (default: %(default)s)")
+        parser.add_argument("--all", action="store_true", help="also list the changes that are not significant")
+        parser.add_argument("--seed", type=int, default=0, help="seed of the bootstrap resampling (default: %(default)s)")
+        parser.add_argument("-o", "--output", default="./plots",
+                            help="folder to save the speedup heatmap and compare.csv to (default: %(default)s)")
+        parser.add_argument("-fmt", "--format", default="pdf", help="output format of the heatmap (default: %(default)s)")
+
+        args = parser.parse_args()
+
+        if len(args.files) < 2:
+            parser.error("at least two result sets are needed to compare")
+        if not 0 < args.alpha < 1:
+            parser.error("value for --alpha must be between 0 and 1")
+
+        baseline = load_result_set(args.files[0])
+        comparisons = []
+        for path in args.files[1:]:
+            rows = compare_cells(baseline, load_result_set(path), args.test, args.alpha, args.seed)
+            if not rows:
+                print(f"warning: {path} has no results in common with the baseline {args.files[0]}")
+                continue
+            comparisons.append((path, rows))
+        if not comparisons:
+            parser.exit(1, "no results to compare\n")
+
+        # Rank the changes from the largest slowdown to the largest speedup, and style and print the table to stdout
+        ranked = sorted(((path, row) for path, rows in comparisons for row in rows if row['significant'] or args.all),
+                        key=lambda x: x[1]['speedup'])
+        table = [["Result Set", "Matrix", "Format", "Benchmark", "Backend", "Baseline Median (ms)", "Median (ms)",
+                  "Speedup", f"{(1 - args.alpha) * 100:g}% CI", "Cliff's Delta", "q-value", "Change"]]
+        for path, row in ranked:
+            interval = "-" if row['interval'] is None else f"{row['interval'][0]:.2f}-{row['interval'][1]:.2f}x"
+            change = "n/a" if not np.isfinite(row['p_value']) else (
+                "-" if not row['significant'] else "slowdown" if row['speedup'] < 1 else "speedup")
+            table.append([path, row['matrix'], row['format'].upper(), row['benchmark'], row['backend'],
+                          f"{row['baseline_median'] * 1000:.4g}", f"{row['median'] * 1000:.4g}",
+                          f"{row['speedup']:.3f}x", interval, f"{row['cliffs_delta']:.2f}",
+                          f"{row.get('q_value', np.nan):.2g}", change])
+        col_widths = [max(len(item) for item in col) for col in zip(*table)]
+        for table_row in table:
+            print("    ".join(f"{item.ljust(width)}" for item, width in zip(table_row, col_widths)))
+
+        compared = sum(len(rows) for _, rows in comparisons)
+        significant = [row for _, rows in comparisons for row in rows if row['significant']]
+        regressions = [row for row in significant if row['speedup'] < 1 / (1 + args.threshold)]
+        print(f"{compared} results compared: {sum(row['speedup'] > 1 for row in significant)} significant speedups, "
+              f"{sum(row['speedup'] < 1 for row in significant)} significant slowdowns, {len(regressions)} slowdowns "
+              f"of more than {args.threshold * 100:g}%")
+
+        cleaned_path = args.output.rstrip('/')
+        if not os.path.exists(cleaned_path):
+            os.makedirs(cleaned_path)
+        np.savetxt(f"{cleaned_path}/compare.csv", np.array(table), fmt='%s', delimiter=', ')
+        plot_heatmap(comparisons, cleaned_path, args.format)
+
+        if regressions:
+            exit(1)
+    except Exception as e:
+        print(e)
+        exit(1)
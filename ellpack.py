@@ -0,0 +1,173 @@
+# Script implementing the ELLPACK (ELL) and sliced ELLPACK (SELL-C-σ) formats on NumPy arrays
+# SELL-C-σ sorts the rows by their number of entries within windows of σ rows, and groups the sorted rows into chunks of
+# C rows. Every chunk is padded to the length of its longest row and stored column-major, so slot j of all C rows of a
+# chunk is contiguous. ELL is the special case of a single chunk containing all rows, without sorting
+import copy
+import numpy as np
+from scipy.sparse import csr_matrix, coo_matrix
+
+DEFAULT_CHUNK_HEIGHT = 8  # C, the number of rows per chunk
+DEFAULT_SIGMA = 256  # σ, the number of rows in a sorting window
+ELLPACK_FORMATS = ['ell', 'sell']
+ELLPACK_MODES = ['sm', 'mvm', 'tmvm', 'spmm', 'conv']  # Modes the ELLPACK formats support
+
+
+# Sums the weights per index, like np.bincount, but also for complex weights
+def bincount(indices, weights, length):
+    if np.iscomplexobj(weights):
+        return (np.bincount(indices, weights.real, length)
+                + 1j * np.bincount(indices, weights.imag, length))
+    return np.bincount(indices, weights, length)
+
+
+class SELLMatrix:
+    format = "sell"
+    __array_priority__ = 10.1  # Makes NumPy defer 'vector @ matrix' to __rmatmul__, like SciPy's sparse matrices
+
+    # Builds the SELL-C-σ layout of the matrix (converted to CSR first)
+    def __init__(self, matrix, chunk_height=DEFAULT_CHUNK_HEIGHT, sigma=DEFAULT_SIGMA):
+        csr = csr_matrix(matrix)
+        csr.sum_duplicates()
+        num_rows, num_cols = csr.shape
+        index_dtype = np.int32 if max(num_rows, num_cols) < 2 ** 31 else np.int64
+
+        self.shape = csr.shape
+        self.dtype = csr.dtype
+        self.nnz = csr.nnz
+        self.chunk_height = max(1, min(chunk_height, num_rows))
+        self.sigma = max(1, sigma)
+        num_chunks = -(-num_rows // self.chunk_height)
+        padded_rows = num_chunks * self.chunk_height
+
+        # Sort the rows from longest to shortest within every window of σ rows (stable, so equal rows keep their order)
+        lengths = np.diff(csr.indptr)
+        self.permutation = np.lexsort((-lengths, np.arange(num_rows) // self.sigma)).astype(index_dtype)
+        self.lengths = np.zeros(padded_rows, dtype=index_dtype)
+        self.lengths[:num_rows] = lengths[self.permutation]
+        widths = self.lengths.reshape(num_chunks, self.chunk_height).max(axis=1, initial=0)
+
+        # Chunks of the same width are stored together, so every group is a single (chunks, width, C) array
+        self.groups = []
+        starts = np.zeros(padded_rows, dtype=np.int64)
+        starts[:num_rows] = csr.indptr[:-1][self.permutation]
+        for width in np.unique(widths):
+            chunks = np.flatnonzero(widths == width).astype(index_dtype)
+            rows = chunks[:, None] * self.chunk_height + np.arange(self.chunk_height)
+            slots = np.arange(width)[None, :, None]
+            valid = slots < self.lengths[rows][:, None, :]
+            positions = np.where(valid, starts[rows][:, None, :] + slots, 0)
+            indices = np.where(valid, csr.indices[positions] if csr.nnz else 0, 0).astype(index_dtype)
+            data = np.where(valid, csr.data[positions] if csr.nnz else 0, 0).astype(self.dtype)
+            self.groups.append((chunks, indices, data))
+
+    # Applies the function to the data of every group, returning a matrix with the same structure and the new data
+    def with_data(self, func):
+        result = copy.copy(self)
+        result.groups = [(chunks, indices, func(data)) for chunks, indices, data in self.groups]
+        result.dtype = result.groups[0][2].dtype if result.groups else self.dtype
+        return result
+
+    # Returns a matrix with the same structure and data, with all index arrays cast to the index type
+    def with_index_dtype(self, index_dtype):
+        result = copy.copy(self)
+        result.permutation = self.permutation.astype(index_dtype)
+        result.lengths = self.lengths.astype(index_dtype)
+        result.groups = [(chunks.astype(index_dtype), indices.astype(index_dtype), data)
+                         for chunks, indices, data in self.groups]
+        return result
+
+    # Computes A @ x for a dense vector x, or A @ X for a dense block X of right-hand side vectors
+    def __matmul__(self, other):
+        other = np.asarray(other)
+        num_chunks = self.lengths.size // self.chunk_height
+        dtype = np.result_type(self.dtype, other.dtype)
+        result = np.zeros((num_chunks, self.chunk_height) + other.shape[1:], dtype=dtype)
+        # einsum reduces over the slots of the chunks without allocating the intermediate products
+        for chunks, indices, data in self.groups:
+            if other.ndim == 1:
+                result[chunks] = np.einsum('csr,csr->cr', data, other[indices])
+            else:
+                result[chunks] = np.einsum('csr,csrk->crk', data, other[indices])
+
+        # Undo the sorting of the rows
+        output = np.empty(self.shape[:1] + other.shape[1:], dtype=dtype)
+        output[self.permutation] = result.reshape((-1,) + other.shape[1:])[:self.shape[0]]
+        return output
+
+    # Computes A^T @ y (y @ A) for a dense vector y, scattering the products to the columns
+    def __rmatmul__(self, other):
+        other = np.asarray(other)
+        sorted_other = np.zeros(self.lengths.size, dtype=other.dtype)
+        sorted_other[:self.shape[0]] = other[self.permutation]
+        sorted_other = sorted_other.reshape(-1, self.chunk_height)
+        result = np.zeros(self.shape[1], dtype=np.result_type(self.dtype, other.dtype))
+        for chunks, indices, data in self.groups:
+            result += bincount(indices.ravel(), (data * sorted_other[chunks][:, None, :]).ravel(), self.shape[1])
+        return result
+
+    def __mul__(self, scalar):
+        return self.with_data(lambda data: data * scalar)
+
+    def __rmul__(self, scalar):
+        return self.with_data(lambda data: scalar * data)
+
+    def sum(self):
+        return sum(data.sum() for _, _, data in self.groups)
+
+    # Number of bytes of all arrays of the layout
+    @property
+    def nbytes(self):
+        return self.permutation.nbytes + self.lengths.nbytes + sum(
+            chunks.nbytes + indices.nbytes + data.nbytes for chunks, indices, data in self.groups)
+
+    # Number of stored values, padding included
+    @property
+    def stored(self):
+        return sum(data.size for _, _, data in self.groups)
+
+    # Returns the statistics of the layout: its parameters, padding and size
+    def stats(self):
+        return {'chunk_height': self.chunk_height, 'sigma': self.sigma, 'nnz': self.nnz, 'stored': self.stored,
+                'padding_overhead': (self.stored - self.nnz) / self.nnz if self.nnz else 0.0,
+                'bytes': self.nbytes}
+
+    # Converts the matrix to COO. float16 values are converted to float32
+    def tocoo(self):
+        rows, cols, values = [], [], []
+        for chunks, indices, data in self.groups:
+            sorted_rows = chunks.astype(np.int64)[:, None] * self.chunk_height + np.arange(self.chunk_height)
+            valid = np.arange(indices.shape[1])[None, :, None] < self.lengths[sorted_rows][:, None, :]
+            rows.append(np.broadcast_to(sorted_rows[:, None, :], indices.shape)[valid])
+            cols.append(indices[valid])
+            values.append(data[valid])
+        rows = np.concatenate(rows) if rows else np.zeros(0, dtype=np.int64)
+        cols = np.concatenate(cols) if cols else np.zeros(0, dtype=np.int64)
+        values = np.concatenate(values) if values else np.zeros(0, dtype=self.dtype)
+        if values.dtype == np.float16:
+            values = values.astype(np.float32)  # SciPy has no float16 matrices
+        return coo_matrix((values, (self.permutation[rows], cols)), shape=self.shape)
+
+    def tocsr(self):
+        return self.tocoo().tocsr()
+
+    def getrow(self, i):
+        return self.tocsr().getrow(i)
+
+    # Converts the matrix to one of SciPy's formats
+    def asformat(self, fmt):
+        return self.tocsr().asformat(fmt)
+
+
+class ELLMatrix(SELLMatrix):
+    format = "ell"
+
+    # ELL is SELL-C-σ with a single chunk containing all rows (C = number of rows), without sorting (σ = 1)
+    def __init__(self, matrix):
+        super().__init__(matrix, chunk_height=matrix.shape[0], sigma=1)
+
+
+# Converts the matrix to one of the ELLPACK formats. The SELL-C-σ parameters are ignored for ELL
+def to_ellpack(matrix, fmt, chunk_height=DEFAULT_CHUNK_HEIGHT, sigma=DEFAULT_SIGMA):
+    if fmt == "ell":
+        return ELLMatrix(matrix)
+    return SELLMatrix(matrix, chunk_height, sigma)
@@ -0,0 +1,97 @@
+# Script responsible for extracting structural features of sparse matrices, used to predict which format suits a matrix
+# All features are calculated with vectorized NumPy over the COO triplets, and cached per content hash of the file
+import numpy as np
+
+import cache
+from loader import read_mm_coo
+
+FEATURES_VERSION = 1  # Increase when the extracted features change, so cached features are extracted again
+BLOCK_SIZES = [2, 4, 8, 16]  # Block sizes for which the BSR block fill ratio is calculated
+DENSE_DIAGONAL_FILL = 0.5  # Diagonals filled for at least this fraction count as dense diagonals
+
+
+# Calculates the distribution of the number of non-zero entries per row
+def row_features(row, num_rows):
+    counts = np.bincount(row, minlength=num_rows)
+    mean = counts.mean() if num_rows else 0.0
+    p50, p90, p99 = np.percentile(counts, [50, 90, 99]) if num_rows else (0.0, 0.0, 0.0)
+    return {'min': int(counts.min()) if num_rows else 0, 'max': int(counts.max()) if num_rows else 0,
+            'mean': float(mean), 'std': float(counts.std()), 'cv': float(counts.std() / mean) if mean else 0.0,
+            'p50': float(p50), 'p90': float(p90), 'p99': float(p99),
+            'empty_rows': float(np.mean(counts == 0)) if num_rows else 0.0}
+
+
+# Calculates the number of occupied diagonals and how well they are filled, which determines the padding of DIA
+def diagonal_features(row, col, shape):
+    num_rows, num_cols = shape
+    offsets, counts = np.unique(col - row, return_counts=True)
+    lengths = np.minimum(num_rows + np.minimum(offsets, 0), num_cols - np.maximum(offsets, 0))
+    fill = counts / lengths
+    return {'count': int(offsets.size), 'fill': float(counts.sum() / lengths.sum()) if offsets.size else 0.0,
+            'dense_count': int(np.sum(fill >= DENSE_DIAGONAL_FILL)),
+            'stored_values': int(offsets.size * num_cols)}  # Number of values stored by the DIA layout, padding included
+
+
+# Calculates, per block size, the fraction of the values stored by BSR that are non-zero entries
+def block_features(row, col, shape, block_sizes=BLOCK_SIZES):
+    nnz = row.size
+    fills = {}
+    for size in block_sizes:
+        block_cols = -(-shape[1] // size)
+        num_blocks = np.unique((row // size) * block_cols + col // size).size
+        fills[str(size)] = float(nnz / (num_blocks * size * size)) if num_blocks else 0.0
+    return fills
+
+
+# Calculates the fraction of entries (i, j) for which entry (j, i) exists (pattern), and also has the same value
+# (numeric). Both are 0 for non-square matrices
+def symmetry_features(row, col, data, shape):
+    if shape[0] != shape[1] or row.size == 0:
+        return {'pattern': 0.0, 'numeric': 0.0}
+    keys = row * shape[1] + col
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+    transposed = col * shape[1] + row
+    positions = np.minimum(np.searchsorted(sorted_keys, transposed), sorted_keys.size - 1)
+    matched = sorted_keys[positions] == transposed
+    equal = matched & np.isclose(data, data[order[positions]])
+    return {'pattern': float(matched.mean()), 'numeric': float(equal.mean())}
+
+
+# Extracts the structural features of a SciPy sparse matrix
+def extract_features(matrix, block_sizes=BLOCK_SIZES):
+    # Converting through CSR sums duplicate entries and sorts the triplets
+    coo = matrix.tocsr().tocoo()
+    row = coo.row.astype(np.int64)
+    col = coo.col.astype(np.int64)
+    num_rows, num_cols = coo.shape
+    nnz = int(coo.nnz)
+    distance = np.abs(col - row)
+
+    return {
+        'version': FEATURES_VERSION,
+        'rows': num_rows,
+        'cols': num_cols,
+        'nnz': nnz,
+        'density': nnz / (num_rows * num_cols) if num_rows and num_cols else 0.0,
+        'row_nnz': row_features(row, num_rows),
+        'diagonals': diagonal_features(row, col, coo.shape),
+        'block_fill': block_features(row, col, coo.shape, block_sizes),
+        'bandwidth': int(distance.max(initial=0)),
+        'mean_distance': float(distance.mean()) if nnz else 0.0,
+        'symmetry': symmetry_features(row, col, coo.data, coo.shape)
+    }
+
+
+# Returns the structural features of a MatrixMarket file, extracting them only if they are not cached yet
+def matrix_features(file_path, use_cache=True, cache_dir=cache.DEFAULT_CACHE_DIR, workers=1):
+    if use_cache:
+        features = cache.load_features(file_path, FEATURES_VERSION, cache_dir)
+        if features is not None:
+            return features
+
+    features = extract_features(read_mm_coo(file_path, use_cache, cache_dir, workers))
+
+    if use_cache:
+        cache.store_features(file_path, features, cache_dir)
+    return features
@@ -1,15 +1,25 @@
 # Script containing functions performing singular operations on provided sparse matrices. Time used for running the function is measured by the benchmark
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import torch.sparse
+from scipy.sparse import csr_matrix, bsr_matrix, _sparsetools
 
+from ellpack import ELLPACK_FORMATS, to_ellpack
 
+
+# PyTorch has no CSC addition kernel, so CSC tensors are added as their transposes (CSR views) and transposed back
 def mtx_addition(mtx_a, mtx_b):
     if mtx_a.__module__.startswith('torch'):
+        if mtx_a.layout == torch.sparse_csc:
+            return torch.add(mtx_a.t(), mtx_b.t()).t()
         return torch.add(mtx_a, mtx_b)
     return mtx_a + mtx_b
 
 
 def mtx_subtraction(mtx_a, mtx_b):
     if mtx_a.__module__.startswith('torch'):
+        if mtx_a.layout == torch.sparse_csc:
+            return torch.add(mtx_a.t(), mtx_b.t(), alpha=-1).t()
         return torch.add(mtx_a, mtx_b, alpha=-1)
     return mtx_a - mtx_b
 
@@ -18,19 +28,260 @@ def mtx_scalar_multiplication(scalar, mtx):
     return scalar * mtx
 
 
+INPLACE_MODES = ['sm', 'mvm', 'spmm', 'tps']
+# Formats per backend and mode with an allocation-free variant (see the *_inplace functions below)
+INPLACE_FORMATS = {
+    'scipy': {'sm': ['coo', 'csr', 'csc', 'dia', 'bsr'], 'mvm': ['coo', 'csr', 'csc', 'dia', 'bsr'],
+              'spmm': ['csr', 'csc', 'bsr'], 'tps': ['coo', 'csr', 'csc', 'bsr']},
+    'pytorch': {'sm': ['coo', 'csr', 'csc', 'bsr'], 'mvm': ['coo', 'csr', 'csc', 'bsr'],
+                'spmm': ['coo', 'csr', 'csc', 'bsr']}
+}
+
+
+# Multiplies the values of the matrix with the scalar in place, without allocating a new matrix
+def mtx_scalar_multiplication_inplace(scalar, mtx):
+    if mtx.__module__.startswith('torch'):
+        return mtx.mul_(scalar)
+    mtx.data *= scalar
+    return mtx
+
+
+# Divides the values of the matrix by the scalar in place, undoing mtx_scalar_multiplication_inplace. Floating-point
+# values are multiplied with the inverse, which is as fast as the multiplication, integer values are divided exactly
+def mtx_scalar_division_inplace(scalar, mtx):
+    if mtx.__module__.startswith('torch'):
+        if mtx.is_floating_point() or mtx.is_complex():
+            return mtx.mul_(1 / scalar)
+        (mtx._values() if mtx.layout == torch.sparse_coo else mtx.values()).div_(scalar, rounding_mode='floor')
+        return mtx
+    if mtx.dtype.kind in "fc":
+        mtx.data *= 1 / scalar
+    else:
+        mtx.data //= scalar
+    return mtx
+
+
+# Scales the values of the matrix in place like mtx_scalar_multiplication_inplace, but undoes the previous call on every
+# other call (see mtx_scalar_division_inplace), so the values don't compound towards overflow or denormals over the
+# calls of a benchmark. The state holds whether the next call undoes the previous one
+def mtx_scalar_multiplication_alternating(state, scalar, mtx):
+    undo = state['undo'] and scalar != 0
+    state['undo'] = not state['undo']
+    if undo:
+        return mtx_scalar_division_inplace(scalar, mtx)
+    return mtx_scalar_multiplication_inplace(scalar, mtx)
+
+
+# Computes A @ x for a dense vector x
 def mtx_matrix_vector_multiplication(mtx, vec):
     if mtx.__module__.startswith('torch'):
-        return torch.matmul(mtx, vec)
-    return mtx.multiply(vec)
+        return torch.mv(mtx, vec)
+    return mtx @ vec
+
+
+PARALLEL_FORMATS = ['csr', 'bsr']  # Formats with a multithreaded SpMV/SpMM (see mtx_partition)
 
+# Persistent thread pools per number of threads, so the threads are not started again for every call
+thread_pools = {}
 
+
+# Get the persistent thread pool with this number of threads, creating it on first use
+def thread_pool(threads):
+    if threads not in thread_pools:
+        thread_pools[threads] = ThreadPoolExecutor(max_workers=threads)
+    return thread_pools[threads]
+
+
+# Splits the rows of a CSR matrix (block rows of a BSR matrix) into at most 'parts' ranges of consecutive rows holding
+# about the same number of non-zero entries (blocks), using the prefix sums in indptr instead of equal row counts.
+# Returns the boundaries of the ranges
+def balanced_partition(indptr, parts):
+    bounds = np.searchsorted(indptr, np.linspace(0, indptr[-1], parts + 1))
+    bounds[0], bounds[-1] = 0, indptr.size - 1
+    return np.unique(bounds)
+
+
+# Prepares the multithreaded SpMV/SpMM of a CSR or BSR matrix on 'threads' threads. The rows are split into nnz-balanced
+# ranges (see balanced_partition), and every range is wrapped in a matrix sharing the arrays of the matrix, so no entries
+# are copied. Returns the (first row, last row, matrix) of every range and the shape of the matrix
+def mtx_partition(mtx, threads):
+    height = mtx.blocksize[0] if mtx.format == "bsr" else 1
+    bounds = balanced_partition(mtx.indptr, threads)
+    chunks = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        first, last = mtx.indptr[start], mtx.indptr[end]
+        arrays = (mtx.data[first:last], mtx.indices[first:last], mtx.indptr[start:end + 1] - first)
+        shape = ((end - start) * height, mtx.shape[1])
+        chunk = bsr_matrix(arrays, shape=shape) if mtx.format == "bsr" else csr_matrix(arrays, shape=shape)
+        chunks.append((int(start) * height, int(end) * height, chunk))
+    return {'threads': threads, 'shape': mtx.shape, 'chunks': chunks}
+
+
+# Computes A @ x for a dense vector x, or A @ X for a dense block X, on the thread pool of the partition (see
+# mtx_partition). Every thread zeroes its own slice of the preallocated output and multiplies its range of rows into it
+# with SciPy's compiled kernel (see mtx_matrix_vector_multiplication_inplace), which releases the GIL, so no temporary
+# result is allocated and copied per range
+def mtx_parallel_multiplication(partition, other):
+    other = np.ascontiguousarray(other)
+    output = np.empty(partition['shape'][:1] + other.shape[1:], dtype=np.result_type(
+        partition['chunks'][0][2].dtype if partition['chunks'] else np.float64, other.dtype))
+
+    def multiply(chunk):
+        start, end, matrix = chunk
+        if other.ndim == 1:
+            mtx_matrix_vector_multiplication_inplace(matrix, other, output[start:end])
+        else:
+            mtx_dense_matrix_multiplication_inplace(matrix, other, output[start:end])
+
+    list(thread_pool(partition['threads']).map(multiply, partition['chunks']))
+    return output
+
+
+# Computes A @ x for a dense vector x into the preallocated output vector, with SciPy's compiled kernel of the format
+# (which adds to the output, so it is zeroed first). PyTorch has no SpMV with an output for COO, so COO tensors are
+# multiplied as an n x 1 block instead
+def mtx_matrix_vector_multiplication_inplace(mtx, vec, out):
+    if mtx.__module__.startswith('torch'):
+        if mtx.layout == torch.sparse_coo:
+            return torch.mm(mtx, vec.unsqueeze(1), out=out.unsqueeze(1)).squeeze(1)
+        return torch.mv(mtx, vec, out=out)
+    num_rows, num_cols = mtx.shape
+    out.fill(0)
+    if mtx.format == "csr" or mtx.format == "csc":
+        getattr(_sparsetools, mtx.format + "_matvec")(num_rows, num_cols, mtx.indptr, mtx.indices, mtx.data, vec, out)
+    elif mtx.format == "bsr":
+        height, width = mtx.blocksize
+        _sparsetools.bsr_matvec(num_rows // height, num_cols // width, height, width, mtx.indptr, mtx.indices,
+                                mtx.data.ravel(), vec, out)
+    elif mtx.format == "coo":
+        _sparsetools.coo_matvec(mtx.nnz, mtx.row, mtx.col, mtx.data, vec, out)
+    elif mtx.format == "dia":
+        _sparsetools.dia_matvec(num_rows, num_cols, len(mtx.offsets), mtx.data.shape[1], mtx.offsets, mtx.data, vec,
+                                out)
+    return out
+
+
+# Computes A @ X for a dense block X of k right-hand side vectors into the preallocated output block, like
+# mtx_matrix_vector_multiplication_inplace. Like SciPy, a single vector is multiplied with the faster SpMV kernel
+def mtx_dense_matrix_multiplication_inplace(mtx, block, out):
+    if mtx.__module__.startswith('torch'):
+        return torch.matmul(mtx, block, out=out)
+    if block.shape[1] == 1:
+        mtx_matrix_vector_multiplication_inplace(mtx, block.ravel(), out.ravel())
+        return out
+    num_rows, num_cols = mtx.shape
+    out.fill(0)
+    if mtx.format == "csr" or mtx.format == "csc":
+        getattr(_sparsetools, mtx.format + "_matvecs")(num_rows, num_cols, block.shape[1], mtx.indptr, mtx.indices,
+                                                        mtx.data, block.ravel(), out.ravel())
+    elif mtx.format == "bsr":
+        height, width = mtx.blocksize
+        _sparsetools.bsr_matvecs(num_rows // height, num_cols // width, block.shape[1], height, width, mtx.indptr,
+                                 mtx.indices, mtx.data.ravel(), block.ravel(), out.ravel())
+    return out
+
+
+# Computes A^T @ y for a dense vector y, without transposing the matrix first
+def mtx_transposed_vector_multiplication(mtx, vec):
+    if mtx.__module__.startswith('torch'):
+        return torch.mv(mtx.t(), vec)
+    return vec @ mtx
+
+
+# Computes A @ B for a sparse matrix B (or a dense one, where PyTorch lacks a sparse kernel for the layout)
 def mtx_matrix_matrix_multiplication(mtx_a, mtx_b):
     if mtx_a.__module__.startswith('torch'):
-        return torch.matmul(mtx_a, mtx_b.t().to_dense())
-    return mtx_a.multiply(mtx_b)
+        return torch.matmul(mtx_a, mtx_b)
+    return mtx_a @ mtx_b
+
+
+# Computes A @ X for a dense block X of k right-hand side vectors
+def mtx_dense_matrix_multiplication(mtx, block):
+    if mtx.__module__.startswith('torch'):
+        return torch.matmul(mtx, block)
+    return mtx @ block
 
 
 def mtx_transposition(mtx):
     if mtx.__module__.startswith('torch'):
         return mtx.t()
     return mtx.transpose()
+
+
+# Allocates the buffer mtx_transposition_inplace writes the transpose of the matrix to: a matrix of the same format with
+# the transposed shape and the same number of entries
+def transpose_buffer(mtx):
+    num_rows, num_cols = mtx.shape
+    if mtx.format == "coo":
+        return type(mtx)((np.zeros_like(mtx.data), (np.zeros_like(mtx.col), np.zeros_like(mtx.row))),
+                         shape=(num_cols, num_rows))
+    if mtx.format == "bsr":
+        data = np.zeros((mtx.data.shape[0], mtx.blocksize[1], mtx.blocksize[0]), dtype=mtx.data.dtype)
+        indptr = np.zeros(num_cols // mtx.blocksize[1] + 1, dtype=mtx.indptr.dtype)
+    else:
+        # The compressed axis of the transpose (rows for CSR, columns for CSC) has the length of the other axis
+        data = np.zeros_like(mtx.data)
+        indptr = np.zeros((num_cols if mtx.format == "csr" else num_rows) + 1, dtype=mtx.indptr.dtype)
+    indptr[-1] = mtx.indices.size  # Otherwise SciPy prunes the indices and data to the (empty) rows
+    return type(mtx)((data, np.zeros_like(mtx.indices), indptr), shape=(num_cols, num_rows))
+
+
+# Materializes the transpose of the matrix in the same format into the preallocated buffer (see transpose_buffer),
+# instead of allocating new arrays. CSR and CSC are transposed with SciPy's compressed transpose kernel, which turns
+# the CSR arrays of A into the CSR arrays of A^T (the CSC arrays of A are the CSR arrays of A^T)
+def mtx_transposition_inplace(mtx, out):
+    num_rows, num_cols = mtx.shape
+    if mtx.format == "coo":
+        np.copyto(out.row, mtx.col)
+        np.copyto(out.col, mtx.row)
+        np.copyto(out.data, mtx.data)
+    elif mtx.format == "bsr":
+        height, width = mtx.blocksize
+        _sparsetools.bsr_transpose(num_rows // height, num_cols // width, height, width, mtx.indptr, mtx.indices,
+                                   mtx.data.ravel(), out.indptr, out.indices, out.data.ravel())
+    else:
+        compressed_rows, compressed_cols = (num_rows, num_cols) if mtx.format == "csr" else (num_cols, num_rows)
+        _sparsetools.csr_tocsc(compressed_rows, compressed_cols, mtx.indptr, mtx.indices, mtx.data, out.indptr,
+                               out.indices, out.data)
+    return out
+
+
+# Get the name of the format of the matrix
+def mtx_format(mtx):
+    if mtx.__module__.startswith('torch'):
+        layouts = {torch.sparse_coo: "coo", torch.sparse_csr: "csr", torch.sparse_csc: "csc", torch.sparse_bsr: "bsr"}
+        return layouts.get(mtx.layout)
+    return mtx.format
+
+
+# Get the layout parameters of the matrix: the block size of a BSR matrix, or the chunk height and sorting window of a
+# SELL-C-σ matrix (None for other formats)
+def mtx_layout(mtx):
+    if mtx.__module__.startswith('torch'):
+        return tuple(mtx.values().shape[1:]) if mtx.layout == torch.sparse_bsr else None
+    if mtx.format == "bsr":
+        return mtx.blocksize
+    elif mtx.format == "sell":
+        return mtx.chunk_height, mtx.sigma
+    return None
+
+
+# Converts the matrix to the provided format. BSR and SELL-C-σ matrices are created with the provided layout parameters
+# (see mtx_layout)
+def mtx_conversion(mtx, fmt, layout=None):
+    if mtx.__module__.startswith('torch'):
+        # PyTorch can't convert BSR to CSR or CSC directly, so those conversions go through COO
+        if mtx.layout == torch.sparse_bsr and fmt in ["csr", "csc"]:
+            mtx = mtx.to_sparse_coo()
+        if fmt == "coo":
+            return mtx.to_sparse_coo()
+        elif fmt == "csr":
+            return mtx.to_sparse_csr()
+        elif fmt == "csc":
+            return mtx.to_sparse_csc()
+        return mtx.to_sparse_bsr(layout)
+    if fmt in ELLPACK_FORMATS:
+        return to_ellpack(mtx, fmt, *(layout or ()))
+    if fmt == "bsr" and layout is not None:
+        return mtx.tobsr(blocksize=layout)
+    return mtx.asformat(fmt)
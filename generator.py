@@ -0,0 +1,249 @@
+# Script generating synthetic sparse matrices of parametric families, for sweeps over the size and structure of matrices
+# Every family picks the number of entries per row first, after which the columns of a row are spread over its range
+# with one entry per equally wide bucket (stratified sampling). The entries of a row are then distinct and sorted
+# without sorting or deduplicating the whole matrix, so the generation is a few vectorized passes over the entries.
+# The generated matrices are deterministic given the seed
+import os
+import re
+import time
+import argparse
+import numpy as np
+from scipy.io import mmwrite
+from scipy.sparse import coo_matrix
+
+import cache
+
+FAMILIES = ['banded', 'block', 'powerlaw', 'uniform']
+DEFAULT_NNZ_PER_ROW = 8
+DEFAULT_BLOCK_SIZE = 4
+DEFAULT_BLOCK_DENSITY = 0.5
+DEFAULT_EXPONENT = 2.5  # Exponent of the power-law distribution of the entries per row; lower is more skewed
+DEFAULT_SCALE_SIZES = [1000, 10000, 100000, 1000000]
+GENERATE_CHUNK = 2 ** 22  # Number of entries generated at once
+
+
+# Returns the index type SciPy would pick for a matrix with these dimensions and entries
+def index_dtype(*sizes):
+    return np.int32 if max(sizes) < 2 ** 31 else np.int64
+
+
+# Spreads counts[i] distinct positions over the range [0, width[i]) of every group i: the range is split into counts[i]
+# equally wide buckets, and a position is drawn uniformly from every bucket. Returns the group and position of every
+# entry (of the index type), with the positions of a group in ascending order. The entries are generated in chunks of
+# groups, so the temporary arrays stay small next to the output. Counts must not be larger than the widths
+def spread(counts, width, rng, dtype=np.int64, chunk_entries=GENERATE_CHUNK):
+    counts = np.asarray(counts, dtype=np.int64)
+    widths = np.broadcast_to(np.asarray(width, dtype=np.int64), counts.shape)
+    ends = np.cumsum(counts)
+    groups = np.empty(int(ends[-1]) if counts.size else 0, dtype=dtype)
+    positions = np.empty_like(groups)
+
+    first = 0
+    while first < counts.size:
+        # The chunk holds whole groups, and at least one
+        last = max(first + 1, int(np.searchsorted(ends, (ends[first] - counts[first]) + chunk_entries, side='right')))
+        start, end = int(ends[first] - counts[first]), int(ends[last - 1])
+        chunk_counts = counts[first:last]
+        chunk_groups = np.repeat(np.arange(first, last, dtype=np.int64), chunk_counts)
+        slot = np.arange(start, end, dtype=np.int64) - (ends[chunk_groups] - counts[chunk_groups])
+        group_counts, group_widths = counts[chunk_groups], widths[chunk_groups]
+        low = slot * group_widths // group_counts
+        high = (slot + 1) * group_widths // group_counts
+        groups[start:end] = chunk_groups
+        positions[start:end] = low + (rng.random(end - start) * (high - low)).astype(np.int64)
+        first = last
+    return groups, positions
+
+
+# Generates a band of 2 * bandwidth + 1 diagonals around the main diagonal, of which nnz_per_row diagonals are drawn per
+# row (all of them if nnz_per_row is at least the width of the band, which gives a matrix of full diagonals). The
+# positions in the band are turned into columns in chunks, dropping the entries outside the matrix in place
+def banded(num_rows, num_cols, nnz_per_row, bandwidth, rng, dtype):
+    band = 2 * bandwidth + 1
+    rows, cols = spread(np.full(num_rows, min(nnz_per_row, band)), band, rng, index_dtype(num_rows, band))
+    count = 0
+    for start in range(0, rows.size, GENERATE_CHUNK):
+        chunk_rows = rows[start:start + GENERATE_CHUNK].astype(np.int64)
+        chunk_cols = cols[start:start + GENERATE_CHUNK] + chunk_rows - bandwidth
+        inside = (chunk_cols >= 0) & (chunk_cols < num_cols)
+        kept = int(np.count_nonzero(inside))
+        rows[count:count + kept] = chunk_rows[inside]
+        cols[count:count + kept] = chunk_cols[inside]
+        count += kept
+    return rows[:count].astype(dtype, copy=False), cols[:count].astype(dtype, copy=False)
+
+
+# Generates blocks of block_size x block_size entries: every block row holds enough blocks for nnz_per_row entries per
+# row, and every entry of a block is stored with probability block_density (1 gives completely filled blocks). The
+# blocks are expanded into entries in chunks of blocks
+def block(num_rows, num_cols, nnz_per_row, block_size, block_density, rng, dtype):
+    block_rows = -(-num_rows // block_size)
+    block_cols = -(-num_cols // block_size)
+    blocks_per_row = min(block_cols, max(1, int(round(nnz_per_row / (block_size * block_density)))))
+    block_row, block_col = spread(np.full(block_rows, blocks_per_row), block_cols, rng)
+    offsets = np.arange(block_size, dtype=np.int64)
+    chunk_blocks = max(1, GENERATE_CHUNK // (block_size * block_size))
+    rows, cols = [np.zeros(0, dtype=dtype)], [np.zeros(0, dtype=dtype)]
+    for start in range(0, block_row.size, chunk_blocks):
+        chunk_rows, chunk_cols = np.broadcast_arrays(
+            block_row[start:start + chunk_blocks, None, None] * block_size + offsets[None, :, None],
+            block_col[start:start + chunk_blocks, None, None] * block_size + offsets[None, None, :])
+        keep = (chunk_rows < num_rows) & (chunk_cols < num_cols)
+        if block_density < 1:
+            keep &= rng.random(keep.shape) < block_density
+        rows.append(chunk_rows[keep].astype(dtype))
+        cols.append(chunk_cols[keep].astype(dtype))
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+# Generates rows whose numbers of entries follow a power law (a Pareto distribution with the exponent, scaled to a mean
+# of nnz_per_row), like the degrees of web and social graphs. Every row has at least one entry
+def powerlaw(num_rows, num_cols, nnz_per_row, exponent, rng, dtype):
+    weights = rng.pareto(exponent - 1, num_rows) + 1
+    counts = np.clip(np.round(weights * nnz_per_row / weights.mean()), 1, num_cols).astype(np.int64)
+    return spread(counts, num_cols, rng, dtype)
+
+
+# Generates nnz_per_row entries in every row, spread uniformly over the columns
+def uniform(num_rows, num_cols, nnz_per_row, rng, dtype):
+    return spread(np.full(num_rows, min(nnz_per_row, num_cols)), num_cols, rng, dtype)
+
+
+# Generates a synthetic matrix of the family as a COO matrix, like the loader reads from MatrixMarket files. The values
+# are drawn uniformly from (0, 1]. Parameters a family doesn't use are ignored
+def generate(family, num_rows, num_cols=None, nnz_per_row=DEFAULT_NNZ_PER_ROW, seed=0, bandwidth=None,
+             block_size=DEFAULT_BLOCK_SIZE, block_density=DEFAULT_BLOCK_DENSITY, exponent=DEFAULT_EXPONENT):
+    num_cols = num_rows if num_cols is None else num_cols
+    rng = np.random.default_rng(seed)
+    # The index type is picked from an upper bound of the number of entries, so the entries are generated in it directly
+    dtype = index_dtype(num_rows, num_cols, num_rows * max(nnz_per_row, 1) * 4)
+    if family == "banded":
+        bandwidth = nnz_per_row if bandwidth is None else bandwidth
+        rows, cols = banded(num_rows, num_cols, nnz_per_row, bandwidth, rng, dtype)
+    elif family == "block":
+        rows, cols = block(num_rows, num_cols, nnz_per_row, block_size, block_density, rng, dtype)
+    elif family == "powerlaw":
+        rows, cols = powerlaw(num_rows, num_cols, nnz_per_row, exponent, rng, dtype)
+    elif family == "uniform":
+        rows, cols = uniform(num_rows, num_cols, nnz_per_row, rng, dtype)
+    else:
+        raise ValueError(f"unknown matrix family '{family}'")
+
+    data = 1.0 - rng.random(rows.size)
+    return coo_matrix((data, (rows, cols)), shape=(num_rows, num_cols))
+
+
+# Parses the family parameters of the scripts, given as KEY=VALUE (e.g. 'bandwidth=16')
+def parameter_type(value):
+    match = re.fullmatch(r"(bandwidth|block_size|block_density|exponent)=([0-9.]+)", value)
+    if match is None:
+        raise argparse.ArgumentTypeError(f"invalid parameter '{value}', expected bandwidth=N, block_size=N, "
+                                         f"block_density=X or exponent=X")
+    key, number = match.groups()
+    return key, float(number) if key in ['block_density', 'exponent'] else int(number)
+
+
+# Checks the parameters of a family. Returns the reason if they are invalid, otherwise None
+def check_parameters(num_rows, nnz_per_row, parameters):
+    if num_rows < 1 or nnz_per_row < 1:
+        return "the number of rows and the entries per row must be at least 1"
+    if parameters.get('block_size', DEFAULT_BLOCK_SIZE) < 1:
+        return "the block size must be at least 1"
+    if not 0 < parameters.get('block_density', DEFAULT_BLOCK_DENSITY) <= 1:
+        return "the block density must be larger than 0 and at most 1"
+    if parameters.get('exponent', DEFAULT_EXPONENT) <= 1:
+        return "the power-law exponent must be larger than 1"
+    return None
+
+
+# Get the file name of a generated matrix, which holds all its parameters, so the same matrix is not generated twice
+def matrix_name(family, num_rows, nnz_per_row, seed, parameters):
+    name = f"{family}_n{num_rows}_d{nnz_per_row}_s{seed}"
+    for key, value in sorted(parameters.items()):
+        name += f"_{key}{value}"
+    return f"{name}.mtx"
+
+
+# Writes the matrix to a MatrixMarket file. With use_cache, its COO arrays are also stored in the binary matrix cache,
+# so loading the file later skips parsing the text
+def write_matrix(matrix, file_path, use_cache=False, cache_dir=cache.DEFAULT_CACHE_DIR):
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    mmwrite(file_path, matrix)
+    if use_cache:
+        cache.store_entry(file_path, matrix.row, matrix.col, matrix.data, matrix.shape, cache_dir)
+
+
+# Plots the median time of every benchmark against the number of entries of the generated matrices, with a log-log plot
+# per benchmark in which every line is a format. The runs are the results of main.py on every generated matrix, along
+# with their number of entries
+def plot_scale(runs, output_path, title, mode_label):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+
+    lines = {}
+    for run in runs:
+        for fmt in run['data']:
+            for res in fmt['results']:
+                line = lines.setdefault(mode_label(res), {}).setdefault(fmt['format'].upper(), [])
+                line.append((run['nnz'], float(np.median(res['time'])) * 1000))
+    if not lines:
+        return
+
+    num_cols = min(2, len(lines))
+    num_rows = -(-len(lines) // num_cols)
+    fig, axes = plt.subplots(num_rows, num_cols, figsize=(8 * num_cols, num_rows * 5), squeeze=False,
+                             subplot_kw={'xscale': 'log', 'yscale': 'log', 'xlabel': 'Non-zero Entries',
+                                         'ylabel': 'Median Time (ms)'})
+    axs = axes.flatten()
+    for i, (label, formats) in enumerate(lines.items()):
+        for fmt, points in formats.items():
+            points.sort()
+            axs[i].plot([p[0] for p in points], [p[1] for p in points], marker='o', label=fmt)
+        axs[i].set_title(f"{chr(i + 97)}) {label}")
+        axs[i].legend(fontsize=8)
+    for j in range(len(lines), len(axs)):
+        fig.delaxes(axs[j])
+
+    fig.suptitle(title)
+    plt.tight_layout()
+    plt.savefig(output_path)
+    plt.close()
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(description="generates synthetic sparse matrices of parametric families as MatrixMarket files")
+
+        parser.add_argument("-f", "--family", choices=FAMILIES, required=True, help="family of the matrix (required)")
+        parser.add_argument("-n", "--rows", type=int, required=True, help="number of rows (required)")
+        parser.add_argument("--cols", type=int, help="number of columns (default: the number of rows)")
+        parser.add_argument("-d", "--nnz_per_row", type=int, default=DEFAULT_NNZ_PER_ROW,
+                            help="(mean) number of entries per row (default: %(default)s)")
+        parser.add_argument("-p", "--parameters", type=parameter_type, nargs='+', default=[],
+                            help=f"parameters of the family: bandwidth=N for banded (default: the entries per row), block_size=N (default: {DEFAULT_BLOCK_SIZE}) and block_density=X (default: {DEFAULT_BLOCK_DENSITY}) for block, exponent=X for powerlaw (default: {DEFAULT_EXPONENT})")
+        parser.add_argument("--seed", type=int, default=0, help="seed of the generator (default: %(default)s)")
+        parser.add_argument("-o", "--output", required=True, help="MatrixMarket file to write the matrix to (required)")
+        parser.add_argument("--cache", action="store_true",
+                            help="also store the matrix in the binary matrix cache, so loading it skips parsing the file")
+        parser.add_argument("--cache_dir", default=cache.DEFAULT_CACHE_DIR,
+                            help="directory of the binary matrix cache (default: %(default)s)")
+
+        args = parser.parse_args()
+
+        parameters = dict(args.parameters)
+        reason = check_parameters(args.rows, args.nnz_per_row, parameters)
+        if reason is not None:
+            parser.error(reason)
+        if not args.output.endswith(".mtx"):
+            parser.error("output file should be in MatrixMarket format, with .mtx extension")
+
+        start = time.perf_counter()
+        matrix = generate(args.family, args.rows, args.cols, args.nnz_per_row, args.seed, **parameters)
+        generated = time.perf_counter() - start
+        write_matrix(matrix, args.output, args.cache, args.cache_dir)
+        print(f"generated {matrix.shape[0]}x{matrix.shape[1]} {args.family} matrix with {matrix.nnz} entries in "
+              f"{generated:.2f} s, written to {args.output} in {time.perf_counter() - start - generated:.2f} s")
+    except Exception as e:
+        print(e)
+        exit(1)
@@ -1,9 +1,26 @@
 # Script responsible for loading the specified sparse matrix into the desired format
 from scipy.io import mmread
 from scipy.sparse import *
+import os
+import time
 import warnings
+import tracemalloc
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
 import torch.sparse
 
+import cache
+from reorder import apply_permutation
+from ellpack import ELLPACK_FORMATS, to_ellpack
+
+MM_CHUNK_SIZE = 32 * 1024 ** 2  # Number of bytes of the coordinate section parsed at once by the streaming reader
+MM_FIELD_COLUMNS = {'pattern': 2, 'integer': 3, 'real': 3, 'complex': 4}
+MM_FIELD_DTYPES = {'pattern': np.float64, 'integer': np.int64, 'real': np.float64, 'complex': np.complex128}
+VALUE_DTYPES = ['float64', 'float32', 'float16']
+INDEX_DTYPES = ['auto', 'int64', 'int32', 'int16']  # 'auto' keeps the index type SciPy picks for the matrix
+INDEX_ARRAYS = ['indices', 'indptr', 'offsets']  # Index arrays of the CSR, CSC, BSR and DIA layouts
+
 
 # Checks if the provided file is a MatrixMarket file
 def is_mm_format(file_path):
@@ -23,53 +40,495 @@ def is_mm_format(file_path):
         return False
 
 
-# Loads the file into one of the chosen Sparse Matrix formats
-def load_mm_file(file_path, fmt, pytorch):
+# Reads the MatrixMarket header, returning its properties and the byte offset at which the coordinate section starts
+def read_mm_header(file_path):
+    with open(file_path, "rb") as file:
+        banner = file.readline().decode().lower().split()
+        if len(banner) != 5 or banner[0] != "%%matrixmarket" or banner[1] != "matrix" or banner[2] != "coordinate":
+            raise ValueError("file is not a MatrixMarket coordinate matrix")
+        if banner[3] not in MM_FIELD_COLUMNS:
+            raise ValueError(f"unsupported MatrixMarket field '{banner[3]}'")
+        if banner[4] not in ["general", "symmetric", "skew-symmetric", "hermitian"]:
+            raise ValueError(f"unsupported MatrixMarket symmetry '{banner[4]}'")
+
+        # Skip comments and empty lines until the size line is found
+        line = file.readline()
+        while line.startswith(b"%") or not line.strip():
+            if not line:
+                raise ValueError("MatrixMarket file is missing the size line")
+            line = file.readline()
+        num_rows, num_cols, nnz = (int(x) for x in line.split())
+
+        return {'rows': num_rows, 'cols': num_cols, 'nnz': nnz, 'field': banner[3], 'symmetry': banner[4],
+                'offset': file.tell()}
+
+
+# Picks the smallest index dtype able to hold both the matrix dimensions and the number of entries
+def mm_index_dtype(header):
+    max_value = max(header['rows'], header['cols'], 2 * header['nnz'])
+    return np.int32 if max_value < np.iinfo(np.int32).max else np.int64
+
+
+# Parses a block of complete coordinate lines with a single vectorized NumPy call.
+# Returns the 0-based row and column indices and the values (None if values are not requested or for pattern matrices)
+def parse_mm_block(block, header, index_dtype, values=True):
+    num_columns = MM_FIELD_COLUMNS[header['field']]
+    # NumPy parses a block of only whitespace (e.g. blank lines at a chunk boundary) as [-1]
+    entries = np.fromstring(block, sep=" ") if block.strip() else np.zeros(0)
+    if entries.size % num_columns != 0:
+        raise ValueError("malformed MatrixMarket coordinate section")
+    entries = entries.reshape(-1, num_columns)
+
+    rows = entries[:, 0].astype(index_dtype) - 1
+    cols = entries[:, 1].astype(index_dtype) - 1
+    vals = None
+    if values and header['field'] == "complex":
+        vals = entries[:, 2] + 1j * entries[:, 3]
+    elif values and header['field'] != "pattern":
+        vals = entries[:, 2].astype(MM_FIELD_DTYPES[header['field']])
+    return rows, cols, vals
+
+
+# Iterates over the coordinate section (or the byte range [start, stop) of it) in chunks of (roughly) chunk_size bytes,
+# split at newline boundaries. Entries of symmetric, skew-symmetric and hermitian matrices are mirrored, so every chunk
+# contains the full entries
+def iter_mm_entries(file_path, header, index_dtype, values=True, chunk_size=MM_CHUNK_SIZE, start=None, stop=None):
+    symmetry = header['symmetry']
+    with open(file_path, "rb") as file:
+        start = header['offset'] if start is None else start
+        stop = os.fstat(file.fileno()).st_size if stop is None else stop
+        file.seek(start)
+        # Never request more than what is left in the range, as the read buffer is allocated at the requested size
+        remaining = stop - start
+        remainder = b""
+        while True:
+            block = file.read(min(chunk_size, remaining))
+            remaining -= len(block)
+            if not block:
+                if not remainder.strip():
+                    break
+                block, remainder = remainder, b""
+            else:
+                block = remainder + block
+                end = block.rfind(b"\n") + 1
+                if end == 0:
+                    remainder = block
+                    continue
+                block, remainder = block[:end], block[end:]
+
+            rows, cols, vals = parse_mm_block(block, header, index_dtype, values)
+            if rows.size == 0:
+                continue
+            if vals is None and values:
+                vals = np.ones(rows.size, dtype=MM_FIELD_DTYPES['pattern'])
+
+            if symmetry != "general":
+                off_diagonal = rows != cols
+                mirrored_vals = None
+                if vals is not None:
+                    mirrored_vals = vals[off_diagonal]
+                    if symmetry == "skew-symmetric":
+                        mirrored_vals = -mirrored_vals
+                    elif symmetry == "hermitian":
+                        mirrored_vals = np.conj(mirrored_vals)
+                    vals = np.concatenate((vals, mirrored_vals))
+                rows, cols = np.concatenate((rows, cols[off_diagonal])), np.concatenate((cols, rows[off_diagonal]))
+
+            yield rows, cols, vals
+
+
+# Streams the file into preallocated COO arrays, sized from the nnz field in the header
+def stream_mm_coo(file_path, header, chunk_size=MM_CHUNK_SIZE):
+    index_dtype = mm_index_dtype(header)
+    # Mirrored entries of non-general matrices can at most double the number of entries
+    capacity = header['nnz'] if header['symmetry'] == "general" else 2 * header['nnz']
+    row = np.empty(capacity, dtype=index_dtype)
+    col = np.empty(capacity, dtype=index_dtype)
+    data = np.empty(capacity, dtype=MM_FIELD_DTYPES[header['field']])
+
+    count = 0
+    for rows, cols, vals in iter_mm_entries(file_path, header, index_dtype, chunk_size=chunk_size):
+        if count + rows.size > capacity:
+            raise ValueError("MatrixMarket file contains more entries than specified in its header")
+        row[count:count + rows.size] = rows
+        col[count:count + rows.size] = cols
+        data[count:count + rows.size] = vals
+        count += rows.size
+
+    return coo_matrix((data[:count], (row[:count], col[:count])), shape=(header['rows'], header['cols']))
+
+
+# Streams the file directly into CSR using a counting sort: the first pass counts the entries per row, which gives
+# the final indptr, and the second pass scatters every chunk into its final position. No COO copy is ever created
+def stream_mm_csr(file_path, header, chunk_size=MM_CHUNK_SIZE):
+    index_dtype = mm_index_dtype(header)
+    num_rows = header['rows']
+
+    # First pass: count the number of entries per row
+    indptr = np.zeros(num_rows + 1, dtype=index_dtype)
+    for rows, _, _ in iter_mm_entries(file_path, header, index_dtype, values=False, chunk_size=chunk_size):
+        indptr[1:] += np.bincount(rows, minlength=num_rows).astype(index_dtype)
+    np.cumsum(indptr, out=indptr)
+
+    nnz = int(indptr[-1])
+    indices = np.empty(nnz, dtype=index_dtype)
+    data = np.empty(nnz, dtype=MM_FIELD_DTYPES[header['field']])
+    cursor = indptr[:-1].copy()
+
+    # Second pass: place every entry at the next free position of its row
+    for rows, cols, vals in iter_mm_entries(file_path, header, index_dtype, chunk_size=chunk_size):
+        order = np.argsort(rows, kind='stable')
+        sorted_rows = rows[order]
+        starts = np.flatnonzero(np.r_[True, sorted_rows[1:] != sorted_rows[:-1]])
+        lengths = np.diff(np.r_[starts, sorted_rows.size])
+        rank = np.arange(sorted_rows.size) - np.repeat(starts, lengths)
+
+        positions = cursor[sorted_rows] + rank
+        indices[positions] = cols[order]
+        data[positions] = vals[order]
+        cursor[sorted_rows[starts]] += lengths.astype(index_dtype)
+
+    matrix = csr_matrix((data, indices, indptr), shape=(num_rows, header['cols']))
+    matrix.sort_indices()
+    return matrix
+
+
+# Splits the coordinate section into (at most) num_ranges byte ranges, with every boundary moved to a line start
+def split_mm_ranges(file_path, header, num_ranges):
+    file_size = os.path.getsize(file_path)
+    step = max(1, (file_size - header['offset']) // num_ranges)
+    boundaries = [header['offset']]
+    with open(file_path, "rb") as file:
+        for i in range(1, num_ranges):
+            file.seek(max(header['offset'] + i * step - 1, boundaries[-1]))
+            file.readline()
+            boundaries.append(min(file.tell(), file_size))
+    boundaries.append(file_size)
+    return [(a, b) for a, b in zip(boundaries[:-1], boundaries[1:]) if b > a]
+
+
+# Counts the entries (lines) in a byte range of the coordinate section. Runs in a worker process
+def count_mm_range(file_path, start, stop):
+    count = 0
+    block = b""
+    with open(file_path, "rb") as file:
+        file.seek(start)
+        remaining = stop - start
+        while remaining > 0:
+            block = file.read(min(MM_CHUNK_SIZE, remaining))
+            if not block:
+                break
+            remaining -= len(block)
+            count += block.count(b"\n")
+
+    # Don't count trailing empty lines, but do count a last line that is not terminated by a newline
+    stripped = block.rstrip()
+    count -= block[len(stripped):].count(b"\n")
+    if stripped:
+        count += 1
+    return count
+
+
+# Attaches to a shared memory segment created by the parent process as a NumPy array. The pool workers share the
+# resource tracker of the parent, so the segment stays registered once and is unlinked by the parent only
+def attach_shared_array(name, dtype, capacity):
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(capacity, dtype=dtype, buffer=shm.buf)
+
+
+# Parses a byte range of the coordinate section and writes its entries into the shared COO arrays, starting at
+# position offset. Runs in a worker process; only the number of written entries is sent back to the parent
+def parse_mm_range(file_path, header, start, stop, offset, shm_names, dtypes, capacity):
+    segments = [attach_shared_array(name, dtype, capacity) for name, dtype in zip(shm_names, dtypes)]
+    row, col, data = (array for _, array in segments)
+
+    count = offset
+    for rows, cols, vals in iter_mm_entries(file_path, header, dtypes[0], start=start, stop=stop):
+        row[count:count + rows.size] = rows
+        col[count:count + rows.size] = cols
+        data[count:count + rows.size] = vals
+        count += rows.size
+
+    del row, col, data
+    for shm, _ in segments:
+        shm.close()
+    return count - offset
+
+
+# Parses the file into COO with a pool of worker processes. The coordinate section is split into byte ranges at
+# newline boundaries, the entries per range are counted first to get every worker's output offset, after which the
+# workers write their entries directly into shared memory instead of pickling them back to the parent
+def stream_mm_coo_parallel(file_path, header, workers):
+    index_dtype = mm_index_dtype(header)
+    value_dtype = MM_FIELD_DTYPES[header['field']]
+    dtypes = [index_dtype, index_dtype, value_dtype]
+    # Mirrored entries of non-general matrices can at most double the number of entries of every range
+    factor = 1 if header['symmetry'] == "general" else 2
+    capacity = factor * header['nnz']
+
+    ranges = split_mm_ranges(file_path, header, workers)
+    segments = [shared_memory.SharedMemory(create=True, size=max(1, capacity * np.dtype(dtype).itemsize))
+                for dtype in dtypes]
     try:
-        if not is_mm_format(file_path):
-            return None
+        with multiprocessing.Pool(min(workers, len(ranges))) as pool:
+            counts = pool.starmap(count_mm_range, [(file_path, a, b) for a, b in ranges])
+            if sum(counts) != header['nnz']:
+                # Line counts don't match the header (e.g. because of empty lines), so fall back to the serial reader
+                return stream_mm_coo(file_path, header)
+            offsets = np.r_[0, np.cumsum(counts)[:-1]] * factor
+            written = pool.starmap(parse_mm_range, [
+                (file_path, header, a, b, int(offset), [shm.name for shm in segments], dtypes, capacity)
+                for (a, b), offset in zip(ranges, offsets)
+            ])
+
+        # Copy the ranges out of shared memory, closing the gaps left for mirrored entries that did not exist
+        arrays = []
+        for shm, dtype in zip(segments, dtypes):
+            shared = np.ndarray(capacity, dtype=dtype, buffer=shm.buf)
+            arrays.append(np.concatenate([shared[offset:offset + n] for offset, n in zip(offsets, written)]))
+            del shared
+    finally:
+        for shm in segments:
+            shm.close()
+            shm.unlink()
+
+    row, col, data = arrays
+    return coo_matrix((data, (row, col)), shape=(header['rows'], header['cols']))
 
-        sparse_matrix = mmread(file_path)
-
-        return_matrix = None
-
-        # Load matrix into chosen format, SciPy implementation
-        if fmt == "coo":
-            return_matrix = coo_matrix(sparse_matrix)
-        elif fmt == "csr":
-            return_matrix = csr_matrix(sparse_matrix)
-        elif fmt == "csc":
-            return_matrix = csc_matrix(sparse_matrix)
-        elif fmt == "dia":
-            # Filter out the SparseEfficiencyWarning, which is emitted when loading into DIA with a non-diagonal matrix
-            warnings.filterwarnings("ignore", category=SparseEfficiencyWarning)
-            return_matrix = dia_matrix(sparse_matrix)
-        elif fmt == "bsr":
-            return_matrix = bsr_matrix(sparse_matrix)
-        elif fmt == "lil":
-            return_matrix = lil_matrix(sparse_matrix)
-        elif fmt == "dok":
-            return_matrix = dok_matrix(sparse_matrix)
+
+# Reads the file with the streaming parser into a COO or CSR matrix. If a stats dictionary is provided, it is filled
+# with the parse time, the peak memory allocated while parsing (tracked by tracemalloc) and the final matrix size.
+# With more than one worker, COO matrices are parsed in parallel by a pool of processes
+def read_mm_streaming(file_path, fmt="coo", chunk_size=MM_CHUNK_SIZE, stats=None, workers=1):
+    started_tracing = False
+    if stats is not None:
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
         else:
-            print("Error: unknown format '{}'".format(fmt))
-
-        # If PyTorch used, change matrix to PyTorch matrix
-        if pytorch and return_matrix is not None:
-            dense_matrix = return_matrix.toarray()
-            torch_matrix = torch.tensor(dense_matrix, dtype=torch.float64)
-            if fmt == "coo":
-                return_matrix = torch_matrix.to_sparse_coo()
-            elif fmt == "csr":
-                return_matrix = torch_matrix.to_sparse_csr()
-            elif fmt == "csc":
-                return_matrix = torch_matrix.to_sparse_csr()
-            elif fmt == "bsr":
-                blocksize = return_matrix.blocksize
-                return_matrix = torch_matrix.to_sparse_bsr(blocksize)
+            tracemalloc.start()
+            started_tracing = True
+        base_memory = tracemalloc.get_traced_memory()[0]
+        t1 = time.perf_counter()
+
+    try:
+        header = read_mm_header(file_path)
+        if fmt == "csr":
+            matrix = stream_mm_csr(file_path, header, chunk_size)
+        elif workers > 1 and header['nnz'] > 0:
+            matrix = stream_mm_coo_parallel(file_path, header, workers)
+        else:
+            matrix = stream_mm_coo(file_path, header, chunk_size)
+
+        if stats is not None:
+            stats['seconds'] = time.perf_counter() - t1
+            stats['peak_bytes'] = tracemalloc.get_traced_memory()[1] - base_memory
+            if fmt == "csr":
+                stats['final_bytes'] = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
             else:
-                return None
+                stats['final_bytes'] = matrix.data.nbytes + matrix.row.nbytes + matrix.col.nbytes
+    finally:
+        if started_tracing:
+            tracemalloc.stop()
+
+    return matrix
+
+
+# Wraps a NumPy array as a tensor without copying if possible (requires a writable array with a supported dtype)
+def as_tensor(array, dtype=None):
+    array = np.asarray(array, dtype=dtype)
+    if not array.flags.writeable:
+        array = array.copy()
+    return torch.from_numpy(np.ascontiguousarray(array))
+
+
+# Converts a SciPy sparse matrix to the PyTorch sparse tensor with the same layout, directly from its index and data arrays.
+# The values are float64, unless the matrix was downcast to float32 (see cast_values)
+def scipy_to_torch(matrix, fmt):
+    values_dtype = np.float32 if matrix.dtype == np.float32 else np.float64
+    if fmt == "coo":
+        # PyTorch requires int64 COO indices stacked in a single (2, nnz) array, so this is the only layout that copies.
+        # Summing duplicates sorts the entries in row-major order, which is what PyTorch considers coalesced
+        matrix.sum_duplicates()
+        indices = torch.from_numpy(np.vstack((matrix.row, matrix.col)).astype(np.int64))
+        return torch.sparse_coo_tensor(indices, as_tensor(matrix.data, values_dtype), matrix.shape, is_coalesced=True)
+    elif fmt == "csr":
+        return torch.sparse_csr_tensor(as_tensor(matrix.indptr), as_tensor(matrix.indices),
+                                       as_tensor(matrix.data, values_dtype), matrix.shape)
+    elif fmt == "csc":
+        return torch.sparse_csc_tensor(as_tensor(matrix.indptr), as_tensor(matrix.indices),
+                                       as_tensor(matrix.data, values_dtype), matrix.shape)
+    elif fmt == "bsr":
+        return torch.sparse_bsr_tensor(as_tensor(matrix.indptr), as_tensor(matrix.indices),
+                                       as_tensor(matrix.data, values_dtype), matrix.shape)
+    return None
+
+
+# Extracts a row of a PyTorch sparse tensor as a dense vector, without converting the full matrix to a dense one
+def torch_row(mtx, idx):
+    num_cols = mtx.shape[1]
+    vec = torch.zeros(num_cols, dtype=mtx.dtype)
+    if mtx.layout == torch.sparse_coo:
+        indices = mtx._indices()
+        mask = indices[0] == idx
+        vec.index_put_((indices[1][mask],), mtx._values()[mask], accumulate=True)
+    elif mtx.layout == torch.sparse_csr:
+        crow = mtx.crow_indices()
+        start, end = crow[idx], crow[idx + 1]
+        vec[mtx.col_indices()[start:end].long()] = mtx.values()[start:end]
+    elif mtx.layout == torch.sparse_csc:
+        ccol = mtx.ccol_indices()
+        mask = mtx.row_indices() == idx
+        cols = torch.repeat_interleave(torch.arange(num_cols), ccol.diff())
+        vec[cols[mask]] = mtx.values()[mask]
+    elif mtx.layout == torch.sparse_bsr:
+        block_rows, block_cols = mtx.values().shape[1:]
+        crow = mtx.crow_indices()
+        block_idx = idx // block_rows
+        start, end = crow[block_idx], crow[block_idx + 1]
+        blocks = vec.view(-1, block_cols)
+        blocks[mtx.col_indices()[start:end].long()] = mtx.values()[start:end, idx % block_rows, :]
+    else:
+        return None
+    return vec
+
+
+# Reads the file as a COO matrix. If caching is enabled, the binary cache is used instead of parsing the text when possible
+def read_mm_coo(file_path, use_cache=True, cache_dir=cache.DEFAULT_CACHE_DIR, workers=1):
+    if use_cache:
+        cached = cache.load_entry(file_path, cache_dir)
+        if cached is not None:
+            row, col, data, shape = cached
+            return coo_matrix((data, (row, col)), shape=shape)
+
+    # SciPy's reader is the fastest for a single process; the streaming parser is only used to parse in parallel
+    if workers > 1:
+        sparse_matrix = read_mm_streaming(file_path, "coo", workers=workers)
+    else:
+        sparse_matrix = coo_matrix(mmread(file_path))
+
+    if use_cache:
+        cache.store_entry(file_path, sparse_matrix.row, sparse_matrix.col, sparse_matrix.data, sparse_matrix.shape,
+                          cache_dir)
+    return sparse_matrix
+
+
+# Checks whether the matrix can be stored with the value and index types in the format. Only the ELLPACK formats support
+# float16 values and int16 indices: SciPy has no float16 matrices, and the compiled kernels of SciPy and PyTorch only take
+# int32 or int64 indices. The index type must hold the dimensions and the number of entries of the matrix, and the
+# values must not overflow the value type. Returns the reason if the types can't be used, otherwise None
+def check_dtypes(matrix, fmt, pytorch, value_dtype=None, index_dtype=None):
+    compact = fmt in ELLPACK_FORMATS and not pytorch
+    if value_dtype is not None:
+        if value_dtype == "float16" and not compact:
+            return "float16 values are only supported by the ELLPACK formats"
+        if value_dtype == "float16" and np.iscomplexobj(matrix.data):
+            return "complex matrices can't be stored with float16 values"
+        largest = np.abs(matrix.data).max(initial=0)
+        if np.isfinite(largest) and largest > np.finfo(value_dtype).max:
+            return f"the largest value of the matrix ({largest:.6g}) overflows {value_dtype}"
+
+    if index_dtype is None or index_dtype == "auto":
+        return None
+    if index_dtype == "int16" and not compact:
+        return "int16 indices are only supported by the ELLPACK formats"
+    if fmt in ["lil", "dok"]:
+        return f"{fmt.upper()} stores its indices as Python integers"
+    if pytorch and fmt == "coo" and index_dtype != "int64":
+        return "PyTorch COO tensors require int64 indices"
+    largest = max(matrix.shape[0], matrix.shape[1], matrix.nnz)
+    if largest > np.iinfo(index_dtype).max:
+        return (f"{index_dtype} indices can't hold the dimensions ({matrix.shape[0]}x{matrix.shape[1]}) and number of "
+                f"entries ({matrix.nnz}) of the matrix")
+    return None
+
+
+# Returns the type the values of a matrix of this type are cast to. Complex matrices keep complex values of the precision
+def cast_dtype(dtype, value_dtype):
+    if np.dtype(dtype).kind == "c":
+        return np.result_type(value_dtype, np.complex64)
+    return np.dtype(value_dtype)
+
+
+# Casts the values of the converted (SciPy or ELLPACK) matrix to the value type (see cast_dtype). SciPy has no float16
+# matrices, so ELLPACK matrices cast the arrays of their layout instead
+def cast_values(matrix, value_dtype):
+    dtype = cast_dtype(matrix.dtype, value_dtype)
+    if matrix.format in ELLPACK_FORMATS:
+        return matrix.with_data(lambda data: data.astype(dtype))
+    return matrix.astype(dtype)
+
+
+# Casts the index arrays of the converted (SciPy or ELLPACK) matrix to the index type, in place
+def cast_indices(matrix, index_dtype):
+    if matrix.format in ELLPACK_FORMATS:
+        return matrix.with_index_dtype(index_dtype)
+    # SciPy >= 1.13 stores COO indices as a coords tuple (its row and col setters keep the old type), older versions
+    # as plain row and col attributes
+    if matrix.format == "coo" and hasattr(matrix, 'coords'):
+        matrix.coords = (matrix.row.astype(index_dtype), matrix.col.astype(index_dtype))
+    elif matrix.format == "coo":
+        matrix.row, matrix.col = matrix.row.astype(index_dtype), matrix.col.astype(index_dtype)
+    for name in INDEX_ARRAYS:
+        if isinstance(getattr(matrix, name, None), np.ndarray):
+            setattr(matrix, name, getattr(matrix, name).astype(index_dtype))
+    return matrix
+
+
+# Converts the COO matrix into one of the chosen Sparse Matrix formats, optionally as a PyTorch tensor. The layout
+# parameters are the block size for BSR (see tuning.py; otherwise SciPy detects one), and the chunk height and sorting
+# window for SELL-C-σ (see ellpack.py; otherwise the defaults are used). The values and indices are downcast to the
+# value and index types if provided, which must have been checked with check_dtypes
+def convert_matrix(sparse_matrix, fmt, pytorch, layout=None, value_dtype=None, index_dtype=None):
+    return_matrix = None
+
+    # Load matrix into chosen format, SciPy implementation
+    if fmt == "coo":
+        # Copy, so the returned matrix does not share the (read-only) memory-mapped cache arrays
+        return_matrix = coo_matrix(sparse_matrix, copy=True)
+    elif fmt == "csr":
+        return_matrix = csr_matrix(sparse_matrix)
+    elif fmt == "csc":
+        return_matrix = csc_matrix(sparse_matrix)
+    elif fmt == "dia":
+        # Filter out the SparseEfficiencyWarning, which is emitted when loading into DIA with a non-diagonal matrix
+        warnings.filterwarnings("ignore", category=SparseEfficiencyWarning)
+        return_matrix = dia_matrix(sparse_matrix)
+    elif fmt == "bsr":
+        return_matrix = bsr_matrix(sparse_matrix, blocksize=layout)
+    elif fmt == "lil":
+        return_matrix = lil_matrix(sparse_matrix)
+    elif fmt == "dok":
+        return_matrix = dok_matrix(sparse_matrix)
+    elif fmt in ELLPACK_FORMATS:
+        # The ELLPACK formats are implemented on NumPy arrays, they have no PyTorch equivalent
+        return_matrix = to_ellpack(sparse_matrix, fmt, *(layout or ()))
+    else:
+        print("Error: unknown format '{}'".format(fmt))
+
+    if return_matrix is not None and value_dtype is not None:
+        return_matrix = cast_values(return_matrix, value_dtype)
+    if return_matrix is not None and index_dtype is not None and index_dtype != "auto":
+        return_matrix = cast_indices(return_matrix, index_dtype)
+
+    # If PyTorch used, change matrix to PyTorch matrix
+    if pytorch and return_matrix is not None and fmt not in ELLPACK_FORMATS:
+        return_matrix = scipy_to_torch(return_matrix, fmt)
+
+    return return_matrix
+
+
+# Loads the file into one of the chosen Sparse Matrix formats. With a permutation (see reorder.py), the rows and columns
+# are reordered before the conversion, and the value and index types are passed on to convert_matrix
+def load_mm_file(file_path, fmt, pytorch, use_cache=True, cache_dir=cache.DEFAULT_CACHE_DIR, workers=1,
+                 layout=None, permutation=None, value_dtype=None, index_dtype=None):
+    try:
+        if not is_mm_format(file_path):
+            return None
 
-        return return_matrix
+        sparse_matrix = read_mm_coo(file_path, use_cache, cache_dir, workers)
+        if permutation is not None:
+            sparse_matrix = apply_permutation(sparse_matrix, permutation)
+        return convert_matrix(sparse_matrix, fmt, pytorch, layout, value_dtype, index_dtype)
 
     except Exception as e:
         return None
@@ -1,12 +1,23 @@
 # Main script that handles everything surrounding the benchmarking functionality
 
+import os
 import argparse
 import sys
+import time
 import json
 import warnings
 import numpy as np
 
-from loader import load_mm_file
+import cache
+import store
+from loader import load_mm_file, read_mm_coo, read_mm_header, is_mm_format, check_dtypes, convert_matrix, \
+    VALUE_DTYPES, INDEX_DTYPES
+from tuning import tune_bsr, check_dia, blocksize_type, DIA_MEMORY_FRACTION
+from reorder import reorder_matrix, apply_permutation, REORDER_METHODS
+from ellpack import ELLPACK_FORMATS, DEFAULT_CHUNK_HEIGHT, DEFAULT_SIGMA
+from roofline import matrix_work, host_bandwidth
+from generator import generate, matrix_name, write_matrix, check_parameters, parameter_type, plot_scale, FAMILIES, \
+    DEFAULT_SCALE_SIZES, DEFAULT_NNZ_PER_ROW
 from functions import *
 from benchmark import *
 
@@ -31,51 +42,171 @@ class ModeHelpAction(argparse.Action):
         prs.exit()
 
 
-# Call benchmark function, providing it with the function to execute and its arguments
-def perform_benchmark(mode, mtx_a, mtx_b=None, idx=-1, scl=-1, reps=0):
-    # Prepare results dictionary
-    benchmark_results = {'mode': mode}
-
-    # Depending on the mode, call a different function, populate results dictionary
-    if mode == "add":
-        benchmark_results['time'] = benchmark(mtx_addition, mtx_a, mtx_b, reps=reps)
-    elif mode == "sub":
-        benchmark_results['time'] = benchmark(mtx_subtraction, mtx_a, mtx_b, reps=reps)
-    elif mode == "sm":
-        benchmark_results['time'] = benchmark(mtx_scalar_multiplication, scl, mtx_a, reps=reps)
-    elif mode == "mvm":
-        vec = None
-        if mtx_a.__module__.startswith('torch'):
-            dense_mtx = mtx_a.to_dense()
-            vec = dense_mtx[idx]
-        elif mtx_a.__module__.startswith('scipy'):
-            vec = mtx_a.getrow(idx)
-        benchmark_results['time'] = benchmark(mtx_matrix_vector_multiplication, mtx_a, vec, reps=reps)
-    elif mode == "mmm":
-        benchmark_results['time'] = benchmark(mtx_matrix_matrix_multiplication, mtx_a, mtx_b, reps=reps)
-    elif mode == "tps":
-        benchmark_results['time'] = benchmark(mtx_transposition, mtx_a, reps=reps)
-
-    return benchmark_results
+# Parse the provided MatrixMarket files into the binary cache and exit
+class CacheWarmAction(argparse.Action):
+    def __call__(self, prs, namespace, values, option_string=None):
+        for file_path in values:
+            if not is_mm_format(file_path):
+                continue
+            matrix = read_mm_coo(file_path, cache_dir=namespace.cache_dir, workers=namespace.workers)
+            print(f"cached {file_path} ({matrix.shape[0]}x{matrix.shape[1]}, {matrix.nnz} non-zero entries)")
+        prs.exit()
+
+
+# Show the entries stored in the binary cache and exit
+class CacheInfoAction(argparse.Action):
+    def __call__(self, prs, namespace, values, option_string=None):
+        entries = cache.list_entries(namespace.cache_dir)
+        print(f"cache directory: {namespace.cache_dir} (limit: {cache.DEFAULT_CACHE_LIMIT} bytes)")
+        for entry in reversed(entries):
+            last_used = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry['last_used']))
+            print(f"  {entry['key']}: {entry['source']} ({entry['shape'][0]}x{entry['shape'][1]}, {entry['nnz']} nnz, "
+                  f"{entry['bytes']} bytes, last used {last_used})")
+        print(f"total: {len(entries)} entries, {sum(e['bytes'] for e in entries)} bytes")
+        prs.exit()
+
+
+# Remove all entries from the binary cache and exit
+class CacheClearAction(argparse.Action):
+    def __call__(self, prs, namespace, values, option_string=None):
+        cache.clear(namespace.cache_dir)
+        print(f"cleared cache directory {namespace.cache_dir}")
+        prs.exit()
+
+
+# Get the permutation of the reordering for a matrix with this shape. Matrix B is only reordered (like matrix A) if it
+# has the same shape as matrix A
+def matrix_permutation(args, shape):
+    if args.permutation is None or tuple(shape) != (args.permutation[0].size, args.permutation[1].size):
+        return None
+    return args.permutation
+
+
+# Check if the path refers to a matrix generated in memory by the scale sweep, or otherwise to a MatrixMarket file
+def is_matrix(args, path):
+    return path in args.generated or is_mm_format(path)
+
+
+# Read the matrix as COO: the generated matrix of the scale sweep, or otherwise the MatrixMarket file
+def read_coo(args, path):
+    if path in args.generated:
+        return args.generated[path]
+    return read_mm_coo(path, not args.no_cache, args.cache_dir, args.workers)
+
+
+# Get the number of rows and columns of the matrix, without loading MatrixMarket files
+def matrix_shape(args, path):
+    if path in args.generated:
+        return args.generated[path].shape
+    header = read_mm_header(path)
+    return header['rows'], header['cols']
+
+
+# Load the matrix into the format like load_mm_file, also for the generated matrices of the scale sweep
+def load_matrix(args, path, fmt, pytorch, layout=None, permutation=None, value_dtype=None, index_dtype=None):
+    if path not in args.generated:
+        return load_mm_file(path, fmt, pytorch, not args.no_cache, args.cache_dir, args.workers, layout, permutation,
+                            value_dtype, index_dtype)
+    try:
+        matrix = args.generated[path]
+        if permutation is not None:
+            matrix = apply_permutation(matrix, permutation)
+        return convert_matrix(matrix, fmt, pytorch, layout, value_dtype, index_dtype)
+    except Exception as e:
+        return None
+
+
+# Load the matrix as COO, reordered like it is in the benchmark
+def load_coo(args, path):
+    matrix = read_coo(args, path)
+    permutation = matrix_permutation(args, matrix.shape)
+    return matrix if permutation is None else apply_permutation(matrix, permutation)
+
+
+# Tune the layout of the format before the matrices are converted: choose the BSR block size, and refuse DIA if it
+# would store too many padding values. The format is also refused if the matrices can't be stored with the chosen value
+# and index types. Returns the tuning results, or None if the format is refused
+def tune_format(args, paths):
+    tuning = {}
+    if args.value_dtype is not None or args.index_dtype != "auto":
+        for path in paths:
+            reason = check_dtypes(load_coo(args, path), args.format, args.pytorch, args.value_dtype, args.index_dtype)
+            if reason is not None:
+                print(f"skipping format '{args.format}' for {path}: {reason}", file=sys.stderr)
+                return None
+        tuning['value_dtype'] = args.value_dtype
+        tuning['index_dtype'] = args.index_dtype
+
+    if args.format == "dia":
+        for path in paths:
+            estimate = check_dia(load_coo(args, path), args.dia_max_padding,
+                                 None if args.dia_max_memory is None else args.dia_max_memory * 1024 ** 2)
+            if not estimate['feasible']:
+                print(f"skipping format 'dia' for {path}: {estimate['reason']}", file=sys.stderr)
+                return None
+            tuning.setdefault('dia', []).append(estimate)
+    elif args.format == "bsr" and args.blocksize == "auto":
+        result = tune_bsr(load_coo(args, paths[0]), args.pytorch)
+        tuning['blocksize'] = result['blocksize']
+        tuning['candidates'] = result['candidates']
+    elif args.format == "bsr" and args.blocksize != "scipy":
+        num_rows, num_cols = matrix_shape(args, paths[0])
+        if num_rows % args.blocksize[0] or num_cols % args.blocksize[1]:
+            parser.error(f"block size {args.blocksize[0]}x{args.blocksize[1]} does not divide the shape of the matrix "
+                         f"({num_rows}x{num_cols})")
+        tuning['blocksize'] = args.blocksize
+    return tuning
 
 
 # Handle benchmark executing at the format level, meaning that, with a set format, handle benchmarking related to modes
 def run_format(args):
     matrix_b = None
     row_index = 0
+    if not is_matrix(args, args.path_a):
+        parser.exit()
+    # Tune the format before loading the matrices, skipping it if the format is refused
+    needs_b = args.mode in ["add", "sub", "mmm", "full"] and args.path_b is not None and is_matrix(args, args.path_b)
+    tuning = tune_format(args, [args.path_a, args.path_b] if needs_b else [args.path_a])
+    if tuning is None:
+        return None
+    blocksize = tuning.get('blocksize')
+    layout = (args.sell_c, args.sell_sigma) if args.format == "sell" else blocksize
+
     # Load primary matrix
-    matrix_a = load_mm_file(args.path_a, args.format, args.pytorch)
+    matrix_a = load_matrix(args, args.path_a, args.format, args.pytorch, layout, args.permutation, args.value_dtype,
+                           args.index_dtype)
     if matrix_a is None:
         parser.exit()
+    # Results of matrices downcast to a lower precision are compared to the results on the float64 matrices
+    reference = None
+    if args.value_dtype in ["float32", "float16"]:
+        reference = [load_matrix(args, args.path_a, args.format, args.pytorch, layout, args.permutation), None]
+    # Results are verified against the results of SciPy's CSR on the original matrices
+    verify = None
+    if args.verify:
+        verify = [load_matrix(args, args.path_a, "csr", False, None, args.permutation), None]
+    if args.format in ELLPACK_FORMATS:
+        tuning['ellpack'] = matrix_a.stats()
 
     # Load secondary matrix (in my results, this is the same as primary matrix)
     if args.mode == "add" or args.mode == "sub" or args.mode == "mmm" or args.mode == "full":
         if args.path_b is None:
             parser.error("option '%s' required for mode '%s'" % ("--path_b", args.mode))
         else:
-            matrix_b = load_mm_file(args.path_b, args.format, args.pytorch)
+            # Matrix B uses the block size of matrix A if it fits its shape
+            shape_b = matrix_shape(args, args.path_b)
+            layout_b = layout
+            if blocksize is not None and (shape_b[0] % blocksize[0] or shape_b[1] % blocksize[1]):
+                layout_b = None
+            permutation_b = matrix_permutation(args, shape_b)
+            matrix_b = load_matrix(args, args.path_b, args.format, args.pytorch, layout_b, permutation_b,
+                                   args.value_dtype, args.index_dtype)
             if matrix_b is None:
                 parser.exit()
+            if reference is not None:
+                reference[1] = load_matrix(args, args.path_b, args.format, args.pytorch, layout_b, permutation_b)
+            if verify is not None:
+                verify[1] = load_matrix(args, args.path_b, "csr", False, None, permutation_b)
     # Ensure scalar value is defined if needed
     if (args.mode == "sm" or args.mode == "full") and args.scalar is None:
         parser.error("option '%s' required for mode '%s'" % ("--scalar", args.mode))
@@ -89,20 +220,78 @@ def run_format(args):
 
     # Define results dictionary
     fmt_results = {'format': args.format, 'results': []}
+    if tuning:
+        fmt_results['tuning'] = tuning
+
+    timing = {'warmup': args.warmup, 'min_time': args.min_time / 1000, 'force': not args.no_materialize,
+              'gc_disable': not args.gc, 'cpu': args.cpu, 'budget': args.budget,
+              'target_ci': None if args.target_ci is None else args.target_ci / 100}
+
+    # Execute parameter format's functions based on arguments, populate results dictionary. Mode spmm is executed once
+    # for every number of right-hand side vectors, and mode conv once for every source format. With --threads, modes mvm
+    # and spmm are executed once for every number of threads of the strong-scaling benchmark, and with --reuse_pattern,
+    # modes add, sub and mmm of CSR and CSC are executed once more as the numeric phase of a plan. With --inplace, modes
+    # sm, mvm, spmm and tps are executed once more without allocating their output. With a value type of a lower
+    # precision, the error of every result relative to the float64 result is reported. With --verify, every result is
+    # checked against the result of SciPy's CSR, and mismatches are reported
+    modes = mode_options[:-1] if args.mode == "full" else [args.mode]
+    # The work of the operations is counted once on the pattern of the matrices, for the roofline metrics of all formats
+    if args.work is None:
+        args.work = matrix_work(load_coo(args, args.path_a),
+                                load_coo(args, args.path_b) if matrix_b is not None else None, "mmm" in modes)
+    for mode in modes:
+        for variant in mode_variants(mode, args.format, args.spmm_k, args.threads,
+                                     args.reuse_pattern and not args.pytorch, args.inplace,
+                                     "pytorch" if args.pytorch else "scipy"):
+            res = perform_benchmark(mode, matrix_a, mtx_b=matrix_b, idx=row_index, scl=args.scalar,
+                                    reps=args.benchmark, timing=timing, memory=args.memory, reference=reference,
+                                    verify=verify, work=args.work, **variant)
+            if not res.get('verification', {}).get('passed', True):
+                print(f"verification failed for format '{args.format}', mode '{mode}' {variant}: "
+                      f"{res['verification']['reason']}", file=sys.stderr)
+            fmt_results['results'].append(res)
+
+    return fmt_results
+
+
+# Handle benchmark executing at the matrix level, meaning that, with a set matrix A, handle benchmarking of the chosen
+# format(s). Returns the results dictionary, including the matrix and backend so the results can be used by recommend.py
+def run_matrix(args):
+    matrix_path = args.path_a if args.path_a in args.generated else os.path.realpath(args.path_a)
+    results = {'matrix': matrix_path, 'backend': "pytorch" if args.pytorch else "scipy", 'data': []}
+    args.work = None
 
-    # Execute parameter format's functions based on arguments, populate results dictionary
-    if args.mode == "full":
-        for mode in mode_options[:-1]:
-            fmt_results['results'].append(
-                perform_benchmark(mode, matrix_a, mtx_b=matrix_b, idx=row_index, scl=args.scalar, reps=args.benchmark)
-            )
+    # Calculate the reordering once, before the benchmark of every format is executed on the reordered matrices
+    args.permutation = None
+    if args.reorder != "none":
+        if not is_matrix(args, args.path_a):
+            parser.exit()
+        matrix = read_coo(args, args.path_a)
+        args.permutation, _, results['reorder'] = reorder_matrix(matrix, args.reorder)
+
+    # Execute benchmarks based on parsed arguments and add results to results dictionary
+    selected = args.format
+    if selected == "all":
+        for fmt in format_options[:-1]:
+            if args.pytorch and fmt not in ['coo', 'csr', 'csc', 'bsr']:
+                continue
+            args.format = fmt
+            fmt_results = run_format(args)
+            if fmt_results is not None:
+                results['data'].append(fmt_results)
+        args.format = selected
     else:
-        fmt_results['results'].append(
-            perform_benchmark(args.mode, matrix_a, mtx_b=matrix_b, idx=row_index, scl=args.scalar,
-                              reps=args.benchmark)
-        )
+        if args.pytorch and args.format not in ['coo', 'csr', 'csc', 'bsr']:
+            parser.error("format '{}' is not supported by pytorch".format(args))
+        fmt_results = run_format(args)
+        if fmt_results is not None:
+            results['data'].append(fmt_results)
+    return results
 
-    return fmt_results
+
+# Get the name of the benchmarked mode in the plot of the scale sweep, like results.py
+def scale_label(res):
+    return store.variant_label(modes_dict[res['mode']], res)
 
 
 #####################################################################################################################
@@ -132,20 +321,96 @@ try:
     help_group.add_argument('--mode_help', help="show additional information about the possible modes and exit",
                             action=ModeHelpAction, nargs=0)
 
+    loading_group = parser.add_argument_group('matrix loading')
+    loading_group.add_argument('--cache_dir', default=cache.DEFAULT_CACHE_DIR,
+                               help="directory of the binary matrix cache (default: %(default)s)")
+    loading_group.add_argument('--no_cache', action="store_true",
+                               help="always parse the MatrixMarket files instead of using the binary cache")
+    loading_group.add_argument('-w', '--workers', type=int, default=1,
+                               help="number of processes used to parse MatrixMarket files (default: %(default)s)")
+    loading_group.add_argument('--cache_warm', metavar="FILE", nargs='+', action=CacheWarmAction,
+                               help="parse the MatrixMarket file(s) into the cache and exit")
+    loading_group.add_argument('--cache_info', nargs=0, action=CacheInfoAction,
+                               help="show the entries stored in the cache and exit")
+    loading_group.add_argument('--cache_clear', nargs=0, action=CacheClearAction,
+                               help="remove all entries from the cache and exit")
+
+    tuning_group = parser.add_argument_group('format tuning')
+    tuning_group.add_argument('--blocksize', type=blocksize_type, default="auto",
+                              help="BSR block size: 'auto' benchmarks the SpMV of the most compact candidate block sizes and picks the fastest, 'scipy' uses SciPy's detection, or a block size like 4x4 (default: %(default)s)")
+    tuning_group.add_argument('--dia_max_padding', type=float,
+                              help="also skip DIA if it would store more than this many values per non-zero entry (optional)")
+    tuning_group.add_argument('--dia_max_memory', type=float,
+                              help=f"skip DIA if its layout would take more than this many MB (default: {DIA_MEMORY_FRACTION * 100:.0f}%% of the available memory)")
+    tuning_group.add_argument('--sell_c', type=int, default=DEFAULT_CHUNK_HEIGHT,
+                              help="SELL-C-σ chunk height C: the number of rows padded to the same length (default: %(default)s)")
+    tuning_group.add_argument('--sell_sigma', type=int, default=DEFAULT_SIGMA,
+                              help="SELL-C-σ sorting window σ: the number of rows sorted by length before they are chunked (default: %(default)s)")
+    tuning_group.add_argument('--value_dtype', choices=VALUE_DTYPES,
+                              help="store the values in this type; float16 is only supported by ell and sell, and the error of every result relative to float64 is reported (default: the type of the file)")
+    tuning_group.add_argument('--index_dtype', choices=INDEX_DTYPES, default="auto",
+                              help="store the indices in this type; formats whose indices don't fit the dimensions of the matrix are skipped, and int16 is only supported by ell and sell (default: %(default)s)")
+    tuning_group.add_argument('--reorder', choices=REORDER_METHODS, default="none",
+                              help="reorder the rows and columns of the matrices before the benchmark: 'rcm' (reverse Cuthill-McKee), 'degree' (rows sorted by number of entries) or 'random' (default: %(default)s)")
+
+    timing_group = parser.add_argument_group('timing')
+    timing_group.add_argument('--warmup', type=int, default=1,
+                              help="number of untimed calls before the benchmark starts (default: %(default)s)")
+    timing_group.add_argument('--min_time', type=float, default=0,
+                              help="minimum duration of a single sample in ms; fast operations are repeated in a loop until a sample lasts this long (default: %(default)s)")
+    timing_group.add_argument('--no_materialize', action="store_true",
+                              help="don't materialize lazy PyTorch results (uncoalesced COO tensors and views) inside the timed region; they can then report near-zero times")
+    timing_group.add_argument('--gc', action="store_true",
+                              help="keep the garbage collector enabled while timing")
+    timing_group.add_argument('--target_ci', type=float,
+                              help="keep sampling until the bootstrap 95%% CI of the median is within this percentage of the median; -b is then the minimum number of samples (optional)")
+    timing_group.add_argument('--budget', type=float, default=60,
+                              help="maximum number of seconds spent sampling a single operation with --target_ci (default: %(default)s)")
+    timing_group.add_argument('--cpu', type=int, help="pin the benchmark to this CPU (optional; Linux only)")
+    timing_group.add_argument('--threads', type=int,
+                              help="run mvm and spmm of CSR and BSR on 1, 2, 4, ... up to this many threads, to measure the strong scaling (optional; SciPy uses the multithreaded kernel, PyTorch its own threads)")
+    timing_group.add_argument('--reuse_pattern', action="store_true",
+                              help="also benchmark add, sub and mmm of CSR and CSC with the output structure calculated once (symbolic phase), so every call only combines the values (numeric phase); SciPy only")
+    timing_group.add_argument('--inplace', action="store_true",
+                              help="also benchmark sm, mvm, spmm and tps without allocating their output: scaling the values in place, multiplying into a preallocated output and transposing into a preallocated buffer")
+    timing_group.add_argument('--verify', action="store_true",
+                              help="also verify every result against the result of SciPy's CSR, comparing cheap fingerprints (norm, number of non-zero values and random-vector probes) outside the timed region")
+    timing_group.add_argument('--memory', action="store_true",
+                              help="also measure the peak memory of every operation, in one extra untimed call (always done for mode conv)")
+
+    scale_group = parser.add_argument_group('scale sweep')
+    scale_group.add_argument('--scale', choices=FAMILIES,
+                             help="instead of --path_a and --path_b, generate a synthetic matrix of this family for every size in --scale_sizes and benchmark on all of them, plotting the median time against the number of entries per format (optional)")
+    scale_group.add_argument('--scale_sizes', type=int, nargs='+', default=DEFAULT_SCALE_SIZES,
+                             help=f"numbers of rows of the generated square matrices (default: {' '.join(map(str, DEFAULT_SCALE_SIZES))})")
+    scale_group.add_argument('--scale_nnz_per_row', type=int, default=DEFAULT_NNZ_PER_ROW,
+                             help="(mean) number of entries per row of the generated matrices (default: %(default)s)")
+    scale_group.add_argument('--scale_parameters', type=parameter_type, nargs='+', default=[],
+                             help="parameters of the family, like -p of generator.py (optional)")
+    scale_group.add_argument('--scale_seed', type=int, default=0,
+                             help="seed of the generator (default: %(default)s)")
+    scale_group.add_argument('--scale_dir',
+                             help="also write the generated matrices to MatrixMarket files in this directory, unless they exist; they are always benchmarked from memory (optional)")
+    scale_group.add_argument('--scale_plot', default="./plots/scale.pdf",
+                             help="path to save the log-log plot of the scale sweep to (default: %(default)s)")
+
     parser.add_argument('-b', '--benchmark', type=int, required=True,
                         help="select the number of times to benchmark the chosen mode(s) (minimum 1)")
     parser.add_argument('--format', choices=format_options, help="choose sparse matrix format(s) to use (required)",
                         required=True)
     parser.add_argument('--mode', choices=mode_options, help="choose the function(s) to benchmark (required)",
                         required=True)
-    parser.add_argument('--path_a', help="path to the main matrix to be used for the benchmark (required)",
-                        required=True)
+    parser.add_argument('--path_a', help="path to the main matrix to be used for the benchmark (required without --scale)")
     parser.add_argument('--path_b',
                         help="path to the secondary matrix to be used for the benchmark (required for modes add, sub and mmm)")
     parser.add_argument('--scalar', type=int, help="scalar value used for the benchmark (required for mode sm)")
     parser.add_argument('--index', type=int,
                         help="index of the row in the matrix to select as vector (optional for mode mvm; if not chosen, selected randomly)")
+    parser.add_argument('--spmm_k', type=int, nargs='+', default=[1, 8, 32],
+                        help="number(s) of dense right-hand side vectors to multiply with at once (optional for mode spmm; default: 1 8 32)")
     parser.add_argument('-o', '--out', help="path to save the result to, otherwise it gets printed to stdout (JSON format)")
+    parser.add_argument('--store', nargs='?', const=store.DEFAULT_STORE,
+                        help=f"append the result to the results store at this path; the JSON is then only saved with -o (optional; default path: {store.DEFAULT_STORE})")
     parser.add_argument('-pt', '--pytorch', action="store_true",
                         help="use pytorch instead of scipy (only works with coo, csr, csc and bsr formats)")
 
@@ -154,31 +419,101 @@ try:
     if parser_args.benchmark < 1:
         parser.error("value for --benchmark must at least 1")
 
+    if min(parser_args.spmm_k) < 1:
+        parser.error("values for --spmm_k must be at least 1")
+
+    if parser_args.warmup < 0 or parser_args.min_time < 0:
+        parser.error("values for --warmup and --min_time must be at least 0")
+
+    if parser_args.target_ci is not None and parser_args.target_ci <= 0:
+        parser.error("value for --target_ci must be larger than 0")
+
+    if parser_args.dia_max_memory is not None and parser_args.dia_max_memory <= 0:
+        parser.error("value for --dia_max_memory must be larger than 0")
+
+    if parser_args.sell_c < 1 or parser_args.sell_sigma < 1:
+        parser.error("values for --sell_c and --sell_sigma must be at least 1")
+
+    if parser_args.threads is not None and parser_args.threads < 1:
+        parser.error("value for --threads must be at least 1")
+
+    if parser_args.workers < 1:
+        parser.error("value for --workers must be at least 1")
+
+    # Matrices generated by the scale sweep, by path (or name if not written), so they are not read from files
+    parser_args.generated = {}
+
+    if parser_args.path_a is None and parser_args.scale is None:
+        parser.error("option '--path_a' is required without --scale")
+
+    scale_parameters = dict(parser_args.scale_parameters)
+    if parser_args.scale is not None:
+        if parser_args.path_a is not None or parser_args.path_b is not None:
+            parser.error("options '--path_a' and '--path_b' can't be combined with --scale")
+        for num_rows in parser_args.scale_sizes:
+            reason = check_parameters(num_rows, parser_args.scale_nnz_per_row, scale_parameters)
+            if reason is not None:
+                parser.error(f"{reason} (for {num_rows} rows)")
+
     if parser_args.out is not None and not parser_args.out.endswith(".json"):
         parser.error("output file should be in .json format")
 
     if parser_args.pytorch:
         warnings.filterwarnings("ignore", category=UserWarning)
 
-    # Prepare results dictionary
-    results = {'data': []}
+    # Measure the memory bandwidth of the host once (it is cached per host), so every format's bandwidth can be shown
+    # as a fraction of it
+    bandwidth = host_bandwidth(not parser_args.no_cache, parser_args.cache_dir)
 
-    # Execute benchmarks based on parsed arguments and add results to results dictionary
-    if parser_args.format == "all":
-        for fmt in format_options[:-1]:
-            if parser_args.pytorch and fmt not in ['coo', 'csr', 'csc', 'bsr']:
-                continue
-            parser_args.format = fmt
-            results['data'].append(run_format(parser_args))
+    if parser_args.scale is None:
+        results = run_matrix(parser_args)
+        results['bandwidth'] = bandwidth
+        runs = [results]
     else:
-        if parser_args.pytorch and parser_args.format not in ['coo', 'csr', 'csc', 'bsr']:
-            parser.error("format '{}' is not supported by pytorch".format(parser_args))
-        results['data'].append(run_format(parser_args))
-
-    # Output results as JSON to stdout or defined file
-    if parser_args.out is None:
+        # Generate a matrix of the family for every size, and benchmark the chosen format(s) on it straight from memory,
+        # with matrix B the same as matrix A. Only the matrix of the current size is kept
+        results = {'backend': "pytorch" if parser_args.pytorch else "scipy", 'bandwidth': bandwidth,
+                   'scale': {'family': parser_args.scale, 'nnz_per_row': parser_args.scale_nnz_per_row,
+                             'seed': parser_args.scale_seed, 'parameters': scale_parameters}, 'runs': []}
+        for num_rows in parser_args.scale_sizes:
+            path = matrix_name(parser_args.scale, num_rows, parser_args.scale_nnz_per_row, parser_args.scale_seed,
+                               scale_parameters)
+            parser_args.generated = {}
+            matrix = generate(parser_args.scale, num_rows, nnz_per_row=parser_args.scale_nnz_per_row,
+                              seed=parser_args.scale_seed, **scale_parameters)
+            if parser_args.scale_dir is not None:
+                path = os.path.realpath(os.path.join(parser_args.scale_dir, path))
+                if not os.path.exists(path):
+                    write_matrix(matrix, path, not parser_args.no_cache, parser_args.cache_dir)
+            parser_args.generated[path] = matrix
+            parser_args.path_a = parser_args.path_b = path
+            print(f"benchmarking {path} ({matrix.shape[0]}x{matrix.shape[1]}, {matrix.nnz} non-zero entries)",
+                  file=sys.stderr)
+            run = run_matrix(parser_args)
+            run['rows'], run['nnz'] = matrix.shape[0], matrix.nnz
+            run['matrix_hash'] = cache.matrix_digest(matrix)
+            results['runs'].append(run)
+        runs = [dict(run, bandwidth=bandwidth, scale=results['scale']) for run in results['runs']]
+
+        # Plot the median time of every benchmark against the number of entries, per format
+        os.makedirs(os.path.dirname(os.path.abspath(parser_args.scale_plot)), exist_ok=True)
+        plot_scale(results['runs'], parser_args.scale_plot,
+                   f"{parser_args.scale} matrices ({results['backend']})", scale_label)
+        print(f"saved scale plot to {parser_args.scale_plot}", file=sys.stderr)
+
+    # Append results to the results store, keyed by the content hash of matrix A (of its arrays for the generated
+    # matrices). The matrices of a scale sweep are appended as a single run
+    if parser_args.store is not None:
+        run_id = None
+        for run in runs:
+            matrix_hash = run.pop('matrix_hash', None) or cache.cache_key(run['matrix'], parser_args.cache_dir)
+            run_id = store.append_results(run, matrix_hash, parser_args.store, run_id)
+        print(f"appended run {run_id} to {parser_args.store}", file=sys.stderr)
+
+    # Output results as JSON to stdout or defined file. With a results store, JSON is only written to a defined file
+    if parser_args.out is None and parser_args.store is None:
         print(json.dumps(results, indent=4))
-    else:
+    elif parser_args.out is not None:
         with open(parser_args.out, "w") as write_file:
             json.dump(results, write_file, indent=4)
 except Exception as e:
@@ -1,10 +1,11 @@
 # Measure memory usage of sparse matrices and compare to theoretical requirements
 
-from pympler import asizeof
 import json
 import argparse
 import numpy as np
 from loader import *
+from accounting import footprint, DEFAULT_SAMPLES
+from tuning import index_itemsize, check_dia, DIA_MEMORY_FRACTION
 
 # Check if the script has been imported as a module
 if __name__ != "__main__":
@@ -17,65 +18,114 @@ try:
         format_options = list(dicts['formats_dict'].keys())[:-1]
 
     # Define arguments
-    parser = argparse.ArgumentParser(description="calculates the number of bytes used by each format with the provided matrix (does not support pytorch library)")
+    parser = argparse.ArgumentParser(description="calculates the number of bytes used by each format with the provided matrix")
 
     parser.add_argument("-i", "--input", help="input file, MatrixMarket format", required=True)
     parser.add_argument('-o', '--output', help="CSV file to output result to; if not specified, only prints result to stdout (optional)")
+    parser.add_argument('-p', '--parse', action="store_true",
+                        help="also report the peak memory used by the streaming parser when reading the file directly into CSR (optional)")
+    parser.add_argument('-pt', '--pytorch', action="store_true",
+                        help="measure the PyTorch tensors instead of the SciPy matrices (only coo, csr, csc and bsr formats)")
+    parser.add_argument('-s', '--samples', type=int, default=DEFAULT_SAMPLES,
+                        help="number of rows (LIL) or entries (DOK) sampled to estimate their size (default: %(default)s)")
+    parser.add_argument('--value_dtype', choices=VALUE_DTYPES,
+                        help="store the values in this type; float16 is only supported by ell and sell (default: the type of the file)")
+    parser.add_argument('--index_dtype', choices=INDEX_DTYPES, default="auto",
+                        help="store the indices in this type; formats that can't use it are skipped (default: %(default)s)")
+    parser.add_argument('--dia_max_padding', type=float,
+                        help="also skip DIA if it would store more than this many values per non-zero entry (optional)")
+    parser.add_argument('--dia_max_memory', type=float,
+                        help=f"skip DIA if its layout would take more than this many MB (default: {DIA_MEMORY_FRACTION * 100:.0f}%% of the available memory)")
 
     args = parser.parse_args()
 
     if args.output is not None and not args.output.endswith(".csv"):
         parser.error("input file format should be MatrixMarket, with .mtx extension")
 
+    if args.dia_max_memory is not None and args.dia_max_memory <= 0:
+        parser.error("value for --dia_max_memory must be larger than 0")
+
     # Load matrix and get its basic statistics
     temp_mtx = load_mm_file(args.input, 'coo', False)
     if temp_mtx is None:
         parser.error("unknown input file format")
     nnz = temp_mtx.nnz
-    entry_type = temp_mtx.dtype
+    entry_type = temp_mtx.dtype if args.value_dtype is None else cast_dtype(temp_mtx.dtype, args.value_dtype)
     entry_size = entry_type.itemsize
     base_bytes = nnz * entry_size
     print(f"Number of non-zero entries in matrix is {nnz}. The type is {entry_type} with size {entry_size} bytes.\n"
           f"The non-zero entries require {base_bytes} bytes.")
 
+    # Parse file directly into CSR with the streaming reader, measuring the peak memory of the parse
+    if args.parse:
+        parse_stats = {}
+        read_mm_streaming(args.input, "csr", stats=parse_stats)
+        print(f"\nStreaming parse into CSR took {parse_stats['seconds']:.3f} seconds. Peak memory was "
+              f"{parse_stats['peak_bytes']} bytes, for a final CSR size of {parse_stats['final_bytes']} bytes "
+              f"({parse_stats['peak_bytes'] / parse_stats['final_bytes']:.2f}x).")
+
     # Prepare results table
     num_rows = temp_mtx.shape[0]
     num_cols = temp_mtx.shape[1]
+    # The theoretical sizes use the chosen index type, or the one SciPy picks for the matrix
+    index_size = index_itemsize(num_rows, num_cols, nnz) if args.index_dtype == "auto" \
+        else np.dtype(args.index_dtype).itemsize
+    value_size = entry_size
     print("\nMemory usage:")
-    results = [["Format", "Theoretical Size (bytes)", "Actual Size (bytes)", "Overhead Ratio (percent)", "Overhead to Base (percent)"],
-               ["Base", str(base_bytes), str(base_bytes), "0", "0"]]
+    results = [["Format", "Theoretical Size (bytes)", "Actual Size (bytes)", "Estimate 95% CI (+/- bytes)", "Index Type",
+                "Value Type", "Overhead Ratio (percent)", "Overhead to Base (percent)"],
+               ["Base", str(base_bytes), str(base_bytes), "0", "-", str(entry_type), "0", "0"]]
     for fmt in format_options:
-        # Load matrix in different formats
-        mtx = load_mm_file(args.input, fmt, False)
-        if mtx is None:
-            parser.error("input file format should be MatrixMarket, with .mtx extension")
+        if args.pytorch and fmt not in ['coo', 'csr', 'csc', 'bsr']:
+            continue
+        reason = check_dtypes(temp_mtx, fmt, args.pytorch, args.value_dtype, args.index_dtype)
+        if reason is not None:
+            print(f"Skipping format '{fmt}': {reason}")
+            continue
+        # Converting to DIA can take far more memory than the matrix itself, so it is checked first, like in main.py
+        if fmt == "dia":
+            estimate = check_dia(temp_mtx, args.dia_max_padding,
+                                 None if args.dia_max_memory is None else args.dia_max_memory * 1024 ** 2)
+            if not estimate['feasible']:
+                print(f"Skipping format '{fmt}': {estimate['reason']}")
+                continue
+        # Convert the loaded matrix to the different formats
+        mtx = convert_matrix(temp_mtx, fmt, args.pytorch, None, args.value_dtype, args.index_dtype)
 
         # Calculate theoretically required amount of memory for the matrix in a particular format
         new_result = [fmt.upper()]
         theoretical_size = -1
         if fmt == "coo":
-            theoretical_size = nnz * 4 * 2 + nnz * 8
+            theoretical_size = nnz * index_size * 2 + nnz * value_size
         elif fmt == "csr":
-            theoretical_size = (num_rows + 1) * 4 + nnz * 4 + nnz * 8
+            theoretical_size = (num_rows + 1) * index_size + nnz * index_size + nnz * value_size
         elif fmt == "csc":
-            theoretical_size = (num_cols + 1) * 4 + nnz * 4 + nnz * 8
+            theoretical_size = (num_cols + 1) * index_size + nnz * index_size + nnz * value_size
         elif fmt == "dia":  # Calculation assumes naive layout without optimizations. Real result is optimized, which results in this being larger than final result
             num_diagonals = mtx.data.shape[0]
-            theoretical_size = num_diagonals * 4 + num_diagonals * num_rows * 8
+            theoretical_size = num_diagonals * index_size + num_diagonals * num_rows * value_size
         elif fmt == "bsr":
-            num_blocks = mtx.indices.size
-            block_size = mtx.blocksize
-            theoretical_size = num_blocks * (block_size[0] * block_size[1]) * 8 + num_blocks * 4 + (
-                    int(num_rows / block_size[0]) + 1) * 4
+            num_blocks = mtx.col_indices().numel() if args.pytorch else mtx.indices.size
+            block_size = tuple(mtx.values().shape[1:]) if args.pytorch else mtx.blocksize
+            theoretical_size = num_blocks * (block_size[0] * block_size[1]) * value_size + num_blocks * index_size + (
+                    int(num_rows / block_size[0]) + 1) * index_size
         elif fmt == "lil":
-            theoretical_size = nnz * 4 + nnz * 8
+            theoretical_size = nnz * index_size + nnz * value_size
         elif fmt == "dok":
-            theoretical_size = nnz * 2 * 4 + nnz * 8  # This excludes dict structure overhead
+            theoretical_size = nnz * 2 * index_size + nnz * value_size  # This excludes dict structure overhead
+        elif fmt == "ell":  # Every row is padded to the length of the longest row
+            theoretical_size = mtx.stored * index_size + mtx.stored * value_size
+        elif fmt == "sell":  # Every row is padded to the length of the longest row of its chunk, plus the row permutation
+            theoretical_size = mtx.stored * index_size + mtx.stored * value_size + num_rows * index_size
         new_result.append(str(theoretical_size))
 
-        # Measure loaded matrix size
-        actual_size = asizeof.asizeof(mtx)
+        # Measure converted matrix size, exactly for array-backed formats, estimated from a sample for LIL and DOK
+        size = footprint(mtx, args.samples)
+        actual_size = size['bytes']
         new_result.append(str(actual_size))
+        new_result.append(str(size['error_bytes']))
+        new_result.append(str(size['index_dtype']))
+        new_result.append(size['value_dtype'])
 
         overhead_ratio = ((actual_size - theoretical_size) / theoretical_size) * 100
         new_result.append(f"{overhead_ratio:.2f}")
@@ -0,0 +1,92 @@
+# Script measuring the MatrixMarket parse throughput of the loader, for an increasing number of worker processes
+
+import os
+import argparse
+import tempfile
+import statistics as st
+import numpy as np
+
+from loader import read_mm_header, read_mm_streaming, MM_CHUNK_SIZE
+from benchmark import benchmark
+
+SYNTHETIC_CHUNK = 1000000  # Number of entries written to the synthetic file at once
+
+
+# Writes a random general real MatrixMarket file with the given dimension and number of entries
+def write_synthetic_file(file_path, size, nnz, seed=0):
+    rng = np.random.default_rng(seed)
+    with open(file_path, "w") as file:
+        file.write("%%MatrixMarket matrix coordinate real general\n")
+        file.write(f"{size} {size} {nnz}\n")
+        written = 0
+        while written < nnz:
+            count = min(SYNTHETIC_CHUNK, nnz - written)
+            entries = np.column_stack((rng.integers(1, size + 1, count), rng.integers(1, size + 1, count),
+                                       rng.random(count)))
+            np.savetxt(file, entries, fmt="%d %d %.16g")
+            written += count
+
+
+# Check if the script has been imported as a module
+if __name__ != "__main__":
+    raise ImportError("This script cannot be imported as a module")
+
+try:
+    # Define arguments
+    parser = argparse.ArgumentParser(description="measures the MatrixMarket parse throughput (MB/s) for different numbers of worker processes")
+
+    parser.add_argument("-f", "--file", help="path to MatrixMarket file(s) (multiple possible)", nargs='+', default=[])
+    parser.add_argument("-w", "--workers", type=int, nargs='+', default=[1, 2, 4, 8],
+                        help="worker counts to measure (default: 1 2 4 8)")
+    parser.add_argument("-b", "--benchmark", type=int, default=3,
+                        help="number of times to parse every file per worker count (default: 3)")
+    parser.add_argument("-s", "--synthetic", type=int, metavar="NNZ",
+                        help="also measure a generated random matrix with NNZ entries (optional)")
+    parser.add_argument("-o", "--output", help="CSV file to output result to; if not specified, only prints result to stdout (optional)")
+
+    args = parser.parse_args()
+
+    if args.output is not None and not args.output.endswith(".csv"):
+        parser.error("output file should be in .csv format")
+    if not args.file and args.synthetic is None:
+        parser.error("provide at least one file with --file, or a synthetic matrix with --synthetic")
+
+    files = list(args.file)
+    temp_dir = None
+    if args.synthetic is not None:
+        temp_dir = tempfile.TemporaryDirectory()
+        synthetic_path = os.path.join(temp_dir.name, "synthetic.mtx")
+        synthetic_size = max(1, int(np.sqrt(args.synthetic * 100)))  # Roughly 100 entries per row on average
+        print(f"Generating synthetic matrix with {args.synthetic} entries...")
+        write_synthetic_file(synthetic_path, synthetic_size, args.synthetic)
+        files.append(synthetic_path)
+
+    # Parse every file with every worker count, using the median time for the throughput
+    results = [["File", "Size (MB)", "Workers", "Median Time (s)", "Throughput (MB/s)", "Speedup"]]
+    for file_path in files:
+        header = read_mm_header(file_path)
+        size_mb = (os.path.getsize(file_path) - header['offset']) / 1024 ** 2
+        base_time = None
+        for workers in args.workers:
+            times = benchmark(read_mm_streaming, file_path, "coo", MM_CHUNK_SIZE, None, workers, reps=args.benchmark)
+            median_time = st.median(times)
+            if base_time is None:
+                base_time = median_time
+            results.append([os.path.basename(file_path), f"{size_mb:.2f}", str(workers), f"{median_time:.4f}",
+                            f"{size_mb / median_time:.2f}", f"{base_time / median_time:.2f}"])
+
+    if temp_dir is not None:
+        temp_dir.cleanup()
+
+    # Style and print table to stdout
+    col_widths = [max(len(item) for item in col) for col in zip(*results)]
+    for res in results:
+        print("    ".join(f"{item.ljust(width)}" for item, width in zip(res, col_widths)))
+
+    # If location provided, output table to file (CSV)
+    if args.output is not None:
+        arr = np.array(results)
+        np.savetxt(args.output, arr, fmt='%s', delimiter=', ')
+except Exception as e:
+    print(e)
+    exit(1)
@@ -0,0 +1,111 @@
+# Script implementing the symbolic/numeric split of add, sub and SpGEMM for matrices whose values change while their
+# sparsity pattern stays the same (e.g. time-stepping). The symbolic phase calculates the structure of the output
+# (indptr and indices) once, along with the maps from the entries of the operands to the entries of the output. The
+# numeric phase then only combines the data arrays of the operands into the preallocated output
+import numpy as np
+from scipy.sparse import csr_matrix
+
+PLAN_FORMATS = ['csr', 'csc']  # Formats with a symbolic/numeric split; CSC is planned as the CSR matrix of its transpose
+PLAN_MODES = ['add', 'sub', 'mmm']
+PLAN_CHUNK = 2 ** 20  # Number of products of the numeric phase of SpGEMM calculated at once
+
+
+# Get the CSR matrix whose rows are the compressed axis of the matrix: the matrix itself for CSR, its transpose (a view
+# sharing the arrays) for CSC. The matrix is not modified: the maps of a plan point from every stored entry, in the
+# order of the data array, so duplicate and unsorted entries are accumulated by the numeric phase instead
+def compressed_rows(mtx):
+    return mtx if mtx.format == "csr" else mtx.T
+
+
+# Calculates the keys (row * number of columns + column) of the entries of a CSR matrix
+def entry_keys(csr):
+    rows = np.repeat(np.arange(csr.shape[0], dtype=np.int64), np.diff(csr.indptr))
+    return rows * csr.shape[1] + csr.indices
+
+
+# Get the smallest index type of the maps of a plan with indices up to the size
+def map_dtype(size):
+    return np.int32 if size < 2 ** 31 else np.int64
+
+
+# Builds the output matrix of a plan from the sorted keys of its entries, with zeroed data of the dtype
+def output_matrix(keys, shape, dtype):
+    indptr = np.zeros(shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(keys // shape[1], minlength=shape[0]), out=indptr[1:])
+    index_dtype = map_dtype(max(shape[0], shape[1], keys.size))
+    return csr_matrix((np.zeros(keys.size, dtype=dtype), (keys % shape[1]).astype(index_dtype),
+                       indptr.astype(index_dtype)), shape=shape)
+
+
+# Symbolic phase of A + B and A - B: the output pattern is the union of both patterns, and every entry of A and B is
+# mapped to its position in the output
+def addition_plan(mtx_a, mtx_b):
+    a, b = compressed_rows(mtx_a), compressed_rows(mtx_b)
+    keys_a, keys_b = entry_keys(a), entry_keys(b)
+    keys = np.union1d(keys_a, keys_b)
+    output = output_matrix(keys, a.shape, np.result_type(a.dtype, b.dtype))
+    return {'mode': "add", 'transposed': mtx_a.format == "csc", 'output': output,
+            'map_a': np.searchsorted(keys, keys_a).astype(map_dtype(keys.size)),
+            'map_b': np.searchsorted(keys, keys_b).astype(map_dtype(keys.size))}
+
+
+# Symbolic phase of A @ B: every product a_ij * b_jk contributing to the output is listed as the positions of a_ij in A
+# and b_jk in B, and the position of c_ik in the output it is scattered to, in the order of the entries of A. The numeric
+# phase calculates the products in chunks of PLAN_CHUNK into the buffers of the plan, so its only allocations are made
+# here. For CSC, (A @ B)^T = B^T @ A^T is planned instead
+def multiplication_plan(mtx_a, mtx_b):
+    transposed = mtx_a.format == "csc"
+    a, b = compressed_rows(mtx_a), compressed_rows(mtx_b)
+    if transposed:
+        a, b = b, a
+
+    # Every entry a_ij is multiplied with all entries of row j of B
+    counts = np.diff(b.indptr)[a.indices]
+    total = int(counts.sum())
+    offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(counts) - counts, counts)
+    positions_b = np.repeat(b.indptr[:-1][a.indices].astype(np.int64), counts) + offsets
+
+    rows = np.repeat(np.repeat(np.arange(a.shape[0], dtype=np.int64), np.diff(a.indptr)), counts)
+    keys, targets = np.unique(rows * b.shape[1] + b.indices[positions_b], return_inverse=True)
+    output = output_matrix(keys, (a.shape[0], b.shape[1]), np.result_type(a.dtype, b.dtype))
+    positions_a = np.repeat(np.arange(a.indices.size, dtype=map_dtype(a.indices.size)), counts)
+    chunk = max(1, min(total, PLAN_CHUNK))
+    buffers = [np.empty(chunk, dtype=a.dtype), np.empty(chunk, dtype=b.dtype), np.empty(chunk, dtype=output.dtype)]
+    return {'mode': "mmm", 'transposed': transposed, 'output': output, 'positions_a': positions_a,
+            'positions_b': positions_b.astype(map_dtype(b.indices.size)),
+            'targets': targets.ravel().astype(map_dtype(keys.size)), 'buffers': buffers}
+
+
+# Symbolic phase of the mode: calculates the structure of the output and the maps from the operands to the output
+def mtx_plan(mode, mtx_a, mtx_b):
+    if mode in ["add", "sub"]:
+        plan = addition_plan(mtx_a, mtx_b)
+        plan['mode'] = mode
+        return plan
+    elif mode == "mmm":
+        return multiplication_plan(mtx_a, mtx_b)
+    raise ValueError(f"mode '{mode}' has no symbolic/numeric split")
+
+
+# Numeric phase of the plan: combines the data of the operands, which must have the patterns the plan was made for, into
+# the data of the preallocated output, scattering every entry (product) to its position with an unbuffered add, so no
+# temporary arrays are allocated. Returns the output, which is overwritten by the next call
+def mtx_plan_execute(plan, mtx_a, mtx_b):
+    data = plan['output'].data
+    data.fill(0)
+    if plan['mode'] == "mmm":
+        data_a, data_b = (mtx_b.data, mtx_a.data) if plan['transposed'] else (mtx_a.data, mtx_b.data)
+        values_a, values_b, products = plan['buffers']
+        for start in range(0, plan['targets'].size, products.size):
+            size = min(products.size, plan['targets'].size - start)
+            np.take(data_a, plan['positions_a'][start:start + size], out=values_a[:size], mode='clip')
+            np.take(data_b, plan['positions_b'][start:start + size], out=values_b[:size], mode='clip')
+            np.multiply(values_a[:size], values_b[:size], out=products[:size])
+            np.add.at(data, plan['targets'][start:start + size], products[:size])
+    else:
+        np.add.at(data, plan['map_a'], mtx_a.data)
+        if plan['mode'] == "add":
+            np.add.at(data, plan['map_b'], mtx_b.data)
+        else:
+            np.subtract.at(data, plan['map_b'], mtx_b.data)
+    return plan['output'].T if plan['transposed'] else plan['output']
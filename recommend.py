@@ -0,0 +1,172 @@
+# Script predicting the fastest format per mode for a matrix, from the results of earlier sweeps over other matrices
+# The prediction takes the matrices with the most similar structural features (see features.py) and picks the format
+# with the lowest time relative to the fastest format on those matrices. Can be imported to pick a format in other code
+import os
+import glob
+import json
+import argparse
+import statistics as st
+import numpy as np
+
+import cache
+from features import matrix_features
+
+DEFAULT_NEIGHBOURS = 3
+BACKENDS = ['scipy', 'pytorch']
+
+
+# Converts the structural features into the vector compared between matrices. Counts and sizes are compared on a log
+# scale, so matrices of the same structure but different sizes are close
+def feature_vector(features):
+    size = max(features['rows'], features['cols'], 1)
+    vector = [
+        np.log10(max(features['nnz'], 1)),
+        np.log10(max(features['density'], 1e-12)),
+        np.log10(max(features['rows'], 1) / max(features['cols'], 1)),
+        features['row_nnz']['cv'],
+        np.log10(max(features['row_nnz']['max'], 1) / max(features['row_nnz']['mean'], 1)),
+        features['row_nnz']['empty_rows'],
+        np.log10(max(features['diagonals']['count'], 1) / size),
+        features['diagonals']['fill'],
+        features['bandwidth'] / size,
+        features['symmetry']['pattern']
+    ]
+    vector += [features['block_fill'][block_size] for block_size in sorted(features['block_fill'], key=int)]
+    return np.array(vector, dtype=np.float64)
+
+
+# Get the name of the benchmarked mode, including the number of right-hand side vectors for spmm
+def mode_key(res):
+    return f"{res['mode']} (k={res['k']})" if 'k' in res else res['mode']
+
+
+# Loads the results of earlier runs (JSON files of sweep.py or main.py, or folders containing them). Returns, per
+# matrix and backend, the structural features of the matrix and the median time per mode and format. Result files
+# without the path of their matrix are skipped
+def load_training_data(inputs, use_cache=True, cache_dir=cache.DEFAULT_CACHE_DIR):
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            paths += glob.glob(os.path.join(item, "**", "*.json"), recursive=True)
+        else:
+            paths += glob.glob(item)
+
+    training = []
+    for path in sorted(set(paths)):
+        with open(path, "r") as read_file:
+            data = json.load(read_file)
+        if not isinstance(data, dict) or 'data' not in data:
+            continue
+        features = data.get('features')
+        if features is None:
+            if data.get('matrix') is None or not os.path.exists(data['matrix']):
+                print(f"warning: skipping {path}, its matrix is unknown")
+                continue
+            features = matrix_features(data['matrix'], use_cache, cache_dir)
+
+        times = {}
+        for fmt in data['data']:
+            for res in fmt['results']:
+                # The fastest format to convert to is not a meaningful recommendation, and only the default
+                # (single-threaded, one-shot, allocating) runs are comparable between all formats
+                if res['mode'] == "conv" or res.get('threads', 1) != 1 or res.get('reuse_pattern') or res.get('inplace'):
+                    continue
+                times.setdefault(mode_key(res), {})[fmt['format']] = st.median(res['time'])
+
+        backend = data.get('backend', "pytorch" if path.endswith("_pt.json") else "scipy")
+        training.append({'matrix': data.get('matrix', path), 'backend': backend, 'features': features,
+                         'times': times})
+    return training
+
+
+# Predicts the fastest format per mode for the features of a matrix. For every mode, the 'neighbours' most similar
+# matrices for which the mode was benchmarked are selected, and every format is scored with its mean slowdown relative
+# to the fastest format on those matrices. Only formats benchmarked on all of these matrices are considered
+def predict(features, training, neighbours=DEFAULT_NEIGHBOURS):
+    if not training:
+        return {}
+
+    # Standardize every feature over the training matrices, so all features weigh equally in the distance
+    vectors = np.array([feature_vector(sample['features']) for sample in training])
+    mean = vectors.mean(axis=0)
+    std = vectors.std(axis=0)
+    std[std == 0] = 1
+    distances = np.linalg.norm((vectors - mean) / std - (feature_vector(features) - mean) / std, axis=1)
+
+    modes = sorted({mode for sample in training for mode in sample['times']})
+    predictions = {}
+    for mode in modes:
+        candidates = [i for i in np.argsort(distances, kind='stable') if mode in training[i]['times']][:neighbours]
+        formats = set.intersection(*(set(training[i]['times'][mode]) for i in candidates))
+        if not formats:
+            continue
+
+        slowdowns = {fmt: [] for fmt in formats}
+        for i in candidates:
+            times = training[i]['times'][mode]
+            fastest = min(times[fmt] for fmt in formats)
+            for fmt in formats:
+                slowdowns[fmt].append(times[fmt] / fastest if fastest > 0 else 1.0)
+
+        ranking = sorted((float(np.mean(values)), fmt) for fmt, values in slowdowns.items())
+        predictions[mode] = {'format': ranking[0][1], 'slowdowns': {fmt: score for score, fmt in ranking},
+                             'neighbours': [training[i]['matrix'] for i in candidates],
+                             'distances': [float(distances[i]) for i in candidates]}
+    return predictions
+
+
+# Recommends the fastest format per mode for a MatrixMarket file, based on the results of earlier runs on the backend
+def recommend(file_path, results, backend="scipy", neighbours=DEFAULT_NEIGHBOURS, use_cache=True,
+              cache_dir=cache.DEFAULT_CACHE_DIR):
+    features = matrix_features(file_path, use_cache, cache_dir)
+    training = [sample for sample in load_training_data(results, use_cache, cache_dir) if sample['backend'] == backend]
+    return predict(features, training, neighbours)
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(description="recommends the fastest format per mode for a matrix, based on the results of earlier runs on structurally similar matrices")
+
+        parser.add_argument("-i", "--input", required=True, help="MatrixMarket file to recommend formats for (required)")
+        parser.add_argument("-r", "--results", nargs='+', default=["./sweep_results"],
+                            help="result JSON files or folders of earlier runs (default: ./sweep_results)")
+        parser.add_argument("--backend", choices=BACKENDS, default="scipy", help="backend to recommend formats for (default: %(default)s)")
+        parser.add_argument("-k", "--neighbours", type=int, default=DEFAULT_NEIGHBOURS,
+                            help="number of most similar matrices to base every recommendation on (default: %(default)s)")
+        parser.add_argument("--features", action="store_true", help="also print the structural features of the matrix")
+        parser.add_argument("--cache_dir", default=cache.DEFAULT_CACHE_DIR,
+                            help="directory of the binary matrix cache, which also holds the extracted features (default: %(default)s)")
+        parser.add_argument("--no_cache", action="store_true", help="always parse the matrices and extract their features")
+        parser.add_argument("-o", "--output", help="JSON file to output the recommendations to (optional)")
+
+        args = parser.parse_args()
+
+        if args.neighbours < 1:
+            parser.error("value for --neighbours must be at least 1")
+
+        if args.features:
+            print(json.dumps(matrix_features(args.input, not args.no_cache, args.cache_dir), indent=4))
+
+        recommendations = recommend(args.input, args.results, args.backend, args.neighbours, not args.no_cache,
+                                    args.cache_dir)
+        if not recommendations:
+            parser.exit(1, "no usable results found\n")
+
+        # Style and print table to stdout
+        table = [["Mode", "Format", "Runner-up", "Runner-up Slowdown", "Most Similar Matrix"]]
+        for mode, prediction in recommendations.items():
+            ranking = list(prediction['slowdowns'].items())
+            runner_up = ranking[1] if len(ranking) > 1 else ("-", None)
+            table.append([mode, prediction['format'].upper(), runner_up[0].upper(),
+                          "-" if runner_up[1] is None else f"{runner_up[1]:.2f}x",
+                          os.path.basename(prediction['neighbours'][0])])
+        col_widths = [max(len(item) for item in col) for col in zip(*table)]
+        for row in table:
+            print("    ".join(f"{item.ljust(width)}" for item, width in zip(row, col_widths)))
+
+        if args.output is not None:
+            with open(args.output, "w") as write_file:
+                json.dump(recommendations, write_file, indent=4)
+    except Exception as e:
+        print(e)
+        exit(1)
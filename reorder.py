@@ -0,0 +1,89 @@
+# Script responsible for reordering the rows and columns of sparse matrices before they are benchmarked
+# A bandwidth-reducing reordering keeps the entries of a row close to the diagonal, which improves the locality of the
+# vector accesses in SpMV and SpGEMM. Square matrices are permuted symmetrically (the same permutation for rows and
+# columns), rectangular matrices get separate row and column permutations
+import time
+import numpy as np
+from scipy.sparse import coo_matrix, bmat
+from scipy.sparse.csgraph import reverse_cuthill_mckee
+
+REORDER_METHODS = ['none', 'rcm', 'degree', 'random']
+
+
+# Calculates the bandwidth (largest distance of an entry to the diagonal) and the mean distance to the diagonal
+def bandwidth(matrix):
+    coo = matrix.tocoo()
+    distance = np.abs(coo.col.astype(np.int64) - coo.row)
+    return int(distance.max(initial=0)), float(distance.mean()) if coo.nnz else 0.0
+
+
+# Calculates the reverse Cuthill-McKee ordering. For rectangular matrices, the ordering is calculated on the bipartite
+# graph of the rows and columns, and split into a row and a column permutation
+def rcm_permutation(matrix):
+    num_rows, num_cols = matrix.shape
+    if num_rows == num_cols:
+        order = reverse_cuthill_mckee(matrix.tocsr(), symmetric_mode=False)
+        return order, order
+    graph = bmat([[None, matrix], [matrix.T, None]], format='csr')
+    order = reverse_cuthill_mckee(graph, symmetric_mode=True)
+    return order[order < num_rows], order[order >= num_rows] - num_rows
+
+
+# Orders the rows by their number of non-zero entries, from most to least (stable, so equal rows keep their order)
+def degree_permutation(matrix):
+    num_rows, num_cols = matrix.shape
+    counts = np.bincount(matrix.tocoo().row, minlength=num_rows)
+    order = np.argsort(-counts, kind='stable')
+    return order, order if num_rows == num_cols else np.arange(num_cols)
+
+
+def random_permutation(matrix, seed=0):
+    num_rows, num_cols = matrix.shape
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(num_rows)
+    return order, order if num_rows == num_cols else rng.permutation(num_cols)
+
+
+# Calculates the row and column permutation of the reordering method. Returns None for method 'none'
+def reorder_permutation(matrix, method, seed=0):
+    if method == "none":
+        return None
+    elif method == "rcm":
+        return rcm_permutation(matrix)
+    elif method == "degree":
+        return degree_permutation(matrix)
+    elif method == "random":
+        return random_permutation(matrix, seed)
+    raise ValueError(f"unknown reordering method '{method}'")
+
+
+# Applies the permutation to the matrix, returning a COO matrix in which row i is row permutation[0][i] of the matrix,
+# and column j is column permutation[1][j]
+def apply_permutation(matrix, permutation):
+    coo = matrix.tocoo()
+    row_order, col_order = permutation
+    inverse_rows = np.empty_like(row_order)
+    inverse_rows[row_order] = np.arange(row_order.size, dtype=row_order.dtype)
+    inverse_cols = np.empty_like(col_order)
+    inverse_cols[col_order] = np.arange(col_order.size, dtype=col_order.dtype)
+    return coo_matrix((coo.data, (inverse_rows[coo.row], inverse_cols[coo.col])), shape=coo.shape)
+
+
+# Reorders the matrix with the method, returning the permutation, the reordered COO matrix and the statistics of the
+# reordering: the time spent calculating and applying the permutation, and the bandwidth before and after
+def reorder_matrix(matrix, method, seed=0):
+    bandwidth_before, distance_before = bandwidth(matrix)
+    start = time.perf_counter()
+    permutation = reorder_permutation(matrix, method, seed)
+    permutation_time = time.perf_counter() - start
+    if permutation is None:
+        reordered = matrix
+    else:
+        reordered = apply_permutation(matrix, permutation)
+    apply_time = time.perf_counter() - start - permutation_time
+    bandwidth_after, distance_after = bandwidth(reordered)
+
+    stats = {'method': method, 'permutation_time': permutation_time, 'apply_time': apply_time,
+             'bandwidth_before': bandwidth_before, 'bandwidth_after': bandwidth_after,
+             'mean_distance_before': distance_before, 'mean_distance_after': distance_after}
+    return permutation, reordered, stats
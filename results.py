@@ -9,6 +9,8 @@ import statistics as st
 import numpy as np
 from math import ceil
 
+import store
+
 matplotlib.use('Agg')
 
 
@@ -20,6 +22,286 @@ def format_float(value):
         return value
 
 
+# Get the name of the benchmarked mode, including the number of right-hand side vectors for spmm and the number of
+# threads of the strong-scaling benchmark
+def mode_label(res, dicts, threads=True):
+    return store.variant_label(dicts['modes_dict'][res['mode']], res, threads)
+
+
+# Get the label of a result in the plots, including the number of right-hand side vectors for spmm, the source format
+# for conv and the number of threads of the strong-scaling benchmark
+def result_label(fmt, res):
+    return store.variant_label(fmt.upper(), res)
+
+
+# Get the outcome of the verification of the result against SciPy's CSR (see --verify of main.py): "yes" if it matched,
+# "MISMATCH" if it did not, and "-" if it was not verified
+def verification_label(res):
+    if 'verification' not in res:
+        return "-"
+    return "yes" if res['verification']['passed'] else "MISMATCH"
+
+
+# Collect the samples of all results as columns: the format, benchmark and verification labels of every result, its
+# samples (in seconds) and its number of samples
+def sample_columns(data, dicts, suffix=""):
+    labels, times, counts = [], [], []
+    for fmt in data['data']:
+        for res in fmt['results']:
+            labels.append([f"{fmt['format'].upper()}{suffix}", mode_label(res, dicts), verification_label(res)])
+            times.append(np.asarray(res['time'], dtype=np.float64))
+            counts.append(len(res['time']))
+    return labels, times, counts
+
+
+# Calculates the quantile i/n of every group of the sorted samples, with the 'exclusive' method of statistics.quantiles
+def grouped_quantile(ordered, starts, counts, i, n=4):
+    positions = i * (counts + 1)
+    j = np.clip(positions // n, 1, np.maximum(counts - 1, 1))
+    delta = positions - j * n
+    low = ordered[starts + j - 1]
+    high = ordered[np.minimum(starts + j, ordered.size - 1)]
+    return np.where(counts > 1, (low * (n - delta) + high * delta) / n, low)
+
+
+# Calculates the statistics of the samples of all results at once, with grouped NumPy operations on the concatenated
+# samples and the number of samples per result. Returns per result: the minimum, the quartiles, the maximum, the
+# (sample) standard deviation, the mean, the (sample) variance and the range. The standard deviation and variance of
+# a single sample are NaN
+def grouped_stats(times, counts):
+    starts = np.r_[0, np.cumsum(counts)[:-1]]
+    groups = np.repeat(np.arange(counts.size), counts)
+    ordered = times[np.lexsort((times, groups))]
+    minimum = ordered[starts]
+    maximum = ordered[starts + counts - 1]
+    mean = np.bincount(groups, times, counts.size) / counts
+    with np.errstate(divide='ignore', invalid='ignore'):
+        variance = np.bincount(groups, (times - mean[groups]) ** 2, counts.size) / (counts - 1)
+    variance[counts < 2] = np.nan
+    quartiles = [grouped_quantile(ordered, starts, counts, i) for i in [1, 2, 3]]
+    return np.column_stack([minimum, *quartiles, maximum, np.sqrt(variance), mean, variance, maximum - minimum])
+
+
+# Check if the result is a run of the default implementation of the mode: single-threaded (not part of the
+# strong-scaling benchmark, or its run on a single thread), not the numeric phase of a reused pattern and allocating
+def default_run(res):
+    return res.get('threads', 1) == 1 and not res.get('reuse_pattern') and not res.get('inplace')
+
+
+# Compare the results of a run on the reordered matrix to the results of a run on the original matrix. Per format and
+# benchmark, the speedup from reordering is compared to the speedup from switching to the fastest format of the
+# original run, to show which of the two helps more
+def reorder_speedups(data, reordered, dicts, suffix=""):
+    original = {}
+    for fmt in data['data']:
+        for res in fmt['results']:
+            original[(fmt['format'], mode_label(res, dicts))] = st.median(res['time'])
+
+    rows = []
+    for fmt in reordered['data']:
+        for res in fmt['results']:
+            # Conversions to different formats can't be compared with each other
+            if res['mode'] == "conv":
+                continue
+            label = mode_label(res, dicts)
+            original_median = original.get((fmt['format'], label))
+            if original_median is None:
+                continue
+            reordered_median = st.median(res['time'])
+            best_format, best_median = min(((f, t) for (f, l), t in original.items() if l == label),
+                                           key=lambda x: x[1])
+            reorder_speedup = original_median / reordered_median
+            format_speedup = original_median / best_median
+            rows.append([f"{fmt['format'].upper()}{suffix}", label, original_median * 1000, reordered_median * 1000,
+                         reorder_speedup, best_format.upper(), format_speedup,
+                         "reordering" if reorder_speedup > format_speedup else "format switch"])
+    return rows
+
+
+# Get the peak memory of a result in bytes: the largest of the tracemalloc peak and the RSS peak, as PyTorch allocations
+# only show up in the latter. Returns None if the memory use was not measured
+def peak_memory(res):
+    peaks = [res[key] for key in ['peak_bytes', 'rss_peak_bytes'] if res.get(key) is not None]
+    return max(peaks) if peaks else None
+
+
+# Calculate, per format, how much faster multiplying with a block of k vectors (spmm) is than k separate SpMVs (mvm)
+def spmm_speedups(data, suffix=""):
+    rows = []
+    for fmt in data['data']:
+        mvm_times = [res['time'] for res in fmt['results'] if res['mode'] == "mvm" and default_run(res)]
+        if not mvm_times:
+            continue
+        mvm_median = st.median(mvm_times[0])
+        for res in fmt['results']:
+            if res['mode'] != "spmm" or not default_run(res):
+                continue
+            spmm_median = st.median(res['time'])
+            rows.append([f"{fmt['format'].upper()}{suffix}", str(res['k']), mvm_median * 1000, spmm_median * 1000,
+                         spmm_median / res['k'] * 1000, res['k'] * mvm_median / spmm_median])
+    return rows
+
+
+# Calculate, per format and mode benchmarked with --reuse_pattern, the cost of the symbolic phase, the speedup of the
+# numeric phase over the one-shot operation, and after how many calls the symbolic phase pays for itself
+def reuse_speedups(data, dicts):
+    one_shot = {}
+    for fmt in data['data']:
+        for res in fmt['results']:
+            if default_run(res):
+                one_shot[(fmt['format'], res['mode'])] = st.median(res['time'])
+
+    rows = []
+    for fmt in data['data']:
+        for res in fmt['results']:
+            one_shot_median = one_shot.get((fmt['format'], res['mode']))
+            if not res.get('reuse_pattern') or one_shot_median is None:
+                continue
+            symbolic = st.median(res['symbolic_time'])
+            numeric = st.median(res['time'])
+            break_even = "never" if numeric >= one_shot_median else str(ceil(symbolic / (one_shot_median - numeric)))
+            rows.append([fmt['format'].upper(), dicts['modes_dict'][res['mode']], symbolic * 1000, numeric * 1000,
+                         one_shot_median * 1000, f"{one_shot_median / numeric:.2f}", break_even])
+    return rows
+
+
+# Calculate, per format and benchmark run with --inplace, how much of the time of the allocating operation is spent on
+# allocating its output, from the difference with the allocation-free variant
+def allocation_overhead(data, dicts, suffix=""):
+    allocating = {}
+    for fmt in data['data']:
+        for res in fmt['results']:
+            if default_run(res):
+                allocating[(fmt['format'], mode_label(res, dicts))] = st.median(res['time'])
+
+    rows = []
+    for fmt in data['data']:
+        for res in fmt['results']:
+            if not res.get('inplace'):
+                continue
+            label = mode_label(dict(res, inplace=False), dicts)
+            allocating_median = allocating.get((fmt['format'], label))
+            if allocating_median is None:
+                continue
+            inplace_median = st.median(res['time'])
+            rows.append([f"{fmt['format'].upper()}{suffix}", label, allocating_median * 1000, inplace_median * 1000,
+                         f"{(allocating_median - inplace_median) / allocating_median * 100:.1f}"])
+    return rows
+
+
+# Calculate the strong scaling of the benchmarks run on multiple numbers of threads: per format and benchmark, the
+# speedup over the run with the fewest threads (normally 1), and the parallel efficiency (speedup per added thread)
+def strong_scaling(data, dicts, suffix=""):
+    runs = {}
+    for fmt in data['data']:
+        for res in fmt['results']:
+            if 'threads' in res:
+                key = (fmt['format'], mode_label(res, dicts, threads=False))
+                runs.setdefault(key, []).append((res['threads'], st.median(res['time'])))
+
+    rows = []
+    for (fmt, label), times in runs.items():
+        base_threads, base_median = min(times)
+        for threads, median in sorted(times):
+            speedup = base_median / median
+            rows.append([f"{fmt.upper()}{suffix}", label, str(threads), median * 1000, f"{speedup:.2f}",
+                         f"{speedup * base_threads / threads * 100:.1f}"])
+    return rows
+
+
+# Calculate, per ELLPACK format, how many padding values its layout stores and how much faster its SpMV and transposed
+# SpMV are than those of CSR
+def ellpack_speedups(data):
+    medians = {}
+    for fmt in data['data']:
+        for res in fmt['results']:
+            if res['mode'] in ["mvm", "tmvm"] and default_run(res):
+                medians[(fmt['format'], res['mode'])] = st.median(res['time'])
+
+    rows = []
+    for fmt in data['data']:
+        layout = fmt.get('tuning', {}).get('ellpack')
+        if layout is None:
+            continue
+        row = [fmt['format'].upper(), str(layout['chunk_height']), str(layout['sigma']), str(layout['stored']),
+               f"{layout['padding_overhead'] * 100:.2f}", str(layout['bytes'])]
+        for mode in ["mvm", "tmvm"]:
+            csr_time = medians.get(("csr", mode))
+            ellpack_time = medians.get((fmt['format'], mode))
+            row.append("n/a" if csr_time is None or ellpack_time is None else f"{csr_time / ellpack_time:.2f}")
+        rows.append(row)
+    return rows
+
+
+# List the value and index types of the runs with downcast matrices, next to the median time and the error of every
+# result relative to the result on the float64 matrices (see --value_dtype and --index_dtype of main.py)
+def precision_errors(data, dicts, suffix=""):
+    rows = []
+    for fmt in data['data']:
+        tuning = fmt.get('tuning', {})
+        if 'value_dtype' not in tuning:
+            continue
+        for res in fmt['results']:
+            error = res.get('relative_error')
+            rows.append([f"{fmt['format'].upper()}{suffix}", mode_label(res, dicts), tuning['value_dtype'] or "file",
+                         tuning['index_dtype'], st.median(res['time']), "n/a" if error is None else error])
+    return rows
+
+
+# Get the peak memory bandwidth (GB/s) of the host the results were measured on (see roofline.py). Returns None if the
+# bandwidth was not measured
+def peak_bandwidth(data):
+    return data.get('bandwidth', {}).get('peak')
+
+
+# List the roofline metrics of every result (see roofline.py): the operations and bytes moved, the arithmetic intensity,
+# the achieved GFLOP/s and effective bandwidth at the median time, and the fraction of the bandwidth of the host
+def roofline_metrics(data, dicts, suffix=""):
+    peak = peak_bandwidth(data)
+    rows = []
+    for fmt in data['data']:
+        for res in fmt['results']:
+            if res.get('bytes_moved') is None:
+                continue
+            flops, moved, bandwidth = res['flops'] or 0, res['bytes_moved'], res.get('bandwidth')
+            rows.append([f"{fmt['format'].upper()}{suffix}", mode_label(res, dicts), str(flops), str(moved),
+                         f"{flops / moved:.3f}" if moved else "n/a", st.median(res['time']),
+                         "n/a" if res.get('gflops') is None else res['gflops'],
+                         "n/a" if bandwidth is None else bandwidth,
+                         "n/a" if bandwidth is None or peak is None else f"{bandwidth / peak * 100:.1f}"])
+    return rows
+
+
+# Calculate, per format, after how many calls of mvm and add converting to that format pays for itself, compared to
+# staying in the source format of the conversion
+def conversion_break_even(data, suffix=""):
+    medians = {}
+    for fmt in data['data']:
+        for res in fmt['results']:
+            if res['mode'] in ["mvm", "add"] and default_run(res):
+                medians[(fmt['format'], res['mode'])] = st.median(res['time'])
+
+    rows = []
+    for fmt in data['data']:
+        for res in fmt['results']:
+            if res['mode'] != "conv":
+                continue
+            conversion = st.median(res['time'])
+            row = [f"{fmt['format'].upper()}{suffix}", res['source'].upper(), conversion * 1000,
+                   str(peak_memory(res) if peak_memory(res) is not None else "n/a")]
+            for mode in ["mvm", "add"]:
+                source_time = medians.get((res['source'], mode))
+                target_time = medians.get((fmt['format'], mode))
+                if source_time is None or target_time is None:
+                    row.append("n/a")
+                elif target_time >= source_time:
+                    row.append("never")
+                else:
+                    row.append(str(ceil(conversion / (source_time - target_time))))
+            rows.append(row)
+    return rows
+
+
 # This function plots the results in a boxplot. If there are pytorch results, includes those in the result.
 # It plots the results per operation, meaning that for each tested function, it shows the performance of each format and, if available, each format using PyTorch too
 def plot_results(data, pytorch_data, output, output_format, dicts):
@@ -32,12 +314,17 @@ def plot_results(data, pytorch_data, output, output_format, dicts):
     for fmt in data['data']:
         for res in fmt['results']:
             times = [x * 1000 for x in res['time']]  # Gets the times in milliseconds (ms)
-            results_dict[res['mode']].append({'format': fmt['format'].upper(), 'time': times})
+            label = result_label(fmt['format'], res)
+            results_dict[res['mode']].append({'format': label, 'time': times})
     if pytorch_data is not None:
         for fmt in pytorch_data['data']:
             for res in fmt['results']:
                 times = [x * 1000 for x in res['time']]  # Gets the times in milliseconds (ms)
-                results_dict[res['mode']].append({'format': f"{fmt['format'].upper()}\n(PyTorch)", 'time': times})
+                label = result_label(fmt['format'], res)
+                results_dict[res['mode']].append({'format': f"{label}\n(PyTorch)", 'time': times})
+
+    # Only plot modes that were benchmarked
+    results_dict = {mode: res for mode, res in results_dict.items() if res}
 
     num_iters = len(results_dict)
     num_rows = int(ceil(num_iters / 2))
@@ -45,10 +332,8 @@ def plot_results(data, pytorch_data, output, output_format, dicts):
     # Generate figure subplots with shared x and y axes, as well as with x and y axes labels/scaling.
     fig, axes = plt.subplots(num_rows, 2, figsize=(16, num_rows * 5), sharex='all', sharey='all', subplot_kw={'xscale': 'log', 'xlabel': 'Time (ms)', 'ylabel': 'Formats'})
 
-    if num_rows > 1:
-        axs = axes.flatten()
-    else:
-        axs = [axes]
+    # With a single row, the axes are a 1D array of the two columns, so it is flattened in all cases
+    axs = axes.flatten()
 
     # For each result, plot the corresponding boxplots
     for i, (mode, res) in enumerate(results_dict.items()):
@@ -71,6 +356,115 @@ def plot_results(data, pytorch_data, output, output_format, dicts):
     plt.close()
 
 
+# This function plots the median time of every operation against its peak memory, with a scatter plot per mode in which
+# every point is a format. Only results for which the memory use was measured are included
+def plot_memory(data, pytorch_data, output, output_format, dicts):
+    results_dict = {}
+    for results, suffix in [(data, ""), (pytorch_data, " (PyTorch)")]:
+        if results is None:
+            continue
+        for fmt in results['data']:
+            for res in fmt['results']:
+                peak = peak_memory(res)
+                if peak is None:
+                    continue
+                results_dict.setdefault(res['mode'], []).append({
+                    'format': result_label(fmt['format'], res) + suffix,
+                    'memory': max(peak, 1) / 1024 ** 2,  # Gets the peak memory in megabytes (MB), at least 1 byte for the log scale
+                    'time': st.median(res['time']) * 1000  # Gets the median time in milliseconds (ms)
+                })
+
+    if not results_dict:
+        return
+
+    num_rows = int(ceil(len(results_dict) / 2))
+    fig, axes = plt.subplots(num_rows, 2, figsize=(16, num_rows * 5), subplot_kw={'xscale': 'log', 'yscale': 'log', 'xlabel': 'Peak Memory (MB)', 'ylabel': 'Median Time (ms)'})
+    axs = axes.flatten()
+
+    for i, (mode, res) in enumerate(results_dict.items()):
+        for d in res:
+            axs[i].scatter(d['memory'], d['time'])
+            axs[i].annotate(d['format'], (d['memory'], d['time']), textcoords="offset points", xytext=(4, 4),
+                            fontsize=8)
+        axs[i].set_title(f"{chr(i + 97)}) {dicts['modes_dict'][mode]}")
+
+    for j in range(len(results_dict), len(axs)):
+        fig.delaxes(axs[j])
+
+    plt.tight_layout()
+    plt.savefig(f"{output}/memory.{output_format}")
+    plt.close()
+
+
+# This function plots the effective bandwidth of every operation as a fraction of the bandwidth of the host, with a bar
+# chart per mode in which every bar is a format. Fractions above 100% mean the operands fit in the caches of the CPU.
+# Only results with roofline metrics measured on a host with a known bandwidth are included
+def plot_roofline(data, pytorch_data, output, output_format, dicts):
+    results_dict = {}
+    for results, suffix in [(data, ""), (pytorch_data, " (PyTorch)")]:
+        if results is None or peak_bandwidth(results) is None:
+            continue
+        for fmt in results['data']:
+            for res in fmt['results']:
+                if res.get('bandwidth') is None:
+                    continue
+                results_dict.setdefault(res['mode'], []).append({
+                    'format': result_label(fmt['format'], res) + suffix,
+                    'fraction': res['bandwidth'] / peak_bandwidth(results) * 100
+                })
+
+    if not results_dict:
+        return
+
+    num_rows = int(ceil(len(results_dict) / 2))
+    fig, axes = plt.subplots(num_rows, 2, figsize=(16, num_rows * 5), subplot_kw={'xlabel': 'Fraction of Peak Bandwidth (%)'})
+    axs = axes.flatten()
+
+    for i, (mode, res) in enumerate(results_dict.items()):
+        axs[i].barh([d['format'] for d in res], [d['fraction'] for d in res])
+        axs[i].axvline(100, color='black', linestyle='--', linewidth=1)
+        axs[i].invert_yaxis()
+        axs[i].set_title(f"{chr(i + 97)}) {dicts['modes_dict'][mode]}")
+
+    for j in range(len(results_dict), len(axs)):
+        fig.delaxes(axs[j])
+
+    plt.tight_layout()
+    plt.savefig(f"{output}/roofline.{output_format}")
+    plt.close()
+
+
+# Select the results of a single matrix from the JSON file of a scale sweep of main.py, which holds the results of every
+# generated matrix under 'runs': the one whose file name matches 'matrix', otherwise the last one
+def select_scale_run(results, matrix=None):
+    runs = results['runs']
+    if matrix is not None:
+        runs = [run for run in runs if os.path.basename(run['matrix']) == os.path.basename(matrix)]
+        if not runs:
+            raise ValueError(f"no results of matrix '{matrix}' in the scale sweep (matrices: "
+                             f"{', '.join(os.path.basename(run['matrix']) for run in results['runs'])})")
+    return dict(runs[-1], backend=results['backend'], bandwidth=results.get('bandwidth'), scale=results['scale'])
+
+
+# Load the results of a backend from a JSON file, or from the results store (see store.py) as STORE or STORE:RUN, in
+# which RUN is a run id or a prefix of one (default: the latest run of the backend). Of the JSON file of a scale sweep,
+# a single matrix is loaded (see select_scale_run)
+def load_data(path, backend, matrix=None):
+    store_path, run = path, "latest"
+    if ":" in path and store.is_store(path.split(":")[0]):
+        store_path, run = path.split(":", 1)
+    if store.is_store(store_path):
+        results = store.load_results(store_path, run, backend, matrix)
+        if results is None:
+            raise ValueError(f"no {backend} results of run '{run}' in {store_path}")
+        return results
+    with open(path, "r") as read_file:
+        results = json.load(read_file)
+    if 'runs' in results:
+        return select_scale_run(results, matrix)
+    return results
+
+
 # Check if the script has been imported as a module
 if __name__ != "__main__":
     raise ImportError("This script cannot be imported as a module")
@@ -80,18 +474,23 @@ try:
     parser = argparse.ArgumentParser(
         description="shows the results of the sparse matrix benchmarking script in clear formats")
 
-    parser.add_argument("-f", "--file", help="path to JSON file generated with sparse matrix benchmarking", required=True)
-    parser.add_argument("-ptf", "--pytorch_file", help="path to JSON file generated with pytorch benchmarking")
+    parser.add_argument("-f", "--file", required=True,
+                        help="path to JSON file generated with sparse matrix benchmarking, or a results store as STORE or STORE:RUN (latest run by default)")
+    parser.add_argument("-ptf", "--pytorch_file", help="path to JSON file generated with pytorch benchmarking, or a results store as STORE or STORE:RUN")
     parser.add_argument("-o", "--output",
                         help="specifies the folder in which to save the generated plot(s) (default: ./plots)",
                         default="./plots")
+    parser.add_argument("-rf", "--reordered_file",
+                        help="path to JSON file generated with the same settings on the reordered matrix (main.py --reorder), to compare against")
+    parser.add_argument("-rptf", "--reordered_pytorch_file",
+                        help="path to JSON file generated with pytorch on the reordered matrix, to compare against")
     parser.add_argument("-fmt", "--format", help="specifies the output files format (default: pdf)", default="pdf")
+    parser.add_argument("--matrix", help="file name of the matrix to load from runs of sweep.py in a results store, or from the JSON file of a scale sweep of main.py (optional)")
 
     args = parser.parse_args()
 
-    # Load results JSON
-    with open(args.file, "r") as read_file:
-        data = json.load(read_file)
+    # Load results JSON or results store
+    data = load_data(args.file, "scipy", args.matrix)
 
     # Load dictionaries for format and modes definitions
     with open("./dicts.json", "r") as read_file:
@@ -105,56 +504,133 @@ try:
     # Load corresponding PyTorch file if exists
     pytorch_data = None
     if args.pytorch_file is not None:
-        with open(args.pytorch_file, "r") as read_file:
-            pytorch_data = json.load(read_file)
+        pytorch_data = load_data(args.pytorch_file, "pytorch", args.matrix)
 
     # Plot results in boxplots
     plot_results(data, pytorch_data, cleaned_path, args.format, dicts)
 
-    # Calculate detailed statistics
-    stats = [
-        ["Format", "Benchmark", "Min", "P25", "P50 (Median)", "P75", "Max", "Standard Deviation", "Mean", "Variance",
-         "Range"]]
-    # For-loops are repeated, because lengths of arrays in data and pytorch_data can be different
-    for fmt in data['data']:
-        for res in fmt['results']:
-            percentiles = st.quantiles(res['time'], n=4)
-            stats.append([
-                fmt['format'].upper(),
-                dicts['modes_dict'][res['mode']],
-                min(res['time']) * 1000,
-                percentiles[0] * 1000,
-                st.median(res['time']) * 1000,
-                percentiles[2] * 1000,
-                max(res['time']) * 1000,
-                st.stdev(res['time']) * 1000,
-                st.mean(res['time']) * 1000,
-                st.variance(res['time']) * 1000,
-                max(res['time']) - min(res['time']) * 1000
-            ])
+    # Plot time against peak memory, if the memory use was measured
+    plot_memory(data, pytorch_data, cleaned_path, args.format, dicts)
+
+    # Plot the effective bandwidth as a fraction of the bandwidth of the host, if the roofline metrics were measured
+    plot_roofline(data, pytorch_data, cleaned_path, args.format, dicts)
+
+    # Calculate detailed statistics of all results at once (times in ms)
+    labels, times, counts = sample_columns(data, dicts)
     if pytorch_data is not None:
-        for fmt in pytorch_data['data']:
-            for res in fmt['results']:
-                percentiles = st.quantiles(res['time'], n=4)
-                stats.append([
-                    f"{fmt['format'].upper()} - PyTorch",
-                    dicts['modes_dict'][res['mode']],
-                    min(res['time']) * 1000,
-                    percentiles[0] * 1000,
-                    st.median(res['time']) * 1000,
-                    percentiles[2] * 1000,
-                    max(res['time']) * 1000,
-                    st.stdev(res['time']) * 1000,
-                    st.mean(res['time']) * 1000,
-                    st.variance(res['time']) * 1000,
-                    max(res['time']) - min(res['time']) * 1000
-                ])
+        pytorch_columns = sample_columns(pytorch_data, dicts, " - PyTorch")
+        labels, times, counts = labels + pytorch_columns[0], times + pytorch_columns[1], counts + pytorch_columns[2]
+    summary = grouped_stats(np.concatenate(times), np.array(counts)) * 1000
+    summary[:, 7] *= 1000  # The variance is in ms^2
 
     # Output statistics to CSV file
     vectorized_format = np.vectorize(format_float)
+    stats = [["Format", "Benchmark", "Min", "P25", "P50 (Median)", "P75", "Max", "Standard Deviation", "Mean",
+              "Variance", "Range", "Verified"]]
+    stats += [label[:2] + list(vectorized_format(row)) + label[2:] for label, row in zip(labels, summary)]
     arr = np.array(stats)
-    arr[1:, 2:] = vectorized_format(arr[1:, 2:])
     np.savetxt(f"{cleaned_path}/stats.csv", arr, fmt='%s', delimiter=', ')
+    mismatches = [f"{row[0]} {row[1]}" for row in stats[1:] if row[-1] == "MISMATCH"]
+    if mismatches:
+        print(f"warning: {len(mismatches)} results don't match SciPy's CSR: {', '.join(mismatches)}")
+
+    # Output speedup of multiplying with k vectors at once over k separate SpMVs to CSV file
+    speedups = spmm_speedups(data)
+    if pytorch_data is not None:
+        speedups += spmm_speedups(pytorch_data, " - PyTorch")
+    if speedups:
+        arr = np.array([["Format", "k", "SpMV Median", "SpMM Median", "SpMM Median per Vector", "Speedup over k SpMVs"]]
+                       + speedups)
+        arr[1:, 2:] = vectorized_format(arr[1:, 2:])
+        np.savetxt(f"{cleaned_path}/spmm.csv", arr, fmt='%s', delimiter=', ')
+
+    # Output speedups of the reordered matrix over the original matrix to CSV file, next to the speedup of the best format
+    reorder_rows = []
+    for original, reordered_path, suffix in [(data, args.reordered_file, ""),
+                                             (pytorch_data, args.reordered_pytorch_file, " - PyTorch")]:
+        if original is None or reordered_path is None:
+            continue
+        reordered = load_data(reordered_path, "pytorch" if suffix else "scipy", args.matrix)
+        reorder_rows += reorder_speedups(original, reordered, dicts, suffix)
+        if 'reorder' in reordered:
+            stats = reordered['reorder']
+            print(f"{stats['method']} reordering{suffix}: bandwidth {stats['bandwidth_before']} -> "
+                  f"{stats['bandwidth_after']}, took {(stats['permutation_time'] + stats['apply_time']) * 1000:.2f} ms")
+    if reorder_rows:
+        arr = np.array([["Format", "Benchmark", "Original Median", "Reordered Median", "Reordering Speedup",
+                         "Best Original Format", "Best Format Speedup", "Helps More"]] + reorder_rows)
+        arr[1:, 2:5] = vectorized_format(arr[1:, 2:5])
+        arr[1:, 6] = vectorized_format(arr[1:, 6])
+        np.savetxt(f"{cleaned_path}/reorder.csv", arr, fmt='%s', delimiter=', ')
+
+    # Output the time spent allocating the output of the operations run with --inplace to CSV file
+    allocation = allocation_overhead(data, dicts)
+    if pytorch_data is not None:
+        allocation += allocation_overhead(pytorch_data, dicts, " - PyTorch")
+    if allocation:
+        arr = np.array([["Format", "Benchmark", "Allocating Median", "In-place Median",
+                         "Allocation Overhead (percent of allocating)"]] + allocation)
+        arr[1:, 2:4] = vectorized_format(arr[1:, 2:4])
+        np.savetxt(f"{cleaned_path}/allocation.csv", arr, fmt='%s', delimiter=', ')
+
+    # Output the strong scaling of the multithreaded benchmarks to CSV file
+    scaling = strong_scaling(data, dicts)
+    if pytorch_data is not None:
+        scaling += strong_scaling(pytorch_data, dicts, " - PyTorch")
+    if scaling:
+        arr = np.array([["Format", "Benchmark", "Threads", "Median", "Speedup", "Parallel Efficiency (percent)"]]
+                       + scaling)
+        arr[1:, 3] = vectorized_format(arr[1:, 3])
+        np.savetxt(f"{cleaned_path}/scaling.csv", arr, fmt='%s', delimiter=', ')
+
+    # Output the cost of the symbolic phase and the speedup of the numeric phase of reused patterns to CSV file (SciPy
+    # only)
+    reuse_rows = reuse_speedups(data, dicts)
+    if reuse_rows:
+        arr = np.array([["Format", "Benchmark", "Symbolic Median", "Numeric Median", "One-shot Median",
+                         "Numeric Speedup over One-shot", "Break-even Calls"]] + reuse_rows)
+        arr[1:, 2:5] = vectorized_format(arr[1:, 2:5])
+        np.savetxt(f"{cleaned_path}/reuse.csv", arr, fmt='%s', delimiter=', ')
+
+    # Output padding overhead and the SpMV speedup over CSR of the ELLPACK formats to CSV file (SciPy only, as PyTorch
+    # has no ELLPACK formats)
+    ellpack_rows = ellpack_speedups(data)
+    if ellpack_rows:
+        arr = np.array([["Format", "Chunk Height (C)", "Sorting Window (sigma)", "Stored Values",
+                         "Padding Overhead (percent)", "Size (bytes)", "SpMV Speedup over CSR",
+                         "Transposed SpMV Speedup over CSR"]] + ellpack_rows)
+        np.savetxt(f"{cleaned_path}/ellpack.csv", arr, fmt='%s', delimiter=', ')
+
+    # Output the errors of the benchmarks on matrices with downcast values or indices to CSV file
+    precision = precision_errors(data, dicts)
+    if pytorch_data is not None:
+        precision += precision_errors(pytorch_data, dicts, " - PyTorch")
+    if precision:
+        arr = np.array([["Format", "Benchmark", "Value Type", "Index Type", "Median", "Relative Error"]] + precision)
+        arr[1:, 4:] = vectorized_format(arr[1:, 4:])
+        np.savetxt(f"{cleaned_path}/precision.csv", arr, fmt='%s', delimiter=', ')
+
+    # Output the operations, bytes moved, GFLOP/s and effective bandwidth of every benchmark to CSV file
+    roofline = roofline_metrics(data, dicts)
+    if pytorch_data is not None:
+        roofline += roofline_metrics(pytorch_data, dicts, " - PyTorch")
+    if roofline:
+        arr = np.array([["Format", "Benchmark", "FLOPs", "Bytes Moved", "Arithmetic Intensity (FLOP/byte)", "Median",
+                         "GFLOP/s", "Bandwidth (GB/s)", "Fraction of Peak Bandwidth (percent)"]] + roofline)
+        arr[1:, 5:8] = vectorized_format(arr[1:, 5:8])
+        np.savetxt(f"{cleaned_path}/roofline.csv", arr, fmt='%s', delimiter=', ')
+        if peak_bandwidth(data) is not None:
+            print(f"peak memory bandwidth of {data['bandwidth']['host']}: {peak_bandwidth(data):.2f} GB/s")
+
+    # Output conversion costs and the number of calls after which the conversion pays for itself to CSV file
+    conversions = conversion_break_even(data)
+    if pytorch_data is not None:
+        conversions += conversion_break_even(pytorch_data, " - PyTorch")
+    if conversions:
+        arr = np.array([["Format", "Source", "Conversion Median", "Conversion Peak Memory (bytes)",
+                         "Break-even MVM Calls", "Break-even ADD Calls"]] + conversions)
+        arr[1:, 2] = vectorized_format(arr[1:, 2])
+        np.savetxt(f"{cleaned_path}/conversion.csv", arr, fmt='%s', delimiter=', ')
 except Exception as e:
     print(e)
     exit(1)
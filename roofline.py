@@ -0,0 +1,225 @@
+# Script responsible for the roofline metrics of the benchmarks: the floating-point operations an operation performs and
+# the bytes it has to move at least, from which the achieved GFLOP/s and the effective memory bandwidth follow
+# The operations are counted on the non-zero pattern of the matrices, so they are the same for every format. The bytes
+# follow a minimum traffic model: every array of the operands is read once and every array of the output is written
+# once. The bandwidth of the host is measured once with a STREAM-like probe, so the bandwidth of every format can be
+# shown as a fraction of what the machine can deliver
+import os
+import json
+import time
+import socket
+import argparse
+import numpy as np
+from scipy.sparse import csr_matrix
+
+import cache
+from accounting import buffer_nbytes
+from ellpack import ELLPACK_FORMATS
+
+BANDWIDTH_FILE = "bandwidth.json"  # Results of the bandwidth probe per host, in the cache directory
+PROBE_BYTES = 256 * 1024 ** 2  # Size of the arrays of the probe together, far larger than the caches of the CPU
+PROBE_REPS = 10
+STREAM_KERNELS = ['copy', 'scale', 'add', 'triad']
+PROBE_VERSION = 2  # Increase when the probe changes, so cached bandwidths are measured again
+
+
+# Counts the work of the operations on matrix A (and B) on their non-zero pattern, once per pair of matrices: the
+# number of entries of A and B, of A + B and of A @ B, and the number of multiplications of A @ B. Like in the benchmark
+# (see get_mmm_operand), B is transposed if its shape doesn't match A. With products, the pattern of A @ B is
+# calculated once, which is as expensive as the sparse matrix-matrix multiplication itself
+def matrix_work(matrix_a, matrix_b=None, products=False):
+    a = csr_matrix(matrix_a)
+    a.sum_duplicates()
+    work = {'rows': a.shape[0], 'cols': a.shape[1], 'nnz_a': a.nnz}
+    if matrix_b is None:
+        return work
+
+    b = csr_matrix(matrix_b)
+    b.sum_duplicates()
+    work['nnz_b'] = b.nnz
+    # The patterns have all values set to 1, so no entry of their sum or product cancels out
+    pattern_a = csr_matrix((np.ones(a.nnz), a.indices, a.indptr), shape=a.shape)
+    pattern_b = csr_matrix((np.ones(b.nnz), b.indices, b.indptr), shape=b.shape)
+    if a.shape == b.shape:
+        work['nnz_add'] = (pattern_a + pattern_b).nnz
+    if a.shape[1] != b.shape[0]:
+        pattern_b = pattern_b.T.tocsr()
+    if a.shape[1] == pattern_b.shape[0]:
+        work['mmm_products'] = int(np.diff(pattern_b.indptr)[a.indices].sum())
+        if products:
+            work['nnz_mmm'] = (pattern_a @ pattern_b).nnz
+    return work
+
+
+# Returns the number of bytes of a value of the matrix or tensor
+def value_itemsize(mtx):
+    return mtx.dtype.itemsize
+
+
+# Checks if the result shares its values with the matrix, like SciPy's transposes of COO, CSR and CSC
+def shares_values(result, mtx):
+    if type(mtx).__module__.startswith('torch'):
+        import torch
+        values = [tensor._values() if tensor.layout == torch.sparse_coo else tensor.values() for tensor in [result, mtx]]
+        return values[0].data_ptr() == values[1].data_ptr()
+    data = [getattr(x, 'data', None) for x in [result, mtx]]
+    return all(isinstance(x, np.ndarray) for x in data) and np.shares_memory(data[0], data[1])
+
+
+# Calculates the number of bytes of the layout of a matrix or tensor, which an operation reads at least once: the
+# buffers of array-backed formats, padding included. LIL and DOK are not backed by arrays, so only their column indices
+# (and row indices for DOK) and values are counted, like the theoretical sizes of memory.py
+def storage_bytes(mtx):
+    # Imported here, as tuning.py imports benchmark.py, which imports this module
+    from tuning import index_itemsize
+
+    size = buffer_nbytes(mtx)
+    if size is not None:
+        return size
+    index_size = index_itemsize(*mtx.shape, mtx.nnz)
+    indices = 2 if mtx.format == "dok" else 1
+    return mtx.nnz * (indices * index_size + value_itemsize(mtx))
+
+
+# Calculates the number of bytes of the values of a matrix or tensor, padding included
+def value_bytes(mtx):
+    if type(mtx).__module__.startswith('torch'):
+        import torch
+        values = mtx._values() if mtx.layout == torch.sparse_coo else mtx.values()
+        return values.element_size() * values.numel()
+    if getattr(mtx, 'format', None) in ELLPACK_FORMATS:
+        return sum(data.nbytes for _, _, data in mtx.groups)
+    if isinstance(getattr(mtx, 'data', None), np.ndarray) and mtx.data.dtype != object:
+        return mtx.data.nbytes
+    return mtx.nnz * value_itemsize(mtx)
+
+
+# Calculates the number of bytes of a sparse output with this number of entries, stored in a compressed layout
+def output_bytes(nnz, rows, value_size):
+    from tuning import index_itemsize
+
+    index_size = index_itemsize(rows, nnz)
+    return nnz * (index_size + value_size) + (rows + 1) * index_size
+
+
+# Calculates the roofline metrics of a result (see perform_benchmark): the number of floating-point operations of the
+# operation on the pattern of the matrices (see matrix_work), and the number of bytes it moves at least. Dense vectors
+# and blocks are read and written once, sparse outputs are counted as compressed layouts with the entries of the output.
+# Sparse matrices are counted with the layout of their format. Modes that don't compute anything perform 0 operations.
+# Returns None for the metrics that can't be calculated from the work
+def traffic(res, mtx_a, mtx_b, work, source=None, view=False):
+    rows, cols, nnz = work['rows'], work['cols'], work['nnz_a']
+    value_size = value_itemsize(mtx_a)
+    mode = res['mode']
+    flops, moved = None, None
+    if mode in ["add", "sub"] and 'nnz_add' in work:
+        # Only the entries present in both matrices are added, the others are copied
+        flops = work['nnz_a'] + work['nnz_b'] - work['nnz_add']
+        moved = storage_bytes(mtx_a) + storage_bytes(mtx_b) + output_bytes(work['nnz_add'], rows, value_size)
+    elif mode == "sm":
+        flops = nnz
+        moved = 2 * value_bytes(mtx_a) if res.get('inplace') else 2 * storage_bytes(mtx_a)
+    elif mode in ["mvm", "tmvm"]:
+        flops = 2 * nnz
+        moved = storage_bytes(mtx_a) + (rows + cols) * value_size
+    elif mode == "spmm":
+        flops = 2 * nnz * res['k']
+        moved = storage_bytes(mtx_a) + res['k'] * (rows + cols) * value_size
+    elif mode == "mmm" and 'mmm_products' in work:
+        flops = 2 * work['mmm_products']
+        if 'nnz_mmm' in work:
+            moved = storage_bytes(mtx_a) + storage_bytes(mtx_b) + output_bytes(work['nnz_mmm'], rows, value_size)
+    elif mode == "tps":
+        # Transposes sharing the values of the matrix (see shares_values) are views, which don't move any data
+        flops = 0
+        moved = 0 if view else 2 * storage_bytes(mtx_a)
+    elif mode == "conv" and source is not None:
+        flops = 0
+        moved = storage_bytes(source) + storage_bytes(mtx_a)
+    return {'flops': flops, 'bytes_moved': moved}
+
+
+# Calculates the achieved GFLOP/s and effective bandwidth (GB/s) of a result from its median time. Returns None for the
+# metrics without operations or bytes
+def throughput(res):
+    median = float(np.median(res['time']))
+    gflops, bandwidth = None, None
+    if res.get('flops') and median > 0:
+        gflops = res['flops'] / median / 1e9
+    if res.get('bytes_moved') and median > 0:
+        bandwidth = res['bytes_moved'] / median / 1e9
+    return {'gflops': gflops, 'bandwidth': bandwidth}
+
+
+# Measures the memory bandwidth of the host with the four kernels of STREAM on NumPy arrays of float64 values: copy
+# (c = a), scale (b = s * c), add (c = a + b) and triad (a = b + s * c). Every kernel is repeated, and its best time is
+# used, like in STREAM. The bytes are counted as the arrays NumPy actually reads and writes: two for copy and scale,
+# three for add, and five for triad, which NumPy computes in two passes (a = s * c, then a = a + b). Returns the
+# bandwidth of every kernel in GB/s
+def stream_bandwidth(size_bytes=PROBE_BYTES, reps=PROBE_REPS):
+    length = size_bytes // 3 // 8
+    a = np.full(length, 1.0)
+    b = np.full(length, 2.0)
+    c = np.zeros(length)
+    scalar = 3.0
+    kernels = {
+        'copy': (lambda: np.copyto(c, a), 2),
+        'scale': (lambda: np.multiply(c, scalar, out=b), 2),
+        'add': (lambda: np.add(a, b, out=c), 3),
+        'triad': (lambda: (np.multiply(c, scalar, out=a), np.add(a, b, out=a)), 5)
+    }
+    best = {}
+    for _ in range(reps):
+        for name, (kernel, arrays) in kernels.items():
+            start = time.perf_counter_ns()
+            kernel()
+            elapsed = time.perf_counter_ns() - start
+            best[name] = min(best.get(name, elapsed), elapsed)
+    return {name: kernels[name][1] * length * 8 / best[name] for name in STREAM_KERNELS}
+
+
+# Returns the memory bandwidth of this host (see stream_bandwidth), measuring it only once per host: the result is kept
+# in the cache directory. The peak bandwidth is the highest bandwidth of the kernels
+def host_bandwidth(use_cache=True, cache_dir=cache.DEFAULT_CACHE_DIR, size_bytes=PROBE_BYTES):
+    host = socket.gethostname()
+    path = os.path.join(cache_dir, BANDWIDTH_FILE)
+    probes = {}
+    if os.path.exists(path):
+        with open(path, "r") as read_file:
+            probes = json.load(read_file)
+    if use_cache and probes.get(host, {}).get('version') == PROBE_VERSION:
+        return probes[host]
+
+    kernels = stream_bandwidth(size_bytes)
+    probes[host] = {'host': host, 'bytes': size_bytes, 'kernels': kernels, 'peak': max(kernels.values()),
+                    'measured': time.time(), 'version': PROBE_VERSION}
+    os.makedirs(cache_dir, exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as write_file:
+        json.dump(probes, write_file, indent=4)
+    os.replace(temp_path, path)
+    return probes[host]
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(description="measures the memory bandwidth of this host with a STREAM-like probe, once per host")
+
+        parser.add_argument("--size", type=int, default=PROBE_BYTES // 1024 ** 2,
+                            help="size of the arrays of the probe together in MB; should be far larger than the caches of the CPU (default: %(default)s)")
+        parser.add_argument("--refresh", action="store_true", help="measure the bandwidth again, even if it was measured before")
+        parser.add_argument("--cache_dir", default=cache.DEFAULT_CACHE_DIR,
+                            help="directory of the binary matrix cache, which also holds the measured bandwidth (default: %(default)s)")
+
+        args = parser.parse_args()
+
+        if args.size < 1:
+            parser.error("value for --size must be at least 1")
+
+        probe = host_bandwidth(not args.refresh, args.cache_dir, args.size * 1024 ** 2)
+        for name in STREAM_KERNELS:
+            print(f"{name.ljust(8)}{probe['kernels'][name]:.2f} GB/s")
+        print(f"peak bandwidth of {probe['host']}: {probe['peak']:.2f} GB/s")
+    except Exception as e:
+        print(e)
+        exit(1)
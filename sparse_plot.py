@@ -1,15 +1,124 @@
 # Script responsible for plotting sparsity patterns of (multiple) Sparse Matrices
+# Small matrices are plotted with a marker per non-zero entry. Large matrices are rendered as a density raster instead:
+# the row and column indices are binned into a fixed grid of pixels in chunks, so the matrix never has to be loaded at
+# once, and the number of entries per pixel is shown on a log scale. Dense diagonals and blocks are drawn on top
 
 import os
+import sys
+import time
 import argparse
 from math import ceil
 
-from loader import load_mm_file
+import numpy as np
+from scipy import ndimage
+
+import cache
+from loader import load_mm_file, read_mm_header, iter_mm_entries, mm_index_dtype
+from features import DENSE_DIAGONAL_FILL
 import matplotlib
 import matplotlib.pyplot as plt
+from matplotlib.colors import LogNorm
+from matplotlib.patches import Rectangle
+from matplotlib.collections import LineCollection
 
 matplotlib.use('Agg')
 
+RENDER_MODES = ['auto', 'spy', 'raster']
+RASTER_THRESHOLD = 1000000  # Matrices with more entries than this are rendered as a raster in mode 'auto'
+DEFAULT_PIXELS = 512  # Number of pixels along the longest side of the raster
+RASTER_CHUNK = 2 ** 22  # Number of entries binned at once
+DIAGONAL_MIN_LENGTH = 0.1  # Dense diagonals are only drawn if they hold at least this fraction of the shortest side
+BLOCK_CONTRAST = 8  # Pixels with this many times the mean number of entries per pixel can be part of a dense block
+BLOCK_MIN_PIXELS = 16  # Dense blocks are only drawn if they cover at least this many pixels
+BLOCK_MIN_FILL = 0.5  # Dense blocks are only drawn if their pixels fill at least this fraction of their bounding box
+MAX_OVERLAYS = 32  # Maximum number of diagonals and of blocks drawn per matrix, the ones with the most entries first
+
+
+# Iterates over the row and column indices of the matrix in chunks of entries: from the binary cache if the file is in
+# it (memory-mapped, so only the chunk is read), otherwise streamed from the MatrixMarket file
+def iter_coordinates(file_path, use_cache=True, cache_dir=cache.DEFAULT_CACHE_DIR, chunk_entries=RASTER_CHUNK):
+    cached = cache.load_entry(file_path, cache_dir) if use_cache else None
+    if cached is not None:
+        row, col, _, _ = cached
+        for start in range(0, row.size, chunk_entries):
+            yield row[start:start + chunk_entries], col[start:start + chunk_entries]
+        return
+
+    header = read_mm_header(file_path)
+    for rows, cols, _ in iter_mm_entries(file_path, header, mm_index_dtype(header), values=False):
+        yield rows, cols
+
+
+# Bins the entries into a grid of square pixels of bin_size x bin_size entries, with pixels pixels along the longest
+# side of the matrix, in a single pass over the chunks. With diagonals, the entries per diagonal (offset col - row, from
+# -(rows - 1) to cols - 1) are counted in the same pass. Returns the number of entries per pixel, the bin size and the
+# entries per diagonal (or None)
+def raster_density(chunks, shape, pixels=DEFAULT_PIXELS, diagonals=True):
+    num_rows, num_cols = shape
+    bin_size = max(1, ceil(max(shape) / pixels))
+    height, width = ceil(num_rows / bin_size), ceil(num_cols / bin_size)
+    grid = np.zeros(height * width, dtype=np.int64)
+    diagonal_counts = np.zeros(num_rows + num_cols - 1, dtype=np.int64) if diagonals else None
+    for rows, cols in chunks:
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int64)
+        grid += np.bincount((rows // bin_size) * width + cols // bin_size, minlength=grid.size)
+        if diagonals:
+            diagonal_counts += np.bincount(cols - rows + num_rows - 1, minlength=diagonal_counts.size)
+    return grid.reshape(height, width), bin_size, diagonal_counts
+
+
+# Detects the dense diagonals (filled for at least DENSE_DIAGONAL_FILL, like the features of recommend.py) that are long
+# enough to show. Returns the offset and length of every diagonal
+def dense_diagonals(diagonal_counts, shape, max_count=MAX_OVERLAYS):
+    num_rows, num_cols = shape
+    offsets = np.arange(-(num_rows - 1), num_cols)
+    lengths = np.minimum(num_rows + np.minimum(offsets, 0), num_cols - np.maximum(offsets, 0))
+    dense = np.flatnonzero((diagonal_counts >= DENSE_DIAGONAL_FILL * lengths)
+                           & (diagonal_counts >= DIAGONAL_MIN_LENGTH * min(shape)))
+    dense = dense[np.argsort(-diagonal_counts[dense], kind='stable')[:max_count]]
+    return list(zip(offsets[dense].tolist(), lengths[dense].tolist()))
+
+
+# Detects dense blocks in the raster: connected groups of pixels with far more entries than the mean, which fill most of
+# their bounding box (so bands along diagonals are not blocks). Returns the first row, first column, number of rows and
+# number of columns of every block
+def dense_blocks(grid, bin_size, shape, max_count=MAX_OVERLAYS):
+    threshold = max(1.0, BLOCK_CONTRAST * grid.sum() / grid.size)
+    labels, _ = ndimage.label(grid >= threshold)
+    blocks = []
+    for label, (row_slice, col_slice) in enumerate(ndimage.find_objects(labels), start=1):
+        covered = labels[row_slice, col_slice] == label
+        if covered.sum() < BLOCK_MIN_PIXELS or covered.mean() < BLOCK_MIN_FILL:
+            continue
+        entries = int(grid[row_slice, col_slice][covered].sum())
+        row, col = row_slice.start * bin_size, col_slice.start * bin_size
+        blocks.append((entries, row, col, min(row_slice.stop * bin_size, shape[0]) - row,
+                       min(col_slice.stop * bin_size, shape[1]) - col))
+    blocks.sort(key=lambda block: -block[0])
+    return [block[1:] for block in blocks[:max_count]]
+
+
+# Renders the raster with a log-scaled number of entries per pixel. Empty pixels are left white
+def plot_raster(fig, ax, grid, bin_size):
+    cmap = plt.get_cmap('viridis').copy()
+    cmap.set_bad('white')
+    image = ax.imshow(np.ma.masked_equal(grid, 0), cmap=cmap, norm=LogNorm(vmin=1, vmax=max(2, grid.max())),
+                      extent=(0, grid.shape[1] * bin_size, grid.shape[0] * bin_size, 0), interpolation='nearest')
+    fig.colorbar(image, ax=ax, fraction=0.046, pad=0.04).set_label("entries per pixel", fontsize=6)
+
+
+# Draws the dense diagonals and blocks on top of the plot. Entry (i, j) is centered at (j, i) in spy plots and at
+# (j + 0.5, i + 0.5) in rasters, which the origin corrects for
+def plot_structure(ax, diagonals, blocks, origin=0.0):
+    segments = [[(max(offset, 0) + origin, max(-offset, 0) + origin),
+                 (max(offset, 0) + length + origin, max(-offset, 0) + length + origin)] for offset, length in diagonals]
+    ax.add_collection(LineCollection(segments, colors='tab:red', linewidths=.6, alpha=.7))
+    for row, col, height, width in blocks:
+        ax.add_patch(Rectangle((col + origin, row + origin), width, height, fill=False, edgecolor='tab:orange',
+                               linewidth=.8))
+
+
 # Check if the script has been imported as a module
 if __name__ != "__main__":
     raise ImportError("This script cannot be imported as a module")
@@ -17,41 +126,63 @@ if __name__ != "__main__":
 try:
     # Define arguments
     parser = argparse.ArgumentParser(
-        description="plots ")
+        description="plots the sparsity patterns of sparse matrices")
     parser.add_argument("-f", "--file", help="path to MatrixMarket file(s) (multiple possible)", nargs='+', required=True)
     parser.add_argument("-o", "--output", help="specifies output file", required=True)
+    parser.add_argument("-r", "--render", choices=RENDER_MODES, default="auto",
+                        help=f"'spy' plots a marker per entry, 'raster' renders the number of entries per pixel, 'auto' renders matrices with more than {RASTER_THRESHOLD} entries as a raster (default: %(default)s)")
+    parser.add_argument("--pixels", type=int, default=DEFAULT_PIXELS,
+                        help="number of pixels of the raster along the longest side of the matrix (default: %(default)s)")
+    parser.add_argument("--no_overlay", action="store_true", help="don't draw the dense diagonals and blocks")
+    parser.add_argument("--cache_dir", default=cache.DEFAULT_CACHE_DIR,
+                        help="directory of the binary matrix cache (default: %(default)s)")
+    parser.add_argument("--no_cache", action="store_true",
+                        help="always parse the MatrixMarket files instead of using the binary cache")
     args = parser.parse_args()
 
+    if args.pixels < 1:
+        parser.error("value for --pixels must be at least 1")
+
     # Sort files alphabetically
     args.file.sort(key=lambda s: s.lower())
 
     num_args = len(args.file)
     num_rows = int(ceil(num_args / 2))
 
-    matrices = []
-
-    # Load all matrices
-    for file in args.file:
-        matrices.append(load_mm_file(file, 'coo', False))
-
     # Define subplots
-    fig, axes = plt.subplots(num_rows, 2)
+    fig, axes = plt.subplots(num_rows, 2, squeeze=False)
+    axs = axes.flatten()
+
+    # For all matrices, plot their sparsity patterns. Large matrices are binned chunk by chunk instead of being loaded
+    for i, file in enumerate(args.file):
+        start = time.perf_counter()
+        header = read_mm_header(file)
+        shape = (header['rows'], header['cols'])
+        raster = args.render == "raster" or (args.render == "auto" and header['nnz'] > RASTER_THRESHOLD)
+        if raster:
+            chunks = iter_coordinates(file, not args.no_cache, args.cache_dir)
+        else:
+            matrix = load_mm_file(file, 'coo', False, not args.no_cache, args.cache_dir)
+            axs[i].spy(matrix, color='black', markersize=.3)
+            chunks = [(matrix.row, matrix.col)]
 
-    if num_rows > 1:
-        axs = axes.flatten()
-    else:
-        axs = [axes]
+        if raster or not args.no_overlay:
+            grid, bin_size, diagonal_counts = raster_density(chunks, shape, args.pixels, not args.no_overlay)
+        if raster:
+            plot_raster(fig, axs[i], grid, bin_size)
+        if not args.no_overlay:
+            plot_structure(axs[i], dense_diagonals(diagonal_counts, shape), dense_blocks(grid, bin_size, shape),
+                           0.0 if raster else -0.5)
 
-    # For all matrices, plot their sparsity patterns
-    for i, matrix in enumerate(matrices):
-        axs[i].spy(matrix, color='black', markersize=.3)
         axs[i].set_xticks([])
         axs[i].set_yticks([])
         title = os.path.basename(args.file[i]).split('.')[0]
         axs[i].set_title(f"{chr(i + 97)}) {title}")
+        print(f"rendered {file} ({'raster' if raster else 'spy'}) in {time.perf_counter() - start:.2f} s",
+              file=sys.stderr)
 
     # Clear any leftover plots
-    for j in range(len(matrices), len(axs)):
+    for j in range(num_args, len(axs)):
         fig.delaxes(axs[j])
 
     # Save plots to file
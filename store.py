@@ -0,0 +1,206 @@
+# Script responsible for the append-only results store, a local SQLite database holding the results of all runs
+# Every result is a row keyed by the matrix hash, format, mode, backend, run id and host. Its samples are stored as
+# binary float64 columns instead of JSON lists, so results with millions of samples load as NumPy arrays without
+# parsing text. The nested JSON layout of main.py can be exported from (and imported into) the store
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import argparse
+import numpy as np
+
+import cache
+
+DEFAULT_STORE = os.environ.get("MTX_RESULTS_STORE", "./results.sqlite")
+STORE_SUFFIXES = ('.sqlite', '.db')
+
+SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS runs (
+        run_id TEXT, host TEXT, created REAL, matrix TEXT, matrix_hash TEXT, backend TEXT, attributes TEXT,
+        PRIMARY KEY (run_id, matrix_hash, backend))""",
+    """CREATE TABLE IF NOT EXISTS results (
+        id INTEGER PRIMARY KEY, run_id TEXT, host TEXT, matrix_hash TEXT, backend TEXT, format TEXT, mode TEXT,
+        samples INTEGER, time BLOB, loops BLOB, tuning TEXT, attributes TEXT)""",
+    "CREATE INDEX IF NOT EXISTS results_key ON results (matrix_hash, format, mode, backend, run_id, host)"
+]
+COLUMNS = ['time', 'loops']  # Per-sample lists of a result, stored as binary columns
+
+
+# Checks if the path refers to a results store instead of a JSON file
+def is_store(path):
+    return path.endswith(STORE_SUFFIXES)
+
+
+def connect(store_path=DEFAULT_STORE):
+    connection = sqlite3.connect(store_path)
+    for statement in SCHEMA:
+        connection.execute(statement)
+    return connection
+
+
+# Get the label of a result: the prefix (its mode or format) followed by its variant, i.e. the number of right-hand side
+# vectors for spmm, the source format for conv, the number of threads of the strong-scaling benchmark, and whether the
+# pattern was reused or the output preallocated. The reports of results.py, the scale plot of main.py and the keys of
+# compare.py all use it, so they always agree
+def variant_label(prefix, res, threads=True):
+    label = prefix
+    if 'k' in res:
+        label += f" (k={res['k']})"
+    if 'source' in res:
+        label += f" (from {res['source'].upper()})"
+    if 'threads' in res and threads:
+        label += f" ({res['threads']} threads)"
+    if res.get('reuse_pattern'):
+        label += " (reused pattern)"
+    if res.get('inplace'):
+        label += " (in-place)"
+    return label
+
+
+# Generates the id of a run: its start time, followed by a random suffix so concurrent runs don't collide
+def new_run_id():
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+
+
+# Appends the results of a run on a single matrix and backend (in the JSON layout of main.py) to the store. The matrix
+# hash identifies the matrix independently of its path (see cache.cache_key). Returns the run id
+def append_results(results, matrix_hash, store_path=DEFAULT_STORE, run_id=None, host=None):
+    run_id = new_run_id() if run_id is None else run_id
+    host = socket.gethostname() if host is None else host
+    backend = results.get('backend', "scipy")
+    attributes = {key: value for key, value in results.items() if key not in ['matrix', 'backend', 'data']}
+
+    rows = []
+    for fmt in results['data']:
+        for res in fmt['results']:
+            rows.append((run_id, host, matrix_hash, backend, fmt['format'], res['mode'], len(res['time']),
+                         np.asarray(res['time'], dtype=np.float64).tobytes(),
+                         np.asarray(res.get('loops', [1] * len(res['time'])), dtype=np.int64).tobytes(),
+                         json.dumps(fmt.get('tuning')),
+                         json.dumps({key: value for key, value in res.items() if key not in COLUMNS + ['mode']})))
+
+    with connect(store_path) as connection:
+        connection.execute("INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (run_id, host, time.time(), results.get('matrix'), matrix_hash, backend,
+                            json.dumps(attributes)))
+        connection.executemany("INSERT INTO results (run_id, host, matrix_hash, backend, format, mode, samples, time, "
+                               "loops, tuning, attributes) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    connection.close()
+    return run_id
+
+
+# Lists the runs in the store, from oldest to newest
+def list_runs(store_path=DEFAULT_STORE):
+    with connect(store_path) as connection:
+        rows = connection.execute("SELECT runs.run_id, runs.host, runs.created, runs.matrix, runs.matrix_hash, "
+                                  "runs.backend, runs.attributes, COUNT(results.id), SUM(results.samples) "
+                                  "FROM runs LEFT JOIN results ON runs.run_id = results.run_id "
+                                  "AND runs.matrix_hash IS results.matrix_hash AND runs.backend = results.backend "
+                                  "GROUP BY runs.run_id, runs.matrix_hash, runs.backend ORDER BY runs.created").fetchall()
+    connection.close()
+    return [{'run_id': row[0], 'host': row[1], 'created': row[2], 'matrix': row[3], 'matrix_hash': row[4],
+             'backend': row[5], 'attributes': row[6], 'results': row[7], 'samples': row[8] or 0} for row in rows]
+
+
+# Reads the results of a run on a single matrix and backend (an entry of list_runs) in the JSON layout of main.py. The
+# samples of a result are NumPy views into a single array holding the samples of all results
+def read_run(store_path, run):
+    with connect(store_path) as connection:
+        rows = connection.execute("SELECT format, mode, time, loops, tuning, attributes FROM results WHERE run_id = ? "
+                                  "AND matrix_hash IS ? AND backend = ? ORDER BY id",
+                                  (run['run_id'], run['matrix_hash'], run['backend'])).fetchall()
+    connection.close()
+
+    times = np.frombuffer(b"".join(row[2] for row in rows), dtype=np.float64)
+    loops = np.frombuffer(b"".join(row[3] for row in rows), dtype=np.int64)
+    results = dict(json.loads(run['attributes']), matrix=run['matrix'], backend=run['backend'], run_id=run['run_id'],
+                   data=[])
+    start = 0
+    for fmt, mode, time_bytes, _, tuning, res_attributes in rows:
+        end = start + len(time_bytes) // 8
+        if not results['data'] or results['data'][-1]['format'] != fmt:
+            results['data'].append({'format': fmt, 'results': []})
+            if tuning != "null":
+                results['data'][-1]['tuning'] = json.loads(tuning)
+        results['data'][-1]['results'].append(dict(json.loads(res_attributes), mode=mode, time=times[start:end],
+                                                   loops=loops[start:end]))
+        start = end
+    return results
+
+
+# Selects the entries of list_runs of a run: 'latest' (the newest run) or a run id, or a prefix of one
+def select_run(runs, run="latest"):
+    if run == "latest":
+        return [r for r in runs if r['run_id'] == runs[-1]['run_id']] if runs else []
+    return [r for r in runs if r['run_id'].startswith(run)]
+
+
+# Loads the results of a run on a matrix and backend in the JSON layout of main.py. The run is 'latest' or a run id, or
+# a prefix of one. Runs of sweep.py cover many matrices, of which the one whose file name matches 'matrix' is loaded
+# (otherwise the last one). Returns None if the store holds no results of the run on the backend
+def load_results(store_path, run="latest", backend="scipy", matrix=None):
+    runs = [r for r in list_runs(store_path) if r['backend'] == backend and r['results']]
+    if run != "latest":
+        runs = [r for r in runs if r['run_id'].startswith(run)]
+    if matrix is not None:
+        name = os.path.basename(matrix)
+        runs = [r for r in runs if r['matrix'] is not None and os.path.basename(r['matrix']) == name]
+    if not runs:
+        return None
+    return read_run(store_path, runs[-1])
+
+
+# Loads the results of all matrices and backends of a run ('latest', a run id or a prefix of one), as a list in the JSON
+# layout of main.py
+def load_run(store_path, run="latest"):
+    return [read_run(store_path, r) for r in select_run([r for r in list_runs(store_path) if r['results']], run)]
+
+
+# Converts results loaded from the store back into plain JSON values
+def to_json(results):
+    return dict(results, data=[dict(fmt, results=[dict(res, **{name: np.asarray(res[name]).tolist()
+                                                                for name in COLUMNS if name in res})
+                                                   for res in fmt['results']]) for fmt in results['data']])
+
+
+if __name__ == "__main__":
+    try:
+        parser = argparse.ArgumentParser(description="lists, exports and imports the runs in the results store")
+
+        parser.add_argument("-s", "--store", default=DEFAULT_STORE, help="path to the results store (default: %(default)s)")
+        parser.add_argument("--export", metavar="RUN",
+                            help="export the results of the run ('latest', a run id or a prefix of one) to JSON")
+        parser.add_argument("--backend", choices=['scipy', 'pytorch'], default="scipy",
+                            help="backend of the exported run (default: %(default)s)")
+        parser.add_argument("--import", dest="import_files", metavar="FILE", nargs='+',
+                            help="append result JSON files of main.py or sweep.py to the store, one run per file")
+        parser.add_argument("-o", "--output", help="JSON file to export to, otherwise it gets printed to stdout")
+
+        args = parser.parse_args()
+
+        if args.import_files is not None:
+            for path in args.import_files:
+                with open(path, "r") as read_file:
+                    results = json.load(read_file)
+                matrix = results.get('matrix')
+                matrix_hash = cache.file_digest(matrix) if matrix is not None and os.path.exists(matrix) else None
+                print(f"imported {path} as run {append_results(results, matrix_hash, args.store)}")
+        elif args.export is not None:
+            results = load_results(args.store, args.export, args.backend)
+            if results is None:
+                parser.exit(1, f"no {args.backend} results of run '{args.export}' in {args.store}\n")
+            if args.output is None:
+                print(json.dumps(to_json(results), indent=4))
+            else:
+                with open(args.output, "w") as write_file:
+                    json.dump(to_json(results), write_file, indent=4)
+        else:
+            for run in list_runs(args.store):
+                created = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(run['created']))
+                print(f"{run['run_id']}: {run['backend']} on {run['matrix']} ({run['host']}, {created}, "
+                      f"{run['results']} results, {run['samples']} samples)")
+    except Exception as e:
+        print(e)
+        exit(1)
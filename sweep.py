@@ -0,0 +1,379 @@
+# Script running the benchmark over a corpus of matrices, scheduling format x mode x backend cells over a process pool
+
+import os
+import glob
+import json
+import argparse
+import multiprocessing
+import numpy as np
+
+import cache
+import store
+from loader import read_mm_coo, convert_matrix, is_mm_format
+from benchmark import perform_benchmark, mode_variants
+from features import matrix_features
+from reorder import reorder_matrix, REORDER_METHODS
+from tuning import tune_bsr, check_dia, blocksize_type, DIA_MEMORY_FRACTION
+from ellpack import ELLPACK_FORMATS, DEFAULT_CHUNK_HEIGHT, DEFAULT_SIGMA
+from roofline import matrix_work, host_bandwidth
+
+PYTORCH_FORMATS = ['coo', 'csr', 'csc', 'bsr']
+BACKENDS = ['scipy', 'pytorch']
+
+# Settings of the worker processes, set by the pool initializer
+worker_settings = {}
+
+
+# Returns one logical CPU per physical core, based on the CPU topology in sysfs. Falls back to all logical CPUs
+def physical_cores():
+    cores = {}
+    for cpu in sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else range(os.cpu_count()):
+        topology = f"/sys/devices/system/cpu/cpu{cpu}/topology"
+        try:
+            with open(f"{topology}/physical_package_id") as package_file, open(f"{topology}/core_id") as core_file:
+                key = (package_file.read().strip(), core_file.read().strip())
+        except OSError:
+            key = cpu
+        cores.setdefault(key, cpu)
+    return sorted(cores.values())
+
+
+# Finds all MatrixMarket files in the provided directories, globs and files
+def find_matrices(inputs):
+    matrices = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matrices += glob.glob(os.path.join(item, "**", "*.mtx"), recursive=True)
+        else:
+            matrices += glob.glob(item)
+    return sorted(set(os.path.realpath(path) for path in matrices), key=lambda s: s.lower())
+
+
+# Lists all cells of the sweep per matrix. A cell is a (backend, format, mode, variant) combination, where the variant
+# holds the extra arguments of the mode (the k of spmm, the source format of conv)
+def sweep_cells(backends, formats, modes, spmm_k):
+    cells = []
+    for backend in backends:
+        for fmt in formats:
+            if backend == "pytorch" and fmt not in PYTORCH_FORMATS:
+                continue
+            for mode in modes:
+                for variant in mode_variants(mode, fmt, spmm_k):
+                    cells.append((backend, fmt, mode, variant))
+    return cells
+
+
+# Returns the key identifying a cell of a matrix in the checkpoint file. Modes without variants use 1 as variant
+def cell_key(matrix, backend, fmt, mode, variant):
+    return f"{matrix}|{backend}|{fmt}|{mode}|{next(iter(variant.values()), 1)}"
+
+
+# Loads the results of all cells finished by earlier (interrupted) runs from the checkpoint file
+def load_checkpoint(checkpoint_path):
+    done = {}
+    if not os.path.exists(checkpoint_path):
+        return done
+    with open(checkpoint_path, "r") as read_file:
+        for line in read_file:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Partially written last line of a killed run
+            done[entry['key']] = entry
+    return done
+
+
+# Appends the result of a single cell to the checkpoint file. A single write on a file opened for appending keeps lines
+# of concurrent workers from interleaving
+def append_checkpoint(checkpoint_path, entry):
+    line = (json.dumps(entry) + "\n").encode()
+    fd = os.open(checkpoint_path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+
+# Initializes a worker process, pinning it to its own core if a queue of cores is provided
+def init_worker(settings, core_queue):
+    worker_settings.update(settings)
+    if core_queue is not None:
+        core = core_queue.get()
+        os.sched_setaffinity(0, {core})
+        # A pinned worker only has a single core, so PyTorch should not start a thread per core
+        import torch
+        torch.set_num_threads(1)
+
+
+# Converts the matrix to the format, tuning the format first (see tuning.py). Returns the converted matrix and the tuning
+# results, or None and the reason if the format is refused for this matrix
+def prepare_format(coo, backend, fmt, settings):
+    tuning = {}
+    layout = None
+    if fmt == "dia":
+        estimate = check_dia(coo, settings['dia_max_padding'], settings['dia_max_memory'])
+        if not estimate['feasible']:
+            return None, estimate['reason']
+        tuning['dia'] = estimate
+    elif fmt == "bsr" and settings['blocksize'] == "auto":
+        result = tune_bsr(coo, backend == "pytorch")
+        layout = result['blocksize']
+        tuning = {'blocksize': layout, 'candidates': result['candidates']}
+    elif fmt == "bsr" and settings['blocksize'] != "scipy":
+        layout = settings['blocksize']
+        if coo.shape[0] % layout[0] or coo.shape[1] % layout[1]:
+            return None, f"block size {layout[0]}x{layout[1]} does not divide the shape of the matrix"
+        tuning['blocksize'] = layout
+    elif fmt == "sell":
+        layout = settings['sell']
+    matrix = convert_matrix(coo, fmt, backend == "pytorch", layout)
+    if fmt in ELLPACK_FORMATS:
+        tuning['ellpack'] = matrix.stats()
+    return matrix, tuning
+
+
+# Runs all remaining cells of a single matrix. The matrix is parsed (or loaded from the binary cache) once, and converted
+# once per format, after which the converted matrix is reused for all of the format's modes
+def run_matrix(task):
+    matrix_path, cells = task
+    settings = worker_settings
+    finished = 0
+    try:
+        coo = read_mm_coo(matrix_path, not settings['no_cache'], settings['cache_dir'])
+    except Exception as e:
+        print(f"error: could not load {matrix_path}: {e}")
+        return matrix_path, finished
+
+    # Reorder the matrix once, before it is converted to any format
+    _, coo, reorder_stats = reorder_matrix(coo, settings['reorder'])
+
+    rng = np.random.default_rng(settings['seed'])
+    row_index = int(rng.integers(coo.shape[0]))
+    # Every cell is verified against SciPy's CSR of the (reordered) matrix
+    verify = (convert_matrix(coo, "csr", False),) * 2 if settings['verify'] else None
+    # The work of the operations is counted once, for the roofline metrics of all cells
+    work = matrix_work(coo, coo, any(mode == "mmm" for _, _, mode, _ in cells))
+
+    converted = {}
+    for backend, fmt, mode, variant in cells:
+        key = (backend, fmt)
+        if key not in converted:
+            converted.clear()
+            try:
+                converted[key] = prepare_format(coo, backend, fmt, settings)
+            except Exception as e:
+                converted[key] = (None, e)
+        mtx, tuning = converted[key]
+
+        entry = {'key': cell_key(matrix_path, backend, fmt, mode, variant), 'matrix': matrix_path, 'backend': backend,
+                 'format': fmt}
+        if isinstance(tuning, Exception):
+            entry['error'] = str(tuning)
+            append_checkpoint(settings['checkpoint'], entry)
+            finished += 1
+            continue
+        if mtx is None:
+            # Refused formats are not retried when the sweep is resumed
+            entry['refused'] = tuning
+            append_checkpoint(settings['checkpoint'], entry)
+            finished += 1
+            continue
+        if tuning:
+            entry['tuning'] = tuning
+        if settings['reorder'] != "none":
+            entry['reorder'] = reorder_stats
+        try:
+            # Matrix B is the same matrix as A, like in the results of the thesis
+            entry['result'] = perform_benchmark(mode, mtx, mtx_b=mtx, idx=row_index, scl=settings['scalar'],
+                                                reps=settings['reps'], timing=settings['timing'],
+                                                memory=settings['memory'], verify=verify, work=work, **variant)
+        except Exception as e:
+            entry['error'] = str(e)
+        append_checkpoint(settings['checkpoint'], entry)
+        finished += 1
+
+    return matrix_path, finished
+
+
+# Writes the finished cells to one JSON file per matrix and backend, in the same format as the output of main.py, and
+# appends them to the results store if one is provided (see store.py). The structural features of the matrix are
+# included, so recommend.py can use the results without the matrix files, as is the bandwidth of the host if provided
+def write_results(done, output_dir, use_cache=True, cache_dir=cache.DEFAULT_CACHE_DIR, store_path=None,
+                  bandwidth=None):
+    outputs = {}
+    for entry in done.values():
+        if 'result' not in entry:
+            continue
+        name = os.path.splitext(os.path.basename(entry['matrix']))[0]
+        file_name = f"{name}_pt.json" if entry['backend'] == "pytorch" else f"{name}.json"
+        output = outputs.setdefault(file_name, {'matrix': entry['matrix'], 'backend': entry['backend'], 'formats': {},
+                                                'tuning': {}, 'reorder': entry.get('reorder')})
+        output['formats'].setdefault(entry['format'], []).append(entry['result'])
+        if 'tuning' in entry:
+            output['tuning'][entry['format']] = entry['tuning']
+
+    # With a results store, the files of all matrices and backends are appended to it as a single run
+    os.makedirs(output_dir, exist_ok=True)
+    run_id = None
+    for file_name, output in outputs.items():
+        data = {'matrix': output['matrix'], 'backend': output['backend'],
+                'data': []}
+        for fmt, res in output['formats'].items():
+            fmt_results = {'format': fmt, 'results': res}
+            if fmt in output['tuning']:
+                fmt_results['tuning'] = output['tuning'][fmt]
+            data['data'].append(fmt_results)
+        if output['reorder'] is not None:
+            data['reorder'] = output['reorder']
+        if bandwidth is not None:
+            data['bandwidth'] = bandwidth
+        if os.path.exists(output['matrix']):
+            data['features'] = matrix_features(output['matrix'], use_cache, cache_dir)
+        with open(os.path.join(output_dir, file_name), "w") as write_file:
+            json.dump(data, write_file, indent=4)
+        if store_path is not None:
+            matrix_hash = cache.cache_key(output['matrix'], cache_dir) if os.path.exists(output['matrix']) else None
+            run_id = store.append_results(data, matrix_hash, store_path, run_id)
+    return len(outputs)
+
+
+# Check if the script has been imported as a module
+if __name__ == "__main__":
+    try:
+        # Load formats and modes dict from dicts.json file
+        with open("./dicts.json", "r") as read_file:
+            dicts = json.load(read_file)
+        format_options = list(dicts['formats_dict'].keys())[:-1]
+        mode_options = list(dicts['modes_dict'].keys())[:-1]
+
+        # Define arguments
+        parser = argparse.ArgumentParser(description="runs the sparse matrix benchmark over a corpus of matrices, scheduling the format x mode x backend grid over a process pool")
+
+        parser.add_argument("-i", "--input", nargs='+', required=True,
+                            help="directories (searched recursively), globs or paths of MatrixMarket files (required)")
+        parser.add_argument("--formats", nargs='+', choices=format_options, default=format_options,
+                            help="formats to benchmark (default: all)")
+        parser.add_argument("--modes", nargs='+', choices=mode_options, default=mode_options,
+                            help="modes to benchmark (default: all)")
+        parser.add_argument("--backends", nargs='+', choices=BACKENDS, default=['scipy'],
+                            help="backends to benchmark (default: scipy)")
+        parser.add_argument("-b", "--benchmark", type=int, default=10,
+                            help="number of times to benchmark every cell (default: %(default)s)")
+        parser.add_argument("--scalar", type=int, default=10, help="scalar value used for mode sm (default: %(default)s)")
+        parser.add_argument("--spmm_k", type=int, nargs='+', default=[1, 8, 32],
+                            help="number(s) of dense right-hand side vectors for mode spmm (default: 1 8 32)")
+        parser.add_argument("--seed", type=int, default=0, help="seed used to select the row vector for mode mvm (default: %(default)s)")
+        parser.add_argument("--isolation", choices=['core', 'serial', 'none'], default='core',
+                            help="'core' runs one pinned worker per physical core, 'serial' runs every cell one after another in this process (for exclusive-machine runs), 'none' runs unpinned workers (default: %(default)s)")
+        parser.add_argument("-j", "--jobs", type=int,
+                            help="number of worker processes (default: number of physical cores; ignored with --isolation serial)")
+        parser.add_argument("--checkpoint", default="./sweep_checkpoint.jsonl",
+                            help="checkpoint file; cells already in it are skipped, so a killed sweep continues where it stopped (default: %(default)s)")
+        parser.add_argument("-o", "--output", default="./sweep_results",
+                            help="folder to save one JSON result file per matrix and backend to (default: %(default)s)")
+        parser.add_argument("--store", nargs='?', const=store.DEFAULT_STORE,
+                            help=f"also append the results to the results store at this path, as a single run (optional; default path: {store.DEFAULT_STORE})")
+        parser.add_argument("--cache_dir", default=cache.DEFAULT_CACHE_DIR,
+                            help="directory of the binary matrix cache (default: %(default)s)")
+        parser.add_argument("--no_cache", action="store_true", help="always parse the MatrixMarket files")
+        parser.add_argument("--warmup", type=int, default=1, help="number of untimed calls per cell (default: %(default)s)")
+        parser.add_argument("--min_time", type=float, default=0, help="minimum duration of a single sample in ms (default: %(default)s)")
+        parser.add_argument("--target_ci", type=float,
+                            help="keep sampling until the 95%% CI of the median is within this percentage of the median (optional)")
+        parser.add_argument("--budget", type=float, default=60,
+                            help="maximum number of seconds spent sampling a single cell with --target_ci (default: %(default)s)")
+        parser.add_argument("--blocksize", type=blocksize_type, default="auto",
+                            help="BSR block size: 'auto' benchmarks the SpMV of the most compact candidate block sizes and picks the fastest, 'scipy' uses SciPy's detection, or a block size like 4x4 (default: %(default)s)")
+        parser.add_argument("--dia_max_padding", type=float,
+                            help="also skip DIA if it would store more than this many values per non-zero entry (optional)")
+        parser.add_argument("--dia_max_memory", type=float,
+                            help=f"skip DIA if its layout would take more than this many MB (default: {DIA_MEMORY_FRACTION * 100:.0f}%% of the available memory)")
+        parser.add_argument("--sell_c", type=int, default=DEFAULT_CHUNK_HEIGHT,
+                            help="SELL-C-σ chunk height C (default: %(default)s)")
+        parser.add_argument("--sell_sigma", type=int, default=DEFAULT_SIGMA,
+                            help="SELL-C-σ sorting window σ (default: %(default)s)")
+        parser.add_argument("--reorder", choices=REORDER_METHODS, default="none",
+                            help="reorder the rows and columns of every matrix before the benchmark; use a separate checkpoint and output folder per method (default: %(default)s)")
+        parser.add_argument("--memory", action="store_true",
+                            help="also measure the peak memory of every cell, in one extra untimed call")
+        parser.add_argument("--verify", action="store_true",
+                            help="also verify the result of every cell against the result of SciPy's CSR, outside the timed region")
+
+        args = parser.parse_args()
+
+        if args.benchmark < 1:
+            parser.error("value for --benchmark must at least 1")
+
+        if args.dia_max_memory is not None and args.dia_max_memory <= 0:
+            parser.error("value for --dia_max_memory must be larger than 0")
+
+        if args.sell_c < 1 or args.sell_sigma < 1:
+            parser.error("values for --sell_c and --sell_sigma must be at least 1")
+
+        matrices = [path for path in find_matrices(args.input) if is_mm_format(path)]
+        if not matrices:
+            parser.error("no MatrixMarket files found")
+
+        # Skip the cells finished by an earlier run
+        done = load_checkpoint(args.checkpoint)
+        cells = sweep_cells(args.backends, args.formats, args.modes, args.spmm_k)
+        tasks = []
+        for matrix_path in matrices:
+            # Cells that failed before are tried again
+            remaining = [cell for cell in cells
+                         if 'result' not in done.get(cell_key(matrix_path, *cell), {})
+                         and 'refused' not in done.get(cell_key(matrix_path, *cell), {})]
+            if remaining:
+                tasks.append((matrix_path, remaining))
+        total = sum(len(remaining) for _, remaining in tasks)
+        print(f"{len(matrices)} matrices, {len(matrices) * len(cells)} cells, {total} remaining")
+
+        settings = {
+            'reps': args.benchmark, 'scalar': args.scalar, 'seed': args.seed, 'checkpoint': args.checkpoint,
+            'cache_dir': args.cache_dir, 'no_cache': args.no_cache, 'memory': args.memory, 'verify': args.verify,
+            'blocksize': args.blocksize, 'dia_max_padding': args.dia_max_padding,
+            'dia_max_memory': None if args.dia_max_memory is None else args.dia_max_memory * 1024 ** 2,
+            'reorder': args.reorder, 'sell': (args.sell_c, args.sell_sigma),
+            'timing': {'warmup': args.warmup, 'min_time': args.min_time / 1000, 'force': True, 'budget': args.budget,
+                       'target_ci': None if args.target_ci is None else args.target_ci / 100}
+        }
+
+        # Measure the memory bandwidth of the host once (it is cached per host), before the workers start
+        bandwidth = host_bandwidth(not args.no_cache, args.cache_dir)
+
+        if args.isolation == "serial":
+            init_worker(settings, None)
+            for task in tasks:
+                matrix_path, finished = run_matrix(task)
+                print(f"finished {finished} cells of {matrix_path}")
+        else:
+            cores = physical_cores()
+            jobs = args.jobs if args.jobs is not None else len(cores)
+            core_queue = None
+            if args.isolation == "core":
+                jobs = min(jobs, len(cores))
+                core_queue = multiprocessing.Queue()
+                for core in cores[:jobs]:
+                    core_queue.put(core)
+            # Every worker gets whole matrices, so every matrix is loaded only once
+            with multiprocessing.Pool(jobs, initializer=init_worker, initargs=(settings, core_queue)) as pool:
+                for matrix_path, finished in pool.imap_unordered(run_matrix, tasks):
+                    print(f"finished {finished} cells of {matrix_path}")
+
+        # Write results of all finished cells, including those of earlier runs
+        done = load_checkpoint(args.checkpoint)
+        errors = [entry for entry in done.values() if 'error' in entry]
+        for entry in errors:
+            print(f"error in {entry['key']}: {entry['error']}")
+        refused = {(entry['matrix'], entry['format']): entry['refused'] for entry in done.values() if 'refused' in entry}
+        for (matrix_path, fmt), reason in refused.items():
+            print(f"skipped format '{fmt}' for {matrix_path}: {reason}")
+        num_files = write_results(done, args.output, not args.no_cache, args.cache_dir, args.store, bandwidth)
+        print(f"wrote {num_files} result files to {args.output}")
+    except Exception as e:
+        print(e)
+        exit(1)
+else:
+    # Only the worker processes of the pool may import this script
+    if multiprocessing.current_process().name == "MainProcess":
+        raise ImportError("This script cannot be imported as a module")
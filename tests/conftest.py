@@ -0,0 +1,5 @@
+# The modules of the project are scripts in the root folder, so the tests import them from there
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
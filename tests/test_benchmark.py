@@ -0,0 +1,25 @@
+# Tests of the timing helpers: only lazy PyTorch results may be forced inside the timed region
+import numpy as np
+import torch
+from scipy.sparse import random as sparse_random
+
+from benchmark import materialize
+
+
+def test_eager_results_untouched():
+    matrix = sparse_random(20, 20, density=0.2, random_state=0, format='csr')
+    vector = np.ones(20)
+    assert materialize(matrix) is matrix
+    assert materialize(vector) is vector
+    assert materialize(None) is None
+
+
+def test_lazy_torch_results_forced():
+    indices = torch.tensor([[0, 1, 0], [1, 0, 1]])
+    uncoalesced = torch.sparse_coo_tensor(indices, torch.tensor([1.0, 2.0, 3.0]), (2, 2))
+    assert not uncoalesced.is_coalesced()
+    assert materialize(uncoalesced).tolist() == [4.0, 2.0]
+    view = torch.arange(6.0).reshape(2, 3).t()
+    assert materialize(view).is_contiguous()
+    csr = torch.eye(3).to_sparse_csr()
+    assert materialize(csr).tolist() == [1.0, 1.0, 1.0]
@@ -0,0 +1,52 @@
+# Tests of the binary matrix cache, whose index is updated concurrently by the worker processes of sweep.py
+import os
+import multiprocessing
+
+import numpy as np
+
+import cache
+
+
+# Hashes the files in a worker process, returning the hashes or the error
+def hash_files(args):
+    paths, cache_dir = args
+    try:
+        return [cache.cache_key(path, cache_dir) for path in paths]
+    except Exception as e:
+        return repr(e)
+
+
+def test_entry_round_trip(tmp_path):
+    path = tmp_path / "matrix.mtx"
+    path.write_text("%%MatrixMarket matrix coordinate real general\n2 2 1\n1 2 3.0\n")
+    cache_dir = str(tmp_path / "cache")
+    assert cache.load_entry(str(path), cache_dir) is None
+    cache.store_entry(str(path), np.array([0]), np.array([1]), np.array([3.0]), (2, 2), cache_dir)
+    row, col, data, shape = cache.load_entry(str(path), cache_dir)
+    assert (row.tolist(), col.tolist(), data.tolist(), shape) == ([0], [1], [3.0], (2, 2))
+
+
+# Workers writing the index at the same time must not fail, and must not leave temporary files behind
+def test_concurrent_index_writes(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    paths = []
+    for i in range(200):
+        path = tmp_path / f"matrix{i}.mtx"
+        path.write_text(f"matrix {i}\n")
+        paths.append(str(path))
+
+    with multiprocessing.Pool(4) as pool:
+        hashes = pool.map(hash_files, [(paths[i::4], cache_dir) for i in range(4)])
+    for i, worker_hashes in enumerate(hashes):
+        assert worker_hashes == [cache.file_digest(path) for path in paths[i::4]]
+    assert isinstance(cache.load_index(cache_dir), dict)
+    assert [name for name in os.listdir(cache_dir) if name.endswith(".tmp")] == []
+
+
+# A failure to write the index only costs hashing the file again
+def test_index_write_failure(tmp_path):
+    path = tmp_path / "matrix.mtx"
+    path.write_text("matrix\n")
+    blocked = tmp_path / "blocked"
+    blocked.write_text("not a directory")
+    assert cache.cache_key(str(path), str(blocked)) == cache.file_digest(str(path))
@@ -0,0 +1,65 @@
+# Tests of the ELLPACK formats, whose products and conversions must match SciPy's CSR for every layout
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, random as sparse_random
+
+from ellpack import to_ellpack
+
+# SELL-C-σ layouts: chunks of a single row, chunks not dividing the rows, and a window not dividing the rows
+LAYOUTS = [("ell", None, None), ("sell", 1, 1), ("sell", 8, 256), ("sell", 7, 20), ("sell", 64, 64)]
+
+
+# Generates a random matrix with rows of very different lengths, including empty rows
+def random_matrix(num_rows=50, num_cols=40, seed=0):
+    matrix = sparse_random(num_rows, num_cols, density=0.1, random_state=seed, format='lil')
+    matrix[3, :] = 1.0
+    matrix[10, :] = 0.0
+    return csr_matrix(matrix)
+
+
+def layout_matrix(matrix, fmt, chunk_height, sigma):
+    return to_ellpack(matrix, fmt) if fmt == "ell" else to_ellpack(matrix, fmt, chunk_height, sigma)
+
+
+@pytest.mark.parametrize("fmt, chunk_height, sigma", LAYOUTS)
+def test_products(fmt, chunk_height, sigma):
+    matrix = random_matrix()
+    ellpack = layout_matrix(matrix, fmt, chunk_height, sigma)
+    rng = np.random.default_rng(0)
+    vec, block, vec_t = rng.random(40), rng.random((40, 5)), rng.random(50)
+    np.testing.assert_allclose(ellpack @ vec, matrix @ vec)
+    np.testing.assert_allclose(ellpack @ block, matrix @ block)
+    np.testing.assert_allclose(vec_t @ ellpack, vec_t @ matrix)
+    np.testing.assert_allclose((ellpack * 3).tocsr().toarray(), (matrix * 3).toarray())
+
+
+@pytest.mark.parametrize("fmt, chunk_height, sigma", LAYOUTS)
+def test_conversion(fmt, chunk_height, sigma):
+    matrix = random_matrix()
+    ellpack = layout_matrix(matrix, fmt, chunk_height, sigma)
+    assert ellpack.nnz == matrix.nnz
+    assert abs(ellpack.tocsr() - matrix).max() == 0
+    assert ellpack.stats()['stored'] >= matrix.nnz
+
+
+# ELL pads every row to the longest row, SELL-C-σ only to the longest row of its chunk
+def test_padding():
+    matrix = random_matrix()
+    ell, sell = to_ellpack(matrix, "ell"), to_ellpack(matrix, "sell", 8, 256)
+    assert ell.stored == matrix.shape[0] * np.diff(matrix.indptr).max()
+    assert sell.stored < ell.stored
+
+
+def test_types():
+    matrix = random_matrix()
+    ellpack = to_ellpack(matrix, "sell").with_data(lambda data: data.astype(np.float32)).with_index_dtype(np.int16)
+    assert ellpack.dtype == np.float32
+    assert all(indices.dtype == np.int16 for _, indices, _ in ellpack.groups)
+    np.testing.assert_allclose(ellpack @ np.ones(40), matrix @ np.ones(40), rtol=1e-6)
+
+
+def test_empty_matrix():
+    matrix = csr_matrix((5, 4))
+    ellpack = to_ellpack(matrix, "sell")
+    assert ellpack.nnz == 0 and ellpack.tocsr().nnz == 0
+    assert (ellpack @ np.ones(4) == 0).all()
@@ -0,0 +1,96 @@
+# Tests of the operations that call SciPy's compiled kernels directly, which must give the same results as SciPy's
+# operators on every format, type and partition
+import numpy as np
+import pytest
+from scipy.sparse import random as sparse_random
+
+
+from functions import mtx_parallel_multiplication, mtx_partition, mtx_matrix_vector_multiplication_inplace, \
+    mtx_dense_matrix_multiplication_inplace, mtx_transposition_inplace, transpose_buffer, \
+    mtx_scalar_multiplication_alternating
+from loader import scipy_to_torch
+
+
+# Generates a random matrix in the format, with rows and columns divisible by the BSR block size
+def random_matrix(fmt, dtype=np.float64, shape=(48, 36), density=0.2, seed=0):
+    matrix = sparse_random(*shape, density=density, random_state=seed, format='csr') * 10
+    matrix = matrix.astype(dtype)
+    return matrix.tobsr(blocksize=(4, 3)) if fmt == "bsr" else matrix.asformat(fmt)
+
+
+@pytest.mark.parametrize("fmt", ["csr", "bsr"])
+@pytest.mark.parametrize("threads", [1, 3, 8])
+@pytest.mark.parametrize("k", [None, 1, 5])
+def test_parallel_multiplication(fmt, threads, k):
+    matrix = random_matrix(fmt)
+    rng = np.random.default_rng(0)
+    other = rng.random(matrix.shape[1]) if k is None else rng.random((matrix.shape[1], k))
+    partition = mtx_partition(matrix, threads)
+    # The output is allocated without zeroing, so every call must overwrite all of it
+    for _ in range(2):
+        np.testing.assert_allclose(mtx_parallel_multiplication(partition, other), matrix @ other)
+
+
+# Integer matrices and float32 operands are multiplied in the type SciPy's operators return
+@pytest.mark.parametrize("dtype, other_dtype", [(np.int64, np.float64), (np.float64, np.float32),
+                                                (np.float32, np.float32)])
+def test_parallel_multiplication_types(dtype, other_dtype):
+    matrix = random_matrix("csr", dtype)
+    other = np.random.default_rng(0).random((matrix.shape[1], 4)).astype(other_dtype)
+    result = mtx_parallel_multiplication(mtx_partition(matrix, 2), other)
+    expected = matrix @ other
+    assert result.dtype == expected.dtype
+    np.testing.assert_allclose(result, expected, rtol=1e-6)
+
+
+@pytest.mark.parametrize("fmt", ["coo", "csr", "csc", "dia", "bsr"])
+def test_vector_multiplication_inplace(fmt):
+    matrix = random_matrix(fmt)
+    vec = np.random.default_rng(0).random(matrix.shape[1])
+    out = np.full(matrix.shape[0], np.nan)
+    np.testing.assert_allclose(mtx_matrix_vector_multiplication_inplace(matrix, vec, out), matrix @ vec)
+
+
+@pytest.mark.parametrize("fmt", ["csr", "csc", "bsr"])
+def test_dense_multiplication_inplace(fmt):
+    matrix = random_matrix(fmt)
+    block = np.random.default_rng(0).random((matrix.shape[1], 6))
+    out = np.full((matrix.shape[0], 6), np.nan)
+    np.testing.assert_allclose(mtx_dense_matrix_multiplication_inplace(matrix, block, out), matrix @ block)
+
+
+@pytest.mark.parametrize("fmt", ["coo", "csr", "csc", "bsr"])
+def test_transposition_inplace(fmt):
+    matrix = random_matrix(fmt)
+    out = mtx_transposition_inplace(matrix, transpose_buffer(matrix))
+    assert out.format == fmt and out.shape == matrix.shape[::-1]
+    assert abs(out - matrix.T).max() == 0
+
+
+# The in-place sm of the benchmark is called thousands of times on the same copy, which must not compound the scaling
+# towards overflow or denormals: the first call scales, and after every pair of calls the values are back where they were
+@pytest.mark.parametrize("fmt", ["coo", "csr", "csc", "dia", "bsr"])
+@pytest.mark.parametrize("scalar", [3, 0.5, -7])
+def test_scalar_multiplication_alternating(fmt, scalar):
+    matrix = random_matrix(fmt)
+    original = matrix.toarray()
+    state = {'undo': False}
+    np.testing.assert_allclose(mtx_scalar_multiplication_alternating(state, scalar, matrix).toarray(),
+                               scalar * original)
+    for _ in range(2001):
+        mtx_scalar_multiplication_alternating(state, scalar, matrix)
+    assert np.isfinite(matrix.data).all()
+    np.testing.assert_allclose(matrix.toarray(), original, rtol=1e-12)
+
+
+@pytest.mark.parametrize("backend", ["int64", "torch_coo", "torch_csr"])
+def test_scalar_multiplication_alternating_types(backend):
+    matrix = random_matrix("csr", np.int64) if backend == "int64" else random_matrix("csr")
+    original = matrix.toarray()
+    if backend != "int64":
+        matrix = scipy_to_torch(matrix.asformat(backend[6:]), backend[6:])
+    state = {'undo': False}
+    for _ in range(2000):
+        matrix = mtx_scalar_multiplication_alternating(state, 3, matrix)
+    dense = matrix.toarray() if backend == "int64" else matrix.to_dense().numpy()
+    np.testing.assert_allclose(dense, original, rtol=1e-12)
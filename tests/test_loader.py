@@ -0,0 +1,89 @@
+# Tests of the streaming MatrixMarket parser, which must read every file exactly like scipy.io.mmread
+import numpy as np
+import pytest
+from scipy.io import mmread, mmwrite
+from scipy.sparse import random as sparse_random
+
+from loader import read_mm_header, read_mm_streaming, stream_mm_coo, stream_mm_csr, mm_index_dtype
+
+# Symmetries and the fields they can be written with (skew-symmetric patterns and real hermitian matrices don't exist)
+CASES = [(symmetry, field) for symmetry in ["general", "symmetric", "skew-symmetric", "hermitian"]
+         for field in ["real", "integer", "complex", "pattern"]
+         if not (symmetry == "skew-symmetric" and field == "pattern") and not (symmetry == "hermitian"
+                                                                                and field != "complex")]
+
+
+# Writes a random matrix with the symmetry and field to a MatrixMarket file
+def write_matrix(path, symmetry, field, size=40, density=0.2, seed=0):
+    rng = np.random.default_rng(seed)
+    matrix = sparse_random(size, size, density=density, random_state=seed, format='coo')
+    matrix.data = np.round(matrix.data * 100) + 1
+    if field == "complex":
+        matrix = matrix + 1j * matrix.T
+    if symmetry == "symmetric":
+        matrix = matrix + matrix.T
+    elif symmetry == "skew-symmetric":
+        matrix = matrix - matrix.T
+    elif symmetry == "hermitian":
+        matrix = matrix + matrix.conj().T
+        matrix.setdiag(rng.integers(1, 10, size))
+    mmwrite(path, matrix.tocoo(), field=field, symmetry=symmetry)
+    return path
+
+
+# Checks that the matrix has the same shape and entries as the matrix read by SciPy
+def assert_same(matrix, path):
+    expected = mmread(path).tocsr()
+    assert matrix.shape == expected.shape
+    assert abs(matrix.tocsr() - expected).max() == 0
+    assert matrix.tocsr().nnz == expected.nnz
+
+
+@pytest.mark.parametrize("symmetry, field", CASES)
+def test_streaming_matches_mmread(tmp_path, symmetry, field):
+    path = write_matrix(str(tmp_path / "matrix.mtx"), symmetry, field)
+    header = read_mm_header(path)
+    assert (header['symmetry'], header['field']) == (symmetry, field)
+    assert_same(read_mm_streaming(path, "coo"), path)
+    assert_same(read_mm_streaming(path, "csr"), path)
+
+
+@pytest.mark.parametrize("symmetry, field", [("general", "real"), ("symmetric", "pattern")])
+def test_parallel_matches_mmread(tmp_path, symmetry, field):
+    path = write_matrix(str(tmp_path / "matrix.mtx"), symmetry, field)
+    assert_same(read_mm_streaming(path, "coo", workers=3), path)
+
+
+# Chunks of a few bytes split almost every line, and the remainder of every chunk must be carried to the next one
+@pytest.mark.parametrize("chunk_size", [1, 7, 64])
+def test_chunk_boundaries(tmp_path, chunk_size):
+    path = write_matrix(str(tmp_path / "matrix.mtx"), "symmetric", "real")
+    header = read_mm_header(path)
+    assert_same(stream_mm_coo(path, header, chunk_size), path)
+    assert_same(stream_mm_csr(path, header, chunk_size), path)
+
+
+# Files with CRLF line endings, comments, blank lines and no newline after the last entry
+def test_crlf_and_blank_lines(tmp_path):
+    lines = ["%%MatrixMarket matrix coordinate real general", "% a comment", "", "3 4 4", "1 1 1.5", "",
+             "2 3 -2", "3 4 2.5e1", "", "1 4 3"]
+    path = tmp_path / "matrix.mtx"
+    path.write_bytes("\r\n".join(lines).encode())
+    header = read_mm_header(str(path))
+    assert (header['rows'], header['cols'], header['nnz']) == (3, 4, 4)
+    for chunk_size in [5, 1024]:
+        matrix = stream_mm_coo(str(path), header, chunk_size)
+        assert_same(matrix, str(path))
+        assert stream_mm_csr(str(path), header, chunk_size).toarray().tolist() == matrix.toarray().tolist()
+
+
+def test_index_dtype():
+    assert mm_index_dtype({'rows': 10, 'cols': 10, 'nnz': 100}) == np.int32
+    assert mm_index_dtype({'rows': 2 ** 31, 'cols': 10, 'nnz': 100}) == np.int64
+
+
+def test_rejects_array_format(tmp_path):
+    path = tmp_path / "matrix.mtx"
+    path.write_text("%%MatrixMarket matrix array real general\n2 2\n1\n2\n3\n4\n")
+    with pytest.raises(ValueError):
+        read_mm_header(str(path))
@@ -0,0 +1,69 @@
+# Tests of the symbolic/numeric split, whose numeric phase must give the results of SciPy's operators for every new set
+# of values on the planned patterns
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix, random as sparse_random
+
+import plans
+from plans import mtx_plan, mtx_plan_execute, PLAN_FORMATS, PLAN_MODES
+
+OPERATORS = {'add': lambda a, b: a + b, 'sub': lambda a, b: a - b, 'mmm': lambda a, b: a @ b}
+
+
+# Generates a random matrix in the format
+def random_matrix(fmt, dtype=np.float64, size=30, density=0.15, seed=0):
+    matrix = sparse_random(size, size, density=density, random_state=seed, format='csr') * 10
+    return matrix.astype(dtype).asformat(fmt)
+
+
+# Gives the matrix new random values, keeping its pattern
+def new_values(matrix, seed):
+    matrix = matrix.copy()
+    matrix.data = np.random.default_rng(seed).random(matrix.data.size).astype(matrix.dtype)
+    return matrix
+
+
+def assert_same(result, expected):
+    assert result.shape == expected.shape
+    np.testing.assert_allclose(result.toarray(), expected.toarray(), rtol=1e-12)
+
+
+@pytest.mark.parametrize("fmt", PLAN_FORMATS)
+@pytest.mark.parametrize("mode", PLAN_MODES)
+def test_numeric_phase(fmt, mode):
+    mtx_a, mtx_b = random_matrix(fmt, seed=1), random_matrix(fmt, seed=2)
+    plan = mtx_plan(mode, mtx_a, mtx_b)
+    for seed in range(3):
+        mtx_a, mtx_b = new_values(mtx_a, 2 * seed), new_values(mtx_b, 2 * seed + 1)
+        assert_same(mtx_plan_execute(plan, mtx_a, mtx_b), OPERATORS[mode](mtx_a, mtx_b))
+
+
+# Products are calculated in chunks of PLAN_CHUNK, which must not split the sums of the output entries
+@pytest.mark.parametrize("chunk", [1, 7, 100])
+def test_multiplication_chunks(monkeypatch, chunk):
+    monkeypatch.setattr(plans, "PLAN_CHUNK", chunk)
+    mtx_a, mtx_b = random_matrix("csr", seed=1), random_matrix("csr", seed=2)
+    assert_same(mtx_plan_execute(mtx_plan("mmm", mtx_a, mtx_b), mtx_a, mtx_b), mtx_a @ mtx_b)
+
+
+@pytest.mark.parametrize("dtype", [np.float32, np.int64, np.complex128])
+@pytest.mark.parametrize("mode", PLAN_MODES)
+def test_value_types(dtype, mode):
+    mtx_a, mtx_b = random_matrix("csr", dtype, seed=1), random_matrix("csr", dtype, seed=2)
+    result = mtx_plan_execute(mtx_plan(mode, mtx_a, mtx_b), mtx_a, mtx_b)
+    expected = OPERATORS[mode](mtx_a, mtx_b)
+    assert result.dtype == expected.dtype
+    np.testing.assert_allclose(result.toarray(), expected.toarray(), rtol=1e-6)
+
+
+# Duplicate and unsorted entries are accumulated by the numeric phase, and the operands are not modified by the plan
+@pytest.mark.parametrize("mode", PLAN_MODES)
+def test_non_canonical_operands(mode):
+    indptr, indices = np.array([0, 3, 4, 6]), np.array([2, 0, 2, 1, 1, 0])
+    mtx_a = csr_matrix((np.arange(1.0, 7.0), indices, indptr), shape=(3, 3))
+    mtx_b = csr_matrix((np.arange(2.0, 8.0), indices.copy(), indptr.copy()), shape=(3, 3))
+    assert not mtx_a.has_canonical_format
+    plan = mtx_plan(mode, mtx_a, mtx_b)
+    assert mtx_a.nnz == 6 and mtx_a.indices.tolist() == indices.tolist()
+    np.testing.assert_allclose(mtx_plan_execute(plan, mtx_a, mtx_b).toarray(),
+                               OPERATORS[mode](mtx_a.toarray(), mtx_b.toarray()))
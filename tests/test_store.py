@@ -0,0 +1,43 @@
+# Tests of the results store, which must give back the results of main.py exactly as they were appended
+import numpy as np
+
+from store import append_results, list_runs, load_results, load_run, to_json, variant_label
+
+
+# Builds results in the JSON layout of main.py
+def results_json(matrix="/data/a.mtx", backend="scipy", offset=0.0):
+    return {'matrix': matrix, 'backend': backend, 'bandwidth': {'peak': 1e10}, 'data': [
+        {'format': "csr", 'tuning': {'blocksize': None}, 'results': [
+            {'mode': "mvm", 'time': [offset + 0.1, offset + 0.2, offset + 0.3], 'loops': [1, 1, 1], 'flops': 10},
+            {'mode': "spmm", 'k': 8, 'time': [offset + 1.0], 'loops': [4], 'flops': 80}]},
+        {'format': "coo", 'results': [{'mode': "mvm", 'time': [offset + 0.5], 'loops': [1], 'flops': 10}]}]}
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    results = results_json()
+    run_id = append_results(results, "hash-a", path)
+    loaded = load_results(path)
+    assert loaded['run_id'] == run_id
+    assert to_json(loaded) == dict(results, run_id=run_id)
+    assert isinstance(loaded['data'][0]['results'][0]['time'], np.ndarray)
+
+
+# A run on several matrices is a single run id; the latest run and prefixes of run ids select runs
+def test_runs(tmp_path):
+    path = str(tmp_path / "results.sqlite")
+    first = append_results(results_json(), "hash-a", path)
+    second = append_results(results_json("/data/b.mtx", offset=1.0), "hash-b", path)
+    append_results(results_json("/data/c.mtx", offset=2.0), "hash-c", path, second)
+    assert [run['run_id'] for run in list_runs(path)] == [first, second, second]
+    assert [results['matrix'] for results in load_run(path)] == ["/data/b.mtx", "/data/c.mtx"]
+    assert load_results(path, first)['matrix'] == "/data/a.mtx"
+    assert load_results(path, matrix="b.mtx")['data'][1]['results'][0]['time'].tolist() == [1.5]
+    assert load_results(path, backend="pytorch") is None
+
+
+def test_variant_label():
+    res = {'mode': "spmm", 'k': 8, 'threads': 2, 'inplace': True}
+    assert variant_label("CSR", res) == "CSR (k=8) (2 threads) (in-place)"
+    assert variant_label("mvm", {'source': "coo", 'reuse_pattern': True, 'threads': 4}, threads=False) == \
+        "mvm (from COO) (reused pattern)"
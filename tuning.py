@@ -0,0 +1,170 @@
+# Script responsible for tuning the layout of formats with a structural parameter before a matrix is converted
+# For BSR, the block fill and memory of candidate block sizes are estimated from a sample of the matrix, after which the
+# SpMV of the most compact candidates is benchmarked to choose the block size. For DIA, the size of the layout is
+# calculated before the conversion, so matrices with many sparsely filled diagonals can be refused before they run out
+# of memory
+import os
+import argparse
+import numpy as np
+import statistics as st
+
+from functions import mtx_matrix_vector_multiplication
+from loader import convert_matrix
+from benchmark import benchmark
+
+BLOCK_DIMENSIONS = [2, 3, 4, 6, 8, 16]  # Candidate block heights and widths, combined into (rectangular) block sizes
+BLOCK_MIN_FILL = 0.5  # Candidate block sizes must store at most as many padding values as non-zero entries
+SAMPLE_BAND = 48  # Height of the row bands sampled by the estimator; a multiple of every block height
+SAMPLE_ENTRIES = 200000  # Approximate number of entries in the sample
+TUNING_CANDIDATES = 3  # Number of most compact block sizes whose SpMV is benchmarked
+TUNING_REPS = 5
+TUNING_MIN_TIME = 0.005  # Minimum duration of a single sample (in seconds) of the SpMV benchmark
+DIA_MEMORY_FRACTION = 0.5  # By default, DIA is refused if its layout takes more than this fraction of the available memory
+
+
+# Parses the BSR block size option of the scripts: 'auto', 'scipy' or a block size like '4x4'
+def blocksize_type(value):
+    if value in ["auto", "scipy"]:
+        return value
+    try:
+        blocksize = tuple(int(x) for x in value.lower().split("x"))
+    except ValueError:
+        blocksize = ()
+    if len(blocksize) != 2 or min(blocksize) < 1:
+        raise argparse.ArgumentTypeError(f"invalid block size '{value}', expected 'auto', 'scipy' or RxC")
+    return blocksize
+
+
+# Returns the number of bytes of the index type SciPy uses for a matrix with these dimensions and entries
+def index_itemsize(*sizes):
+    return 4 if max(sizes) < 2 ** 31 else 8
+
+
+# Estimates, for every block size dividing the shape of the matrix, the number of blocks, the fraction of the stored
+# values that are non-zero entries (fill) and the memory of the BSR layout. The blocks are counted in a sample of row
+# bands, which is scaled up to the whole matrix. Returns the candidates sorted from most to least compact
+def estimate_block_sizes(matrix, dimensions=BLOCK_DIMENSIONS, sample_entries=SAMPLE_ENTRIES, seed=0):
+    coo = matrix.tocoo()
+    num_rows, num_cols = coo.shape
+    nnz = coo.nnz
+    row = coo.row.astype(np.int64)
+    col = coo.col.astype(np.int64)
+
+    # Sample whole bands of rows, so every sampled block row is complete for every candidate block height
+    num_bands = -(-num_rows // SAMPLE_BAND)
+    fraction = min(1.0, sample_entries / nnz) if nnz else 1.0
+    if fraction < 1.0:
+        rng = np.random.default_rng(seed)
+        sampled = rng.random(num_bands) < fraction
+        sampled[rng.integers(num_bands)] = True  # At least one band is sampled
+        mask = sampled[row // SAMPLE_BAND]
+        row, col = row[mask], col[mask]
+        scale = num_bands / np.count_nonzero(sampled)
+    else:
+        scale = 1.0
+
+    value_size = coo.dtype.itemsize
+    candidates = []
+    for height in dimensions:
+        if num_rows % height != 0:
+            continue
+        for width in dimensions:
+            if num_cols % width != 0:
+                continue
+            block_cols = num_cols // width
+            blocks = np.unique((row // height) * block_cols + col // width).size * scale
+            index_size = index_itemsize(num_rows, num_cols, blocks)
+            candidates.append({
+                'blocksize': (height, width),
+                'blocks': int(round(blocks)),
+                'fill': float(row.size * scale / (blocks * height * width)) if blocks else 0.0,
+                'bytes': int(round(blocks * (height * width * value_size + index_size)
+                                   + (num_rows // height + 1) * index_size)),
+                'exact': fraction == 1.0
+            })
+
+    candidates.sort(key=lambda c: (c['bytes'], -c['blocksize'][0] * c['blocksize'][1]))
+    return candidates
+
+
+# Chooses the BSR block size of the matrix: the SpMV of the most compact candidate block sizes that are filled well
+# enough is benchmarked, and the fastest one is chosen. Candidates the backend can't multiply with (PyTorch only supports
+# square blocks) are skipped. If no candidate is left, the block size is None, so SciPy's detection is used. Returns the
+# chosen block size, along with the candidates (the benchmarked ones with their median SpMV time)
+def tune_bsr(matrix, pytorch=False, top=TUNING_CANDIDATES, reps=TUNING_REPS, seed=0, min_fill=BLOCK_MIN_FILL):
+    candidates = [c for c in estimate_block_sizes(matrix, seed=seed) if c['fill'] >= min_fill]
+    vector = np.random.default_rng(seed).random(matrix.shape[1])
+    if pytorch:
+        import torch
+        vector = torch.from_numpy(vector)
+
+    benchmarked = []
+    for candidate in candidates:
+        if len(benchmarked) == top:
+            break
+        bsr = convert_matrix(matrix, "bsr", pytorch, candidate['blocksize'])
+        try:
+            times = benchmark(mtx_matrix_vector_multiplication, bsr, vector, reps=reps, warmup=1,
+                              min_time=TUNING_MIN_TIME, force=True)
+        except RuntimeError as e:
+            candidate['error'] = str(e)
+            continue
+        finally:
+            del bsr
+        candidate['spmv_time'] = st.median(times)
+        benchmarked.append(candidate)
+
+    tried = [c for c in candidates if 'spmv_time' in c or 'error' in c]
+    if not benchmarked:
+        return {'blocksize': None, 'candidates': tried}
+    best = min(benchmarked, key=lambda c: c['spmv_time'])
+    return {'blocksize': best['blocksize'], 'candidates': tried}
+
+
+# Returns the memory available to new processes in bytes (MemAvailable on Linux, free physical memory elsewhere), or
+# None if it can't be determined
+def available_memory():
+    try:
+        with open("/proc/meminfo", "r") as read_file:
+            for line in read_file:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (ValueError, OSError, AttributeError):
+        return None
+
+
+# Calculates the number of values the DIA layout of the matrix stores, and decides whether the conversion to DIA is
+# feasible: DIA is refused if its layout would take more than max_bytes (by default DIA_MEMORY_FRACTION of the available
+# memory), or, with max_padding, if it stores more than max_padding values per non-zero entry. The number of occupied
+# diagonals is counted exactly with a single pass over the entries. Returns a dictionary with the estimate, and the
+# reason if DIA is refused
+def check_dia(matrix, max_padding=None, max_bytes=None):
+    coo = matrix.tocoo()
+    num_rows, num_cols = coo.shape
+    nnz = coo.nnz
+    occupied = np.bincount(coo.col.astype(np.int64) - coo.row + num_rows - 1, minlength=num_rows + num_cols - 1)
+    num_diagonals = int(np.count_nonzero(occupied))
+
+    # SciPy stores every diagonal as a row of the width of the matrix
+    stored_values = num_diagonals * num_cols
+    estimate = {'diagonals': num_diagonals, 'stored_values': stored_values,
+                'fill': nnz / stored_values if stored_values else 0.0,
+                'bytes': stored_values * coo.dtype.itemsize + num_diagonals * index_itemsize(num_rows, num_cols),
+                'feasible': True}
+    description = (f"DIA would store {num_diagonals} diagonals of {num_cols} values ({stored_values} values, "
+                   f"{estimate['bytes'] / 1024 ** 2:.1f} MB) for {nnz} non-zero entries")
+    if max_bytes is None:
+        available = available_memory()
+        max_bytes = None if available is None else DIA_MEMORY_FRACTION * available
+    if max_bytes is not None and estimate['bytes'] > max_bytes:
+        estimate['feasible'] = False
+        estimate['reason'] = f"{description}, more than the limit of {max_bytes / 1024 ** 2:.1f} MB"
+    elif max_padding is not None and max_padding > 0 and stored_values > max_padding * max(nnz, 1):
+        estimate['feasible'] = False
+        estimate['reason'] = (f"{description}, which is {stored_values / max(nnz, 1):.1f} values per entry "
+                              f"(maximum: {max_padding})")
+    return estimate